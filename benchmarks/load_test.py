@@ -0,0 +1,765 @@
+'''
+Load tests the bot without connecting to Discord. The real cogs (Speech, Phrases, AudioPlayer, Music, etc.) are driven
+with fake contexts, guilds, members, and voice clients. The fake voice clients consume audio in real time (one 20 ms
+frame at a time, like discord.py's AudioPlayer does), and the TTS engine is replaced by a stub renderer that takes a
+fixed amount of time and writes out a silent .wav file of a realistic length.
+
+Traffic is either a synthetic mix of commands spread across N guilds, or a replay of recorded commands in the
+DynamoItem format (one JSON object per line, or a JSON array, see dynamo_helper.py). Once the traffic has drained,
+the throughput, per-stage latency percentiles, asyncio task counts, late audio frames, and memory per guild are
+reported.
+
+Usage:
+    python load_test.py [--guilds N] [--rate R] [--duration S] [--mix say=4,phrase=4,music=1,tone=1]
+    python load_test.py --replay trace.jsonl [--speed X]
+'''
+
+import os
+import sys
+import json
+import time
+import wave
+import random
+import shutil
+import asyncio
+import inspect
+import logging
+import argparse
+import tempfile
+import resource
+import weakref
+import tracemalloc
+from collections import defaultdict
+
+## Expose the bot's code and modules folders, just like hawking.py and the ModuleManager do
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_PATH, "code"))
+sys.path.append(os.path.join(ROOT_PATH, "modules"))
+
+import music
+import hawking
+import utilities
+from music_parser_scaling import build_song
+
+
+## Config
+FRAME_SECONDS = 0.02
+FRAME_BYTES = 3840          # 20 ms of 48 kHz 16 bit stereo PCM, which is what discord.py reads per frame
+STUB_SAMPLE_RATE = 8000
+BOT_USER_ID = 2 ** 63 - 1   # kept well clear of any user ids in replayed traces
+LATE_FRAME_SECONDS = 0.005  # frames that go out later than this are counted as late (ie. audible stutter)
+SAMPLE_INTERVAL_SECONDS = 0.1
+DRAIN_TIMEOUT_SECONDS = 300
+STAGES = ["command", "render", "queue_wait", "playback", "end_to_end"]
+DEFAULT_MIX = "say=4,phrase=4,music=1,tone=1"
+## The commands that each kind of traffic invokes, anything else is taken to be a command name
+MIX_COMMAND_NAMES = {"say": "say", "music": "music", "tone": "music"}
+WORDS = [
+    "the", "quick", "brown", "fox", "jumps", "over", "lazy", "dog", "hello", "there", "general", "kenobi", "moon",
+    "pizza", "why", "is", "this", "so", "loud", "🤔", "😂", "🔥", "👍", "🎉", "<@1234>", "https://example.com"
+]
+
+## The Trace of the command that each task is running (see FakeAudio and LoadTest.stub_render). Python 3.6 doesn't
+## have contextvars, so they're looked up by task instead.
+task_traces = weakref.WeakKeyDictionary()
+
+
+def get_current_task():
+    ## asyncio.current_task() was added in Python 3.7, and Task.current_task() was removed in 3.9
+    if (hasattr(asyncio, "current_task")):
+        return asyncio.current_task()
+
+    return asyncio.Task.current_task()
+
+
+def get_current_trace():
+    task = get_current_task()
+    return task_traces.get(task) if task is not None else None
+
+
+class Trace:
+    '''The timings of a single command, from being invoked to its audio finishing'''
+
+    def __init__(self, guild_id, command_name):
+        self.guild_id = guild_id
+        self.command_name = command_name
+        self.times = {"start": time.perf_counter()}
+        self.late_frames = 0
+        self.error = None
+
+
+    def mark(self, name):
+        self.times[name] = time.perf_counter()
+
+
+    def get_stages(self):
+        '''Returns a dict of stage name -> seconds, for the stages that this command made it through'''
+
+        spans = {
+            "command": ("start", "queued"),
+            "render": ("render_start", "render_end"),
+            "queue_wait": ("queued", "play_start"),
+            "playback": ("play_start", "play_end"),
+            "end_to_end": ("start", "play_end")
+        }
+
+        return {
+            stage: self.times[end] - self.times[start]
+            for stage, (start, end) in spans.items() if start in self.times and end in self.times
+        }
+
+## Fakes
+
+class FakePermissions:
+    connect = True
+    speak = True
+
+
+class FakeUser:
+    def __init__(self, user_id, name, is_bot=False):
+        self.id = user_id
+        self.name = name
+        self.nick = None
+        self.discriminator = "{:04}".format(user_id % 10000)
+        self.bot = is_bot
+        self.voice = None
+
+    ## Properties
+
+    @property
+    def display_name(self):
+        return self.nick or self.name
+
+    ## Methods
+
+    def permissions_in(self, channel):
+        return FakePermissions()
+
+
+class FakeVoiceState:
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class FakeTextChannel:
+    def __init__(self, channel_id, name, guild):
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+        self.sent_count = 0
+
+
+    async def send(self, content=None, **kwargs):
+        self.sent_count += 1
+
+
+class FakeVoiceChannel:
+    def __init__(self, channel_id, name, guild, load_test):
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+        self.members = []
+        self.load_test = load_test
+
+
+    async def connect(self):
+        voice_client = FakeVoiceClient(self, self.load_test)
+        self.guild.voice_client = voice_client
+        return voice_client
+
+
+class FakeGuild:
+    def __init__(self, guild_id, name, bot_user, load_test):
+        self.id = guild_id
+        self.name = name
+        self.me = bot_user
+        self.voice_client = None
+        self.members = {}
+        self.text_channel = FakeTextChannel(guild_id * 10 + 1, "general", self)
+        self.voice_channel = FakeVoiceChannel(guild_id * 10 + 2, "voice", self, load_test)
+
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+
+    def add_member(self, member_id, name):
+        member = self.members.get(member_id)
+        if (member is None):
+            member = self.members[member_id] = FakeUser(member_id, name)
+            member.voice = FakeVoiceState(self.voice_channel)
+            self.voice_channel.members.append(member)
+
+        return member
+
+
+class FakeAudio:
+    '''Stands in for discord.FFmpegPCMAudio, and plays for as long as the .wav file it's given'''
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with wave.open(file_path, "rb") as wav_file:
+            seconds = wav_file.getnframes() / wav_file.getframerate()
+        self.remaining_frames = max(int(seconds / FRAME_SECONDS), 1)
+
+        ## Hook the audio up to the command that requested it
+        self.trace = get_current_trace()
+        if (self.trace is not None):
+            self.trace.mark("queued")
+
+
+    def read(self):
+        if (self.remaining_frames <= 0):
+            return b""
+
+        self.remaining_frames -= 1
+        return bytes(FRAME_BYTES)
+
+
+    def is_opus(self):
+        return False
+
+
+    def cleanup(self):
+        pass
+
+
+class FakeVoiceClient:
+    '''Consumes audio one frame at a time in real time, and keeps track of how many frames went out late'''
+
+    def __init__(self, channel, load_test):
+        self.channel = channel
+        self.load_test = load_test
+        self.source = None
+        self.play_task = None
+
+
+    def is_connected(self):
+        return True
+
+
+    def is_playing(self):
+        return (self.play_task is not None and not self.play_task.done())
+
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+
+    async def disconnect(self, force=False):
+        self.stop()
+        self.channel.guild.voice_client = None
+
+
+    def play(self, source, *, after=None):
+        self.source = source
+        self.play_task = asyncio.get_event_loop().create_task(self._play(source, after))
+
+
+    def stop(self):
+        if (self.is_playing()):
+            self.play_task.cancel()
+
+
+    async def _play(self, source, after):
+        trace = getattr(source, "trace", None)
+        if (trace is not None):
+            trace.mark("play_start")
+
+        next_frame_time = time.perf_counter()
+        try:
+            while (source.read()):
+                lateness = time.perf_counter() - next_frame_time
+                if (lateness > LATE_FRAME_SECONDS):
+                    self.load_test.late_frames += 1
+                    if (trace is not None):
+                        trace.late_frames += 1
+
+                next_frame_time += FRAME_SECONDS
+                await asyncio.sleep(max(next_frame_time - time.perf_counter(), 0))
+        finally:
+            if (trace is not None):
+                trace.mark("play_end")
+                self.load_test.finished_traces.append(trace)
+
+            ## discord.py calls after() once the audio is done (or stopped)
+            if (after is not None):
+                after(None)
+
+
+class FakeMessage:
+    def __init__(self, message_id, content, author, guild):
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.guild = guild
+        self.channel = guild.text_channel
+        self.created_at = FakeTimestamp(time.time())
+        self.mentions = []
+        self.channel_mentions = []
+        self.role_mentions = []
+
+
+class FakeTimestamp:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+
+    def timestamp(self):
+        return self.seconds
+
+
+class FakeContext:
+    def __init__(self, bot, message, prefix, invoked_with, command):
+        self.bot = bot
+        self.message = message
+        self.prefix = prefix
+        self.invoked_with = invoked_with
+        self.command = command
+        self.invoked_subcommand = None
+
+    ## Properties
+
+    @property
+    def guild(self):
+        return self.message.guild
+
+
+    @property
+    def author(self):
+        return self.message.author
+
+
+    @property
+    def channel(self):
+        return self.message.channel
+
+
+    @property
+    def voice_client(self):
+        return self.message.guild.voice_client
+
+    ## Methods
+
+    async def send(self, content=None, **kwargs):
+        return await self.message.channel.send(content, **kwargs)
+
+
+def build_hawking():
+    '''
+    Builds the bot with its usual modules, plus the Music cog. The bot itself only registers Music as a plain module
+    (see modules/music.py's main()), so \\music isn't available to users, but it still needs to be load tested.
+    '''
+
+    hawking_instance = hawking.Hawking()
+    hawking_instance.register_module(music.Music, True)
+
+    return hawking_instance
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+
+        self.hawking = build_hawking()
+        self.bot = self.hawking.bot
+        self.loop = self.bot.loop
+        self.prefix = self.hawking.activation_str
+
+        ## The bot never logs in, so give it a user of its own (the audio player checks for it in voice channels)
+        self.bot_user = FakeUser(BOT_USER_ID, "hawking", is_bot=True)
+        self.bot._connection.user = self.bot_user
+
+        self.output_dir_path = tempfile.mkdtemp(prefix="hawking_load_test_")
+        self._install_stubs()
+
+        self.guilds = {}
+        self.message_count = 0
+        self.command_tasks = []
+        self.traces = []
+        self.finished_traces = []
+        self.late_frames = 0
+        self.task_counts = []
+        self.loop_lags = []
+        self.command_counts = defaultdict(int)
+        self.error_counts = defaultdict(int)
+
+
+    def _install_stubs(self):
+        '''Swaps the TTS engine and FFmpeg out for stand-ins, so nothing needs to be installed (or connected to)'''
+
+        speech_cog = self.hawking.get_speech_cog()
+        speech_cog.tts_controller.output_dir_path = self.output_dir_path
+        speech_cog.tts_controller.save = self.stub_render
+
+        self.hawking.get_audio_player_cog().build_player = FakeAudio
+
+
+    async def stub_render(self, message, ignore_char_limit=False):
+        '''Takes as long as the TTS engine would, and writes out a silent .wav file as long as the speech would be'''
+
+        trace = get_current_trace()
+        if (trace is not None):
+            trace.mark("render_start")
+
+        await asyncio.sleep(self.args.render_ms / 1000)
+
+        seconds = min(len(message) * self.args.speech_ms_per_char / 1000, self.args.max_speech_seconds)
+        file_descriptor, file_path = tempfile.mkstemp(suffix=".wav", dir=self.output_dir_path)
+        with os.fdopen(file_descriptor, "wb") as file:
+            with wave.open(file, "wb") as wav_file:
+                wav_file.setnchannels(1)
+                wav_file.setsampwidth(1)
+                wav_file.setframerate(STUB_SAMPLE_RATE)
+                wav_file.writeframes(bytes([128]) * int(seconds * STUB_SAMPLE_RATE))
+
+        if (trace is not None):
+            trace.mark("render_end")
+
+        return file_path
+
+
+    def get_guild(self, guild_id, name=None):
+        guild = self.guilds.get(guild_id)
+        if (guild is None):
+            guild = self.guilds[guild_id] = FakeGuild(guild_id, name or "guild {}".format(guild_id), self.bot_user, self)
+
+        return guild
+
+    ## Dispatching
+
+    def build_context(self, guild, member, content):
+        '''Resolves the command in the content (like HawkingBot.get_context does), and returns (ctx, args)'''
+
+        if (not content.startswith(self.prefix)):
+            return (None, None)
+
+        name, _, rest = content[len(self.prefix):].partition(" ")
+        command = self.bot.get_command(name) or self.bot.resolve_command(name)
+        if (command is None):
+            return (None, None)
+
+        self.message_count += 1
+        message = FakeMessage(self.message_count, content, member, guild)
+        return (FakeContext(self.bot, message, self.prefix, name, command), rest.strip())
+
+
+    async def invoke(self, ctx, rest):
+        '''Calls the command's callback, passing the rest of the message on like discord.py's argument parsing would'''
+
+        command = ctx.command
+        parameters = list(inspect.signature(command.callback).parameters.values())
+        parameters = parameters[2:] if command.cog is not None else parameters[1:]
+        bound = [command.cog, ctx] if command.cog is not None else [ctx]
+
+        if (parameters and rest):
+            if (parameters[0].kind == inspect.Parameter.KEYWORD_ONLY):
+                return await command.callback(*bound, **{parameters[0].name: rest})
+            return await command.callback(*bound, rest)
+
+        return await command.callback(*bound)
+
+
+    async def run_command(self, guild, member, content):
+        ctx, rest = self.build_context(guild, member, content)
+        if (ctx is None):
+            self.error_counts["unknown command"] += 1
+            return
+
+        trace = Trace(guild.id, ctx.command.name)
+        task_traces[get_current_task()] = trace
+        self.traces.append(trace)
+        self.command_counts[ctx.command.name] += 1
+
+        try:
+            await self.invoke(ctx, rest)
+        except Exception as e:
+            trace.error = type(e).__name__
+            self.error_counts[trace.error] += 1
+
+
+    def spawn_command(self, guild, member, content):
+        ## Each command gets its own task (and context), just like discord.py dispatches them
+        self.command_tasks.append(self.loop.create_task(self.run_command(guild, member, content)))
+
+    ## Traffic
+
+    def build_message(self, kind):
+        if (kind == "say"):
+            return "{}say {}".format(self.prefix, " ".join(self.random.choices(WORDS, k=self.random.randint(5, 30))))
+        elif (kind == "phrase"):
+            return "{}{}".format(self.prefix, self.random.choice(self.hawking.get_phrases_cog().phrase_names))
+        elif (kind == "music" or kind == "tone"):
+            song = build_song(self.random.randint(16, 64), self.random.randrange(1 << 30))
+            tone = "\\tone=1 " if kind == "tone" else ""
+            return '{}music {}\\bpm=136 {}'.format(self.prefix, tone, song)
+
+        return "{}{}".format(self.prefix, kind)
+
+
+    def parse_mix(self):
+        '''Returns the mix of traffic as a list of (kind, weight) tuples'''
+
+        mix = []
+        for entry in self.args.mix.split(","):
+            kind, _, weight = entry.partition("=")
+            mix.append((kind.strip(), float(weight or 1)))
+
+        return mix
+
+
+    def get_unresolved_kinds(self, mix):
+        '''Returns the kinds of traffic in the mix that don't resolve to a command (ex. their cog didn't load)'''
+
+        unresolved = []
+        for kind, _ in mix:
+            if (kind == "phrase"):
+                phrases_cog = self.hawking.get_phrases_cog()
+                if (phrases_cog is None or not phrases_cog.phrase_names):
+                    unresolved.append(kind)
+                continue
+
+            name = MIX_COMMAND_NAMES.get(kind, kind)
+            if (self.bot.get_command(name) is None and self.bot.resolve_command(name) is None):
+                unresolved.append(kind)
+
+        return unresolved
+
+
+    async def run_guild_traffic(self, guild, mix, end_time):
+        kinds, weights = zip(*mix)
+        members = list(guild.members.values())
+
+        while (True):
+            delay = self.random.expovariate(self.args.rate)
+            if (time.perf_counter() + delay >= end_time):
+                ## Keep the traffic running for its full duration, so the throughput isn't overstated
+                await asyncio.sleep(max(end_time - time.perf_counter(), 0))
+                return
+
+            await asyncio.sleep(delay)
+
+            kind = self.random.choices(kinds, weights)[0]
+            self.spawn_command(guild, self.random.choice(members), self.build_message(kind))
+
+
+    async def run_synthetic(self):
+        mix = self.parse_mix()
+
+        for guild_index in range(self.args.guilds):
+            guild = self.get_guild(1000 + guild_index)
+            for member_index in range(self.args.members):
+                guild.add_member(guild.id * 1000 + member_index, "member {}".format(member_index))
+
+        end_time = time.perf_counter() + self.args.duration
+        await asyncio.gather(*[self.run_guild_traffic(guild, mix, end_time) for guild in self.guilds.values()])
+
+
+    def load_trace(self, path):
+        with open(path) as fd:
+            data = fd.read().strip()
+
+        if (data.startswith("[")):
+            items = json.loads(data)
+        else:
+            items = [json.loads(line) for line in data.splitlines() if line.strip()]
+
+        return sorted(items, key=lambda item: item["timestamp"])
+
+
+    async def run_replay(self):
+        items = self.load_trace(self.args.replay)
+        if (not items):
+            return
+
+        first_timestamp = items[0]["timestamp"]
+        start_time = time.perf_counter()
+        for item in items:
+            guild = self.get_guild(int(item["server_id"]), item.get("server_name"))
+            member = guild.add_member(int(item["user_id"]), item.get("user_name", str(item["user_id"])))
+
+            delay = (item["timestamp"] - first_timestamp) / 1000 / self.args.speed
+            await asyncio.sleep(max(start_time + delay - time.perf_counter(), 0))
+            self.spawn_command(guild, member, item["query"])
+
+    ## Measuring
+
+    async def sample(self):
+        '''Samples the number of running tasks, and how late the event loop is to wake up'''
+
+        while (True):
+            expected = time.perf_counter() + SAMPLE_INTERVAL_SECONDS
+            await asyncio.sleep(SAMPLE_INTERVAL_SECONDS)
+            self.loop_lags.append(max(time.perf_counter() - expected, 0))
+            self.task_counts.append(len(utilities.get_all_tasks(self.loop)))
+
+
+    async def drain(self):
+        '''Waits for every command to finish, and for every server's queued audio to be played'''
+
+        deadline = time.perf_counter() + DRAIN_TIMEOUT_SECONDS
+        await asyncio.gather(*self.command_tasks, return_exceptions=True)
+
+        audio_player_cog = self.hawking.get_audio_player_cog()
+        while (time.perf_counter() < deadline):
+            busy = any(
+                not state.audio_play_queue.empty() or state.is_playing() for state in audio_player_cog.server_states.values()
+            )
+            if (not busy):
+                return
+            await asyncio.sleep(SAMPLE_INTERVAL_SECONDS)
+
+
+    async def run(self):
+        sampler = self.loop.create_task(self.sample())
+        start_time = time.perf_counter()
+
+        if (self.args.replay):
+            await self.run_replay()
+        else:
+            await self.run_synthetic()
+        traffic_seconds = time.perf_counter() - start_time
+
+        await self.drain()
+        total_seconds = time.perf_counter() - start_time
+        sampler.cancel()
+
+        ## Stop the audio players, so that nothing's left running
+        for server_state in self.hawking.get_audio_player_cog().server_states.values():
+            server_state.stop()
+
+        return (traffic_seconds, total_seconds)
+
+## Reporting
+
+def percentile(values, percent):
+    if (not values):
+        return 0
+
+    values = sorted(values)
+    index = min(int(round(percent / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def build_report(load_test, traffic_seconds, total_seconds, memory_bytes):
+    traces = load_test.traces
+    stage_values = defaultdict(list)
+    for trace in traces:
+        for stage, seconds in trace.get_stages().items():
+            stage_values[stage].append(seconds)
+
+    guild_count = max(len(load_test.guilds), 1)
+    stages = {}
+    for stage in STAGES:
+        values = stage_values.get(stage, [])
+        stages[stage] = {
+            "count": len(values),
+            "p50_ms": percentile(values, 50) * 1000,
+            "p90_ms": percentile(values, 90) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": max(values, default=0) * 1000
+        }
+
+    return {
+        "guilds": len(load_test.guilds),
+        "commands": len(traces),
+        "played": len(load_test.finished_traces),
+        "errors": dict(load_test.error_counts),
+        "command_counts": dict(load_test.command_counts),
+        "traffic_seconds": traffic_seconds,
+        "total_seconds": total_seconds,
+        "commands_per_second": len(traces) / traffic_seconds if traffic_seconds else 0,
+        "plays_per_second": len(load_test.finished_traces) / total_seconds if total_seconds else 0,
+        "stages": stages,
+        "late_frames": load_test.late_frames,
+        "loop_lag_p99_ms": percentile(load_test.loop_lags, 99) * 1000,
+        "loop_lag_max_ms": max(load_test.loop_lags, default=0) * 1000,
+        "max_tasks": max(load_test.task_counts, default=0),
+        "max_tasks_per_guild": max(load_test.task_counts, default=0) / guild_count,
+        "memory_per_guild_kb": memory_bytes / guild_count / 1024
+    }
+
+
+def print_report(report):
+    print("{} commands across {} guilds in {:.1f} s ({:.1f} s including draining)".format(
+        report["commands"], report["guilds"], report["traffic_seconds"], report["total_seconds"]
+    ))
+    print("Throughput: {:.2f} commands/s, {:.2f} plays/s".format(report["commands_per_second"], report["plays_per_second"]))
+    print("Commands: {}".format(", ".join("{}={}".format(name, count) for name, count in sorted(report["command_counts"].items()))))
+    if (report["errors"]):
+        print("Errors: {}".format(", ".join("{}={}".format(name, count) for name, count in sorted(report["errors"].items()))))
+
+    print("")
+    print("{:>12} {:>8} {:>10} {:>10} {:>10} {:>10}".format("stage", "count", "p50 ms", "p90 ms", "p99 ms", "max ms"))
+    for stage, values in report["stages"].items():
+        print("{:>12} {:>8} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+            stage, values["count"], values["p50_ms"], values["p90_ms"], values["p99_ms"], values["max_ms"]
+        ))
+
+    print("")
+    print("Late audio frames: {}".format(report["late_frames"]))
+    print("Event loop lag: p99 {:.1f} ms, max {:.1f} ms".format(report["loop_lag_p99_ms"], report["loop_lag_max_ms"]))
+    print("Tasks: {} max ({:.1f} per guild)".format(report["max_tasks"], report["max_tasks_per_guild"]))
+    print("Memory: {:.1f} KB per guild".format(report["memory_per_guild_kb"]))
+
+
+def get_rss_bytes():
+    ## ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load tests the bot's cogs with fake guilds, members, and voice clients.")
+    parser.add_argument("--guilds", type=int, default=10, help="Number of guilds to generate traffic for")
+    parser.add_argument("--members", type=int, default=5, help="Number of members in each guild's voice channel")
+    parser.add_argument("--rate", type=float, default=0.2, help="Commands per second, per guild")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of traffic to generate")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weighted mix of commands (say, phrase, music, tone, or any command name)")
+    parser.add_argument("--replay", help="Replays the commands in a trace of DynamoItems, instead of generating traffic")
+    parser.add_argument("--speed", type=float, default=1.0, help="How much faster than real time to replay the trace")
+    parser.add_argument("--render-ms", type=float, default=200, help="How long the stub renderer takes to render speech")
+    parser.add_argument("--speech-ms-per-char", type=float, default=60, help="How long the rendered speech is, per character")
+    parser.add_argument("--max-speech-seconds", type=float, default=30, help="The longest that rendered speech can be")
+    parser.add_argument("--trace-memory", action="store_true", help="Measure memory with tracemalloc (precise, but slower)")
+    parser.add_argument("--seed", type=int, default=1337)
+    parser.add_argument("--json", help="Also write the report to this file as JSON")
+    args = parser.parse_args()
+
+    ## The bot's debug logging would swamp the report, and skew the results
+    logging.disable(logging.INFO)
+
+    load_test = LoadTest(args)
+
+    ## Traffic that can't be invoked would just be counted as unknown commands, so the results wouldn't mean much
+    if (not args.replay):
+        unresolved = load_test.get_unresolved_kinds(load_test.parse_mix())
+        if (unresolved):
+            parser.error("Unable to resolve the commands for: {}. Are their cogs (and dependencies) installed?".format(
+                ", ".join(unresolved)
+            ))
+
+    if (args.trace_memory):
+        tracemalloc.start()
+    baseline_bytes = get_rss_bytes()
+
+    traffic_seconds, total_seconds = load_test.loop.run_until_complete(load_test.run())
+
+    if (args.trace_memory):
+        memory_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        memory_bytes = get_rss_bytes() - baseline_bytes
+
+    shutil.rmtree(load_test.output_dir_path, ignore_errors=True)
+
+    report = build_report(load_test, traffic_seconds, total_seconds, memory_bytes)
+    print_report(report)
+
+    if (args.json):
+        with open(args.json, "w") as fd:
+            json.dump(report, fd, indent=4)
+
+
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,382 @@
+'''
+Micro benchmarks for the CPU bound parts of the bot, run against realistic fixtures (emoji heavy messages, long songs,
+and a large phrase catalog). Results are written out as JSON, so that they can be compared against a baseline, and
+the comparison fails if any benchmark has gotten slower than the given tolerance (or is missing from the results).
+
+Usage:
+    python micro_benchmarks.py run [--output results.json] [--filter name] [--repeat N]
+    python micro_benchmarks.py compare baseline.json results.json [--tolerance 0.1]
+'''
+
+import os
+import sys
+import json
+import time
+import random
+import timeit
+import logging
+import platform
+import argparse
+from collections import OrderedDict
+
+## Expose the bot's code and modules folders, just like hawking.py and the ModuleManager do
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_PATH, "code"))
+sys.path.append(os.path.join(ROOT_PATH, "modules"))
+
+## Config
+SEED = 1337
+REPEATS = 5
+DEFAULT_TOLERANCE = 0.1
+PHRASE_GROUP_COUNT = 50
+PHRASES_PER_GROUP = 100
+MESSAGE_COUNT = 200
+QUERY_COUNT = 50
+SIMILARITY_PAIR_COUNT = 500
+SONG_NOTE_COUNT = 4000
+EMOJI = ["😂", "🤔", "🔥", "👍", "🎉", "😭", "🙏", "💯", "👀", "🥺", "✨", "❤", "😍", "🤣", "😎"]
+WORDS = [
+    "the", "quick", "brown", "fox", "jumps", "over", "lazy", "dog", "hello", "there", "general", "kenobi", "moon",
+    "pizza", "why", "is", "this", "so", "loud", "dank", "meme", "stream", "late", "night", "gaming", "chat"
+]
+
+## Name -> function that sets up a benchmark, and returns (callable to time, operations per call), see benchmark()
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    def decorator(function):
+        BENCHMARKS[name] = function
+        return function
+
+    return decorator
+
+
+class Fixtures:
+    '''
+    Builds (and caches) the things the benchmarks need. The bot is only built if a benchmark actually needs it, and it
+    gets a large, synthetic phrase catalog swapped in for the real one.
+    '''
+
+    def __init__(self, seed=SEED):
+        self.random = random.Random(seed)
+        self._hawking = None
+        self._load_test = None
+
+
+    def build_sentence(self, word_count, emoji_ratio=0.0):
+        return " ".join(
+            self.random.choice(EMOJI) if self.random.random() < emoji_ratio else self.random.choice(WORDS)
+            for _ in range(word_count)
+        )
+
+
+    def build_name(self):
+        return "".join(self.random.choice("bcdfghjklmnprstvwz") + self.random.choice("aeiou") for _ in range(self.random.randint(2, 5)))
+
+
+    @property
+    def hawking(self):
+        if (self._hawking is None):
+            ## The load test harness already knows how to build the bot without Discord, so share its fakes
+            import load_test
+
+            self._load_test = load_test
+            self._hawking = load_test.build_hawking()
+            self._hawking.bot._connection.user = load_test.FakeUser(load_test.BOT_USER_ID, "hawking", is_bot=True)
+            self._install_phrase_catalog()
+
+        return self._hawking
+
+
+    def _install_phrase_catalog(self):
+        import phrases
+
+        phrases_cog = self._hawking.get_phrases_cog()
+        if (phrases_cog is None):
+            return
+
+        catalog = {}
+        names = set(self._hawking.bot.all_commands)
+        for group_index in range(PHRASE_GROUP_COUNT):
+            key = "group{}".format(group_index)
+            group = phrases.PhraseGroup("Group {}".format(group_index), key, self.build_sentence(6))
+            for _ in range(PHRASES_PER_GROUP):
+                name = self.build_name()
+                while (name in names):
+                    name = self.build_name()
+                names.add(name)
+
+                description = self.build_sentence(self.random.randint(4, 12))
+                group.add_phrase(phrases.Phrase(name, self.build_sentence(20), help=description, description=description))
+
+            catalog[key] = (key, group)
+
+        phrases_cog._apply_catalog(catalog)
+
+
+    def build_context(self, content="", mentions=()):
+        hawking = self.hawking
+        load_test = self._load_test
+        guild = load_test.FakeGuild(1, "guild", hawking.bot.user, None)
+        author = guild.add_member(2, "author")
+        message = load_test.FakeMessage(1, content, author, guild)
+        message.mentions = list(mentions)
+
+        return load_test.FakeContext(hawking.bot, message, hawking.activation_str, "help", None)
+
+## Benchmarks
+
+@benchmark("message_parser.parse_message")
+def bench_parse_message(fixtures):
+    import load_test
+    from message_parser import MessageParser
+
+    parser = MessageParser()
+    mentioned = [load_test.FakeUser(user_id, "user {}".format(user_id)) for user_id in range(100, 105)]
+    messages = []
+    for _ in range(MESSAGE_COUNT):
+        message = fixtures.build_sentence(fixtures.random.randint(10, 60), emoji_ratio=0.4)
+        messages.append("{} <@{}>".format(message, fixtures.random.choice(mentioned).id))
+    ctx = load_test.FakeMessage(1, "", None, load_test.FakeGuild(1, "guild", None, None))
+    ctx.mentions = mentioned
+
+    return (lambda: [parser.parse_message(message, ctx) for message in messages], len(messages))
+
+
+@benchmark("music.MusicParser")
+def bench_music_parser(fixtures):
+    from music import MusicParser
+    from music_parser_scaling import build_song
+
+    song = build_song(SONG_NOTE_COUNT, SEED)
+    return (lambda: MusicParser(song, 60 / 136, 3), 1)
+
+
+@benchmark("music.build_tts_note_string")
+def bench_build_tts_note_string(fixtures):
+    from music import MusicParser
+    from music_parser_scaling import build_song
+
+    music_cog = fixtures.hawking.get_music_cog()
+    if (music_cog is None):
+        return None
+
+    notes = MusicParser(build_song(SONG_NOTE_COUNT, SEED), 60 / 136, 3).notes
+    return (lambda: music_cog._build_tts_note_string(notes, **{music_cog.TONE_KEY: False}), 1)
+
+
+@benchmark("music.build_tts_note_string (tones)")
+def bench_build_tts_tone_string(fixtures):
+    from music import MusicParser
+    from music_parser_scaling import build_song
+
+    music_cog = fixtures.hawking.get_music_cog()
+    if (music_cog is None):
+        return None
+
+    notes = MusicParser(build_song(SONG_NOTE_COUNT, SEED), 60 / 136, 3).notes
+    return (lambda: music_cog._build_tts_note_string(notes, **{music_cog.TONE_KEY: True}), 1)
+
+
+@benchmark("string_similarity.similarity")
+def bench_string_similarity(fixtures):
+    from string_similarity import StringSimilarity
+
+    pairs = [
+        (fixtures.build_sentence(fixtures.random.randint(2, 8)), fixtures.build_sentence(fixtures.random.randint(4, 16)))
+        for _ in range(SIMILARITY_PAIR_COUNT)
+    ]
+    return (lambda: [StringSimilarity.similarity(a, b) for a, b in pairs], len(pairs))
+
+
+@benchmark("phrases.find")
+def bench_phrases_find(fixtures):
+    phrases_cog = fixtures.hawking.get_phrases_cog()
+    if (phrases_cog is None):
+        return None
+
+    async def say_phrase(ctx, phrase):
+        pass
+
+    ## Don't actually say the phrases that are found, only finding them is being measured
+    phrases_cog.say_phrase = say_phrase
+    ctx = fixtures.build_context()
+    find = phrases_cog.find.callback
+    queries = [fixtures.build_sentence(fixtures.random.randint(2, 6)) for _ in range(QUERY_COUNT)]
+    loop = fixtures.hawking.bot.loop
+
+    async def find_all():
+        for query in queries:
+            await find(phrases_cog, ctx, search_text=query)
+
+    return (lambda: loop.run_until_complete(find_all()), len(queries))
+
+
+@benchmark("hawking.find_most_similar_command")
+def bench_find_most_similar_command(fixtures):
+    hawking = fixtures.hawking
+    phrases_cog = hawking.get_phrases_cog()
+    names = list(phrases_cog.phrase_names) if phrases_cog else list(hawking.bot.all_commands)
+
+    ## Misspell the names a bit, like people do
+    queries = []
+    for name in fixtures.random.sample(names, min(QUERY_COUNT, len(names))):
+        index = fixtures.random.randrange(len(name))
+        queries.append("{}{}{}".format(hawking.activation_str, name[:index], name[index + 1:] + "e"))
+
+    return (lambda: [hawking.find_most_similar_command(query) for query in queries], len(queries))
+
+
+@benchmark("help_command.send_bot_help")
+def bench_help_bot(fixtures):
+    return _build_help_benchmark(fixtures, use_cache=False)
+
+
+@benchmark("help_command.send_bot_help (cached)")
+def bench_help_bot_cached(fixtures):
+    return _build_help_benchmark(fixtures, use_cache=True)
+
+
+def _build_help_benchmark(fixtures, use_cache):
+    import help_command
+
+    bot = fixtures.hawking.bot
+    command = help_command.HawkingHelpCommand()
+    command.context = fixtures.build_context()
+    loop = bot.loop
+
+    def render():
+        if (not use_cache):
+            bot.help_page_cache.invalidate()
+        loop.run_until_complete(command.send_bot_help(None))
+
+    return (render, 1)
+
+## Running
+
+def time_benchmark(function, operations, repeat):
+    '''Returns (best, median) seconds per operation'''
+
+    timer = timeit.Timer(function)
+    ## Run each benchmark enough times per repeat to take at least 0.2 seconds
+    number, _ = timer.autorange()
+    timings = sorted(timing / number / operations for timing in timer.repeat(repeat=repeat, number=number))
+
+    return (timings[0], timings[len(timings) // 2])
+
+
+def run(args):
+    ## The bot's debug logging would skew the results
+    logging.disable(logging.INFO)
+
+    fixtures = Fixtures()
+    results = OrderedDict()
+    print("{:<40} {:>14} {:>14}".format("benchmark", "best us/op", "median us/op"))
+    for name, setup in BENCHMARKS.items():
+        if (args.filter and args.filter not in name):
+            continue
+
+        try:
+            built = setup(fixtures)
+        except ImportError as e:
+            built = None
+            print("{:<40} skipped ({})".format(name, e))
+            continue
+        if (built is None):
+            print("{:<40} skipped (its cog isn't loaded)".format(name))
+            continue
+
+        function, operations = built
+        best, median = time_benchmark(function, operations, args.repeat)
+        results[name] = {"seconds_per_op": best, "median_seconds_per_op": median}
+        print("{:<40} {:>14.2f} {:>14.2f}".format(name, best * 1000000, median * 1000000))
+
+    output = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "benchmarks": results
+    }
+    with open(args.output, "w") as fd:
+        json.dump(output, fd, indent=4)
+    print("Wrote results to {}".format(args.output))
+
+    return 0
+
+
+def compare(args):
+    '''
+    Compares the best times of two runs, and fails if any benchmark got slower than the tolerance allows. Benchmarks
+    that are in the baseline but missing from the results (ex. their cog stopped loading) fail too.
+    '''
+
+    with open(args.baseline) as fd:
+        baseline = json.load(fd)["benchmarks"]
+    with open(args.results) as fd:
+        results = json.load(fd)["benchmarks"]
+
+    regressions = []
+    missing = []
+    print("{:<40} {:>12} {:>12} {:>8}".format("benchmark", "baseline us", "current us", "change"))
+    for name, baseline_result in baseline.items():
+        result = results.get(name)
+        if (result is None):
+            missing.append(name)
+            print("{:<40} {:>12.2f} {:>12} {:>8}".format(name, baseline_result["seconds_per_op"] * 1000000, "missing", "  MISSING"))
+            continue
+
+        change = result["seconds_per_op"] / baseline_result["seconds_per_op"] - 1
+        is_regression = change > args.tolerance
+        if (is_regression):
+            regressions.append(name)
+
+        print("{:<40} {:>12.2f} {:>12.2f} {:>+7.1f}%{}".format(
+            name,
+            baseline_result["seconds_per_op"] * 1000000,
+            result["seconds_per_op"] * 1000000,
+            change * 100,
+            "  REGRESSION" if is_regression else ""
+        ))
+
+    for name in results:
+        if (name not in baseline):
+            print("{:<40} {:>12} {:>12.2f} {:>8}".format(name, "new", results[name]["seconds_per_op"] * 1000000, ""))
+
+    if (regressions):
+        print("{} benchmark{} regressed by more than {:.0f}%".format(
+            len(regressions), "s" if len(regressions) != 1 else "", args.tolerance * 100
+        ))
+    if (missing):
+        print("{} benchmark{} missing from the results".format(len(missing), "s" if len(missing) != 1 else ""))
+
+    return 1 if (regressions or missing) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro benchmarks for the bot's CPU bound code.")
+    subparsers = parser.add_subparsers(dest="action")
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser("run", help="Runs the benchmarks, and writes the results out as JSON")
+    run_parser.add_argument("--output", default="benchmark_results.json", help="Where to write the results")
+    run_parser.add_argument("--filter", help="Only run the benchmarks whose names contain this")
+    run_parser.add_argument("--repeat", type=int, default=REPEATS, help="How many times to time each benchmark")
+
+    compare_parser = subparsers.add_parser("compare", help="Compares results, and fails if any have regressed")
+    compare_parser.add_argument("baseline", help="The results to compare against")
+    compare_parser.add_argument("results", help="The results to check")
+    compare_parser.add_argument(
+        "--tolerance", type=float, default=DEFAULT_TOLERANCE,
+        help="How much slower (as a fraction, ex. 0.1 for 10%%) a benchmark can get before it counts as a regression"
+    )
+
+    args = parser.parse_args()
+    if (args.action == "run"):
+        return run(args)
+
+    return compare(args)
+
+
+if (__name__ == "__main__"):
+    sys.exit(main())
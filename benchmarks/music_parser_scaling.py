@@ -0,0 +1,61 @@
+'''
+Shows how long MusicParser takes to parse songs of increasing length. Parsing should scale linearly with the number of
+notes, so the time per note should stay (roughly) flat as the songs grow.
+
+Usage: python music_parser_scaling.py [max_notes]
+'''
+
+import os
+import sys
+import random
+import timeit
+
+## Expose the bot's code and modules folders, just like hawking.py and the ModuleManager do
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_PATH, "code"))
+sys.path.append(os.path.join(ROOT_PATH, "modules"))
+
+from music import MusicParser
+
+
+## Config
+SEED = 1337
+REPEATS = 5
+NOTE_COUNTS = [1000, 2000, 4000, 8000, 16000, 32000]
+TOKENS = ["a", "2d", "c#4", "2b#3", "r", "4r", "b/b", "2c#/d#/a3/f", "e/e/e/e/e/e/e", "|"]
+
+
+def build_song(note_count, seed=SEED):
+    '''Builds a song with (at least) note_count notes, made up of the examples from the \\music help text'''
+
+    generator = random.Random(seed)
+    tokens = []
+    count = 0
+    while (count < note_count):
+        token = generator.choice(TOKENS)
+        tokens.append(token)
+        count += token.count("/") + 1 if token != "|" else 0
+
+    ## Include one long chain, since those used to be the worst case
+    tokens.append("/".join(["b"] * min(note_count, 1000)))
+
+    return " ".join(tokens)
+
+
+def main():
+    note_counts = NOTE_COUNTS
+    if (len(sys.argv) > 1):
+        max_notes = int(sys.argv[1])
+        note_counts = [count for count in NOTE_COUNTS if count <= max_notes] or [max_notes]
+
+    print("{:>8} {:>12} {:>14}".format("notes", "seconds", "us per note"))
+    for note_count in note_counts:
+        song = build_song(note_count)
+        parsed_count = len(MusicParser(song, 60 / 136, 3).notes)
+        seconds = min(timeit.repeat(lambda: MusicParser(song, 60 / 136, 3), number=1, repeat=REPEATS))
+
+        print("{:>8} {:>12.4f} {:>14.2f}".format(parsed_count, seconds, seconds / parsed_count * 1000000))
+
+
+if (__name__ == "__main__"):
+    main()
@@ -1,7 +1,7 @@
 import inspect
 
 import utilities
-import dynamo_helper
+import analytics
 from discord.ext import commands
 
 ## Config
@@ -9,6 +9,9 @@ CONFIG_OPTIONS = utilities.load_config()
 
 
 class Admin(commands.Cog):
+    ## Module
+    MODULE_DEPENDENCIES = ["AudioPlayer"]
+
     ## Keys
     ADMINS_KEY = "admins"
     ANNOUNCE_UPDATES_KEY = "announce_updates"
@@ -16,10 +19,10 @@ class Admin(commands.Cog):
     def __init__(self, hawking, bot):
         self.hawking = hawking
         self.bot = bot
-        self.admins = CONFIG_OPTIONS.get(self.ADMINS_KEY, [])
-        self.announce_updates = CONFIG_OPTIONS.get(self.ANNOUNCE_UPDATES_KEY, False)
+        self.load_config()
+        CONFIG_OPTIONS.subscribe([self.ADMINS_KEY, self.ANNOUNCE_UPDATES_KEY], self.load_config)
 
-        self.dynamo_db = dynamo_helper.DynamoHelper()
+        self.analytics = analytics.get_analytics()
 
     ## Properties
 
@@ -33,6 +36,12 @@ class Admin(commands.Cog):
 
     ## Methods
 
+    ## Reads the cog's config values, and again whenever they change
+    def load_config(self, changed_keys=None):
+        self.admins = CONFIG_OPTIONS.get_list(self.ADMINS_KEY, [])
+        self.announce_updates = CONFIG_OPTIONS.get_bool(self.ANNOUNCE_UPDATES_KEY, False)
+
+
     ## Checks if a user is a valid admin
     def is_admin(self, name):
         return (str(name) in self.admins)
@@ -69,38 +78,115 @@ class Admin(commands.Cog):
 
         if(not self.is_admin(ctx.message.author)):
             await ctx.send("<@{}> isn't allowed to do that.".format(ctx.message.author.id))
-            self.dynamo_db.put(dynamo_helper.DynamoItem(ctx, ctx.message.content, inspect.currentframe().f_code.co_name, False))
+            self.analytics.record(ctx, inspect.currentframe().f_code.co_name, False)
             return False
 
-        count = self.phrases_cog.reload_phrases()
+        count = await self.phrases_cog.reload_phrases()
+        if(count < 0):
+            await ctx.send("Sorry <@{}>, but the phrases were unloaded before they could be reloaded.".format(ctx.message.author.id))
+            self.analytics.record(ctx, inspect.currentframe().f_code.co_name, False)
+            return False
 
         loaded_clips_string = "Loaded {} phrase{}.".format(count, "s" if count != 1 else "")
         await ctx.send(loaded_clips_string)
 
-        self.dynamo_db.put(dynamo_helper.DynamoItem(ctx, ctx.message.content, inspect.currentframe().f_code.co_name, True))
+        self.analytics.record(ctx, inspect.currentframe().f_code.co_name, True)
         return (count >= 0)
 
 
     ## Tries to reload the addon cogs (admin only)
     @admin.command(no_pm=True)
-    async def reload_cogs(self, ctx):
-        """Reloads the bot's cogs."""
+    async def reload_cogs(self, ctx, force = False):
+        """Reloads the bot's changed cogs (or all of them, if forced)."""
 
         if(not self.is_admin(ctx.message.author)):
             await ctx.send("<@{}> isn't allowed to do that.".format(ctx.message.author.id))
-            self.dynamo_db.put(dynamo_helper.DynamoItem(ctx, ctx.message.content, inspect.currentframe().f_code.co_name, False))
+            self.analytics.record(ctx, inspect.currentframe().f_code.co_name, False)
             return False
 
-        count = self.hawking.module_manager.reload_all()
+        if(force):
+            count = self.hawking.module_manager.reload_all()
+        else:
+            count = self.hawking.module_manager.reload_changed()
         total = len(self.hawking.module_manager.modules)
 
         loaded_cogs_string = "Loaded {} of {} cogs.".format(count, total)
         await ctx.send(loaded_cogs_string)
 
-        self.dynamo_db.put(dynamo_helper.DynamoItem(ctx, ctx.message.content, inspect.currentframe().f_code.co_name, True))
+        self.analytics.record(ctx, inspect.currentframe().f_code.co_name, True)
         return (count >= 0)
 
 
+    ## Tries to reload the config (admin only)
+    @admin.command(no_pm=True)
+    async def reload_config(self, ctx):
+        """Reloads the bot's config."""
+
+        if(not self.is_admin(ctx.message.author)):
+            await ctx.send("<@{}> isn't allowed to do that.".format(ctx.message.author.id))
+            self.analytics.record(ctx, inspect.currentframe().f_code.co_name, False)
+            return False
+
+        changed_keys = CONFIG_OPTIONS.reload()
+        if(changed_keys is None):
+            await ctx.send("Unable to reload the config, check the logs.")
+        else:
+            count = len(changed_keys)
+            await ctx.send("Reloaded the config, {} value{} changed.".format(count, "s" if count != 1 else ""))
+
+        self.analytics.record(ctx, inspect.currentframe().f_code.co_name, changed_keys is not None)
+        return (changed_keys is not None)
+
+
+    ## Shows where the event loop has been blocked (admin only)
+    @admin.command(no_pm=True)
+    async def loop_stalls(self, ctx, count = 5):
+        """Shows what's been blocking the event loop."""
+
+        if(not self.is_admin(ctx.message.author)):
+            await ctx.send("<@{}> isn't allowed to do that.".format(ctx.message.author.id))
+            self.analytics.record(ctx, inspect.currentframe().f_code.co_name, False)
+            return False
+
+        loop_watchdog = self.hawking.loop_watchdog
+        if(loop_watchdog is None):
+            await ctx.send("The loop watchdog isn't enabled, set loop_watchdog_enable in the config to turn it on.")
+            return False
+
+        await ctx.send("```{}```".format(loop_watchdog.get_report(int(count))))
+
+        self.analytics.record(ctx, inspect.currentframe().f_code.co_name, True)
+        return True
+
+
+    ## Shows the most popular phrases lately (admin only)
+    @admin.command(no_pm=True)
+    async def hot_phrases(self, ctx, count = 10):
+        """Shows the most popular phrases lately."""
+
+        if(not self.phrases_cog):
+            await ctx.send("Sorry <@{}>, but the phrases cog isn't available.".format(ctx.message.author.id))
+            return False
+
+        if(not self.is_admin(ctx.message.author)):
+            await ctx.send("<@{}> isn't allowed to do that.".format(ctx.message.author.id))
+            self.analytics.record(ctx, inspect.currentframe().f_code.co_name, False)
+            return False
+
+        if(self.analytics.usage_counters is None):
+            await ctx.send("Phrase popularity is only tracked when analytics_mode is set to aggregate in the config.")
+            return False
+
+        hot_phrases = self.phrases_cog.get_hot_phrases(int(count))
+        if(hot_phrases):
+            await ctx.send("```{}```".format("\n".join("{:>6}  {}".format(uses, name) for name, uses in hot_phrases)))
+        else:
+            await ctx.send("No phrases have been used lately.")
+
+        self.analytics.record(ctx, inspect.currentframe().f_code.co_name, True)
+        return True
+
+
     ## Skips the currently playing audio (admin only)
     @admin.command(no_pm=True)
     async def skip(self, ctx):
@@ -122,11 +208,11 @@ class Admin(commands.Cog):
 
         if(not self.is_admin(ctx.message.author)):
             await ctx.send("<@{}> isn't allowed to do that.".format(ctx.message.author.id))
-            self.dynamo_db.put(dynamo_helper.DynamoItem(ctx, ctx.message.content, inspect.currentframe().f_code.co_name, False))
+            self.analytics.record(ctx, inspect.currentframe().f_code.co_name, False)
             return False
 
         state = self.audio_player_cog.get_server_state(ctx)
         await state.ctx.voice_client.disconnect()
 
-        self.dynamo_db.put(dynamo_helper.DynamoItem(ctx, ctx.message.content, inspect.currentframe().f_code.co_name, True))
+        self.analytics.record(ctx, inspect.currentframe().f_code.co_name, True)
         return True
@@ -0,0 +1,151 @@
+import logging
+import threading
+
+import utilities
+import dynamo_helper
+from usage_counters import UsageCounters
+
+## Config
+CONFIG_OPTIONS = utilities.load_config()
+
+## Logging
+logger = utilities.initialize_logging(logging.getLogger(__name__))
+
+
+class Analytics:
+    '''
+    Process-wide analytics facade, shared by everything that records analytics (see get_analytics()). When analytics
+    are disabled, recording is a true no-op: boto3 never gets imported, and nothing gets allocated per command. When
+    they're enabled, the DynamoHelper (and boto3 along with it) is only set up when the first item is recorded.
+
+    In the 'events' mode, every command is written as its own item. In the 'aggregate' mode, commands are counted in
+    memory instead (see UsageCounters), and only the periodic aggregates are written. The aggregate mode also keeps
+    track of the most popular commands, even if analytics are disabled.
+    '''
+
+    ## Keys
+    BOTO_ENABLE_KEY = "boto_enable"
+    MODE_KEY = "analytics_mode"
+
+    ## Defaults
+    BOTO_ENABLE = CONFIG_OPTIONS.get(BOTO_ENABLE_KEY, False)
+    MODE = CONFIG_OPTIONS.get(MODE_KEY, "events")
+
+    ## Modes
+    EVENTS_MODE = "events"
+    AGGREGATE_MODE = "aggregate"
+
+
+    def __init__(self, **kwargs):
+        self.enabled = kwargs.get(self.BOTO_ENABLE_KEY, self.BOTO_ENABLE)
+        self.mode = kwargs.get(self.MODE_KEY, self.MODE)
+        self.kwargs = kwargs
+
+        if (self.mode not in (self.EVENTS_MODE, self.AGGREGATE_MODE)):
+            logger.warning("Unknown analytics mode: {}, using {} instead".format(self.mode, self.EVENTS_MODE))
+            self.mode = self.EVENTS_MODE
+
+        self._dynamo_helper = None
+        self._dynamo_helper_lock = threading.Lock()
+
+        self.usage_counters = None
+        if (self.mode == self.AGGREGATE_MODE):
+            self.usage_counters = UsageCounters(**kwargs)
+            if (self.enabled):
+                self.usage_counters.start(self._write_aggregates)
+
+    ## Properties
+
+    @property
+    def dynamo_helper(self):
+        '''The DynamoHelper that items are written through, which is created on first use'''
+
+        if (self._dynamo_helper is None):
+            with self._dynamo_helper_lock:
+                if (self._dynamo_helper is None):
+                    self._dynamo_helper = dynamo_helper.DynamoHelper(**self.kwargs)
+
+        return self._dynamo_helper
+
+    ## Methods
+
+    def record(self, ctx, command, is_valid, error=None):
+        '''Records that the command in the given context was invoked, and whether or not it succeeded'''
+
+        if (self.usage_counters is not None):
+            guild = ctx.message.guild
+            self.usage_counters.record(
+                ## Phrases are all played through the same command, so prefer whatever the user actually invoked
+                ctx.invoked_with or command,
+                guild.id if guild else None,
+                ctx.message.created_at.timestamp() * 1000,
+                is_valid
+            )
+            return None
+
+        if (not self.enabled):
+            return None
+
+        try:
+            return self.dynamo_helper.put(dynamo_helper.DynamoItem(ctx, ctx.message.content, command, is_valid, error))
+        except Exception:
+            ## Don't let issues with analytics tank the bot's functionality
+            logger.exception("Exception while recording analytics for {}".format(command))
+            return None
+
+
+    def get_hot_commands(self, count=10, predicate=None):
+        '''
+        Returns a list of up to count (command, uses) tuples for the most used commands recently, most used first. Only
+        available in the aggregate mode, otherwise it's always empty. See UsageCounters.get_hot_commands.
+        '''
+
+        if (self.usage_counters is None):
+            return []
+
+        return self.usage_counters.get_hot_commands(count, predicate)
+
+
+    def _write_aggregates(self, items):
+        for item in items:
+            self.dynamo_helper.writer.put(item)
+
+
+    def flush(self, timeout=None):
+        '''Blocks until all of the recorded items have been written'''
+
+        if (self.usage_counters is not None and self.enabled):
+            self._write_aggregates(self.usage_counters.drain())
+
+        if (self._dynamo_helper is None):
+            return True
+
+        return self._dynamo_helper.flush(timeout)
+
+
+    def close(self, timeout=None):
+        '''Writes out any recorded items, and shuts down the writer'''
+
+        if (self.usage_counters is not None):
+            self.usage_counters.stop(timeout)
+
+        if (self._dynamo_helper is not None):
+            self._dynamo_helper.close(timeout)
+
+
+## The process-wide Analytics instance
+_analytics = None
+_analytics_lock = threading.Lock()
+
+
+def get_analytics():
+    '''Returns the process-wide Analytics instance, creating it if necessary'''
+
+    global _analytics
+
+    if (_analytics is None):
+        with _analytics_lock:
+            if (_analytics is None):
+                _analytics = Analytics()
+
+    return _analytics
@@ -0,0 +1,317 @@
+import os
+import json
+import time
+import queue
+import logging
+import tempfile
+import threading
+
+import utilities
+
+## Config
+CONFIG_OPTIONS = utilities.load_config()
+
+## Logging
+logger = utilities.initialize_logging(logging.getLogger(__name__))
+
+
+class FileSink:
+    '''
+    Local stand-in for the analytics table, that appends every item to a file as a line of JSON. Handy for testing, or
+    for running the bot without any AWS resources.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+
+    def write_batch(self, items):
+        with open(self.path, "a") as file:
+            for item in items:
+                file.write(json.dumps(item) + "\n")
+
+
+class AnalyticsWriter:
+    '''
+    Writes analytics items to a sink (anything with a write_batch(items) method, see DynamoSink and FileSink) from a
+    background thread, so that nobody ever has to wait on a network round trip to record an event. Items are buffered
+    in a bounded queue, and written out in batches whenever a batch fills up, or the oldest item in the batch gets too
+    old. If the queue is full, new items are dropped (and counted). If the sink can't be reached, batches are spilled
+    to a file on disk instead, and replayed once the sink is reachable again.
+    '''
+
+    ## Keys
+    BATCH_SIZE_KEY = "analytics_batch_size"
+    FLUSH_INTERVAL_SECONDS_KEY = "analytics_flush_interval_seconds"
+    MAX_QUEUED_ITEMS_KEY = "analytics_max_queued_items"
+    SPILL_FILE_KEY = "analytics_spill_file"
+    SPILL_FILE_PATH_KEY = "analytics_spill_file_path"
+    MAX_SPILL_FILE_BYTES_KEY = "analytics_max_spill_file_bytes"
+
+    ## Defaults
+    BATCH_SIZE = CONFIG_OPTIONS.get(BATCH_SIZE_KEY, 25)
+    FLUSH_INTERVAL_SECONDS = CONFIG_OPTIONS.get(FLUSH_INTERVAL_SECONDS_KEY, 5)
+    MAX_QUEUED_ITEMS = CONFIG_OPTIONS.get(MAX_QUEUED_ITEMS_KEY, 10000)
+    SPILL_FILE = CONFIG_OPTIONS.get(SPILL_FILE_KEY, "analytics_spill.jsonl")
+    SPILL_FILE_PATH = CONFIG_OPTIONS.get(SPILL_FILE_PATH_KEY, os.sep.join([utilities.get_root_path(), SPILL_FILE]))
+    MAX_SPILL_FILE_BYTES = CONFIG_OPTIONS.get(MAX_SPILL_FILE_BYTES_KEY, 50 * 1024 * 1024)
+
+    ## Queue marker, see stop(). Flushes are marked with a threading.Event, see flush().
+    _STOP = object()
+
+
+    def __init__(self, sink, **kwargs):
+        self.sink = sink
+        self.batch_size = max(int(kwargs.get(self.BATCH_SIZE_KEY, self.BATCH_SIZE)), 1)
+        self.flush_interval_seconds = float(kwargs.get(self.FLUSH_INTERVAL_SECONDS_KEY, self.FLUSH_INTERVAL_SECONDS))
+        self.max_queued_items = int(kwargs.get(self.MAX_QUEUED_ITEMS_KEY, self.MAX_QUEUED_ITEMS))
+        self.spill_file_path = kwargs.get(self.SPILL_FILE_PATH_KEY, self.SPILL_FILE_PATH)
+        self.max_spill_file_bytes = int(kwargs.get(self.MAX_SPILL_FILE_BYTES_KEY, self.MAX_SPILL_FILE_BYTES))
+
+        self.queue = queue.Queue(self.max_queued_items)
+        self.thread = None
+
+        ## Counters, see stats
+        self.written = 0
+        self.dropped = 0
+        ## Items are dropped on both the callers' threads and the writer thread, see _add_dropped()
+        self.dropped_lock = threading.Lock()
+        self.spilled = 0
+        self.replayed = 0
+        self.failed_batches = 0
+        self.is_sink_available = True
+        self.has_spilled_items = False
+        self.last_replay_attempt = 0
+
+    ## Properties
+
+    @property
+    def is_running(self):
+        return (self.thread is not None and self.thread.is_alive())
+
+
+    @property
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "failed_batches": self.failed_batches,
+            "sink_available": self.is_sink_available
+        }
+
+    ## Methods
+
+    def start(self):
+        if (self.is_running):
+            return
+
+        ## Replay anything that was spilled before the last shutdown once things are up and running
+        self.has_spilled_items = os.path.isfile(self.spill_file_path)
+
+        self.thread = threading.Thread(target=self._run, name="AnalyticsWriter", daemon=True)
+        self.thread.start()
+
+
+    def stop(self, timeout=None):
+        '''Writes out everything that's been queued so far, and then stops the background thread'''
+
+        if (not self.is_running):
+            return
+
+        ## Make sure the stop marker gets in, even if the queue is full
+        while (True):
+            try:
+                self.queue.put(self._STOP, timeout=0.1)
+                break
+            except queue.Full:
+                if (not self.is_running):
+                    break
+
+        self.thread.join(timeout)
+        self.thread = None
+
+
+    def put(self, item):
+        '''Queues up an item (a dict) to be written, without blocking. Returns False if the item had to be dropped.'''
+
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            dropped = self._add_dropped(1)
+            if (dropped % 1000 == 1):
+                logger.warning("Analytics queue is full, {} items have been dropped so far".format(dropped))
+            return False
+
+        return True
+
+
+    def _add_dropped(self, count):
+        '''Counts the given number of dropped items, and returns the new total'''
+
+        with self.dropped_lock:
+            self.dropped += count
+            return self.dropped
+
+
+    def flush(self, timeout=None):
+        '''Blocks until everything queued so far has been written (or spilled). Returns False if it timed out.'''
+
+        if (not self.is_running):
+            return False
+
+        flushed = threading.Event()
+        try:
+            self.queue.put(flushed, timeout=timeout)
+        except queue.Full:
+            return False
+
+        return flushed.wait(timeout)
+
+
+    def _run(self):
+        batch = []
+        deadline = None
+
+        while (True):
+            timeout = max(deadline - time.monotonic(), 0) if batch else self.flush_interval_seconds
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if (item is self._STOP):
+                break
+
+            if (isinstance(item, threading.Event)):
+                self._write(batch)
+                batch = []
+                item.set()
+                continue
+
+            if (item is not None):
+                batch.append(item)
+                if (len(batch) == 1):
+                    deadline = time.monotonic() + self.flush_interval_seconds
+
+            if (len(batch) >= self.batch_size or (batch and time.monotonic() >= deadline)):
+                self._write(batch)
+                batch = []
+            elif (not batch and self.has_spilled_items):
+                ## Nothing else to do, so try to catch up on the spilled items
+                self._replay_spill_file()
+
+        ## Drain whatever's left before stopping
+        flushes = []
+        while (True):
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if (isinstance(item, threading.Event)):
+                flushes.append(item)
+            elif (item is not self._STOP):
+                batch.append(item)
+
+        for index in range(0, len(batch), self.batch_size):
+            self._write(batch[index:index + self.batch_size])
+
+        for flushed in flushes:
+            flushed.set()
+
+
+    def _write(self, batch):
+        if (not batch):
+            return
+
+        try:
+            self.sink.write_batch(batch)
+        except Exception:
+            self.failed_batches += 1
+            if (self.is_sink_available):
+                logger.exception("Unable to write analytics batch, spilling to {}".format(self.spill_file_path))
+            self.is_sink_available = False
+            self._spill(batch)
+            return
+
+        self.written += len(batch)
+        if (not self.is_sink_available):
+            logger.info("Analytics sink is reachable again")
+            self.is_sink_available = True
+        if (self.has_spilled_items):
+            self._replay_spill_file()
+
+
+    def _spill(self, batch, is_replay=False):
+        try:
+            spill_file_size = os.path.getsize(self.spill_file_path)
+        except OSError:
+            spill_file_size = 0
+
+        if (spill_file_size >= self.max_spill_file_bytes):
+            self._add_dropped(len(batch))
+            return
+
+        try:
+            with open(self.spill_file_path, "a") as file:
+                for item in batch:
+                    file.write(json.dumps(item) + "\n")
+        except Exception:
+            logger.exception("Unable to spill analytics batch to {}".format(self.spill_file_path))
+            self._add_dropped(len(batch))
+            return
+
+        self.has_spilled_items = True
+        if (not is_replay):
+            self.spilled += len(batch)
+
+
+    def _replay_spill_file(self):
+        ## Don't hammer an unreachable sink
+        now = time.monotonic()
+        if (not self.is_sink_available and now - self.last_replay_attempt < self.flush_interval_seconds):
+            return
+        self.last_replay_attempt = now
+
+        ## Move the spill file out of the way first, so anything spilled during the replay isn't lost
+        replay_file_descriptor, replay_file_path = tempfile.mkstemp(
+            prefix=os.path.basename(self.spill_file_path) + ".",
+            dir=os.path.dirname(self.spill_file_path)
+        )
+        os.close(replay_file_descriptor)
+        try:
+            os.replace(self.spill_file_path, replay_file_path)
+        except FileNotFoundError:
+            os.remove(replay_file_path)
+            self.has_spilled_items = False
+            return
+        self.has_spilled_items = False
+
+        items = []
+        with open(replay_file_path) as file:
+            for line in file:
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    ## Most likely a partially written line from a crash, nothing can be done with it
+                    self._add_dropped(1)
+
+        for index in range(0, len(items), self.batch_size):
+            batch = items[index:index + self.batch_size]
+            try:
+                self.sink.write_batch(batch)
+            except Exception:
+                ## Still unreachable, so put the rest of the items back in the spill file
+                self.is_sink_available = False
+                self._spill(items[index:], is_replay=True)
+                break
+
+            self.written += len(batch)
+            self.replayed += len(batch)
+            self.is_sink_available = True
+        else:
+            logger.info("Replayed {} spilled analytics items".format(len(items)))
+
+        os.remove(replay_file_path)
@@ -1,6 +1,8 @@
 import os
 os.environ = {} # Remove env variables to give os.system a semblance of security
 import sys
+import json
+import shutil
 import asyncio
 import async_timeout
 import time
@@ -12,7 +14,7 @@ from typing import Callable
 from concurrent import futures
 
 import utilities
-import dynamo_helper
+import analytics
 import exceptions
 
 import discord
@@ -65,6 +67,7 @@ class ServerStateManager:
         self.next = asyncio.Event() # flag for alerting the audio_player to play the next AudioPlayRequest
         self.skip_votes = set() # set of Members that voted to skip
         self.audio_play_queue = asyncio.Queue() # queue of AudioPlayRequest to play
+        self.is_stopped = False # set when the audio player loop should exit, see stop()
         self.audio_player = self.bot.loop.create_task(self.audio_player_loop())
 
         self.channel_timeout_seconds = int(CONFIG_OPTIONS.get('channel_timeout_seconds', 15 * 60))
@@ -109,6 +112,31 @@ class ServerStateManager:
         await self.audio_play_queue.put(play_request)
 
 
+    def drain_play_requests(self) -> list:
+        '''
+        Empties the audio_play_queue, and returns the requests that haven't been played yet in order. The request that's
+        currently playing (if any) is included at the front, as it'll need to be played again from the start.
+        '''
+
+        play_requests = []
+        if (self.active_play_request is not None and not self.active_play_request.skipped and self.is_playing()):
+            play_requests.append(self.active_play_request)
+
+        while (not self.audio_play_queue.empty()):
+            play_requests.append(self.audio_play_queue.get_nowait())
+
+        return play_requests
+
+
+    def stop(self):
+        '''Stops the audio player loop (and whatever it's playing), without leaving the voice channel'''
+
+        self.is_stopped = True
+        self.audio_player.cancel()
+        if (self.is_playing()):
+            self.ctx.voice_client.stop()
+
+
     async def get_voice_client(self, channel: discord.VoiceChannel):
         '''Handles voice client management by connecting, and moving between voice channels'''
 
@@ -186,7 +214,7 @@ class ServerStateManager:
         audio, and handling successful skip requests
         '''
 
-        while(True):
+        while(not self.is_stopped):
             try:
                 self.next.clear()
                 active_play_request = None
@@ -200,6 +228,9 @@ class ServerStateManager:
                         self.bot.loop.create_task(self.disconnect(inactive=True))
                     continue
                 except asyncio.CancelledError:
+                    if (self.is_stopped):
+                        return
+
                     logger.exception("CancelledError during audio_player_loop, ignoring and continuing loop.")
                     continue
 
@@ -278,20 +309,54 @@ class AudioPlayer(commands.Cog):
     SKIP_PERCENTAGE_KEY = "skip_percentage"
     FFMPEG_PARAMETERS_KEY = "ffmpeg_parameters"
     FFMPEG_POST_PARAMETERS_KEY = "ffmpeg_post_parameters"
+    PENDING_AUDIO_FOLDER_KEY = "pending_audio_folder"
+
+    ## Defaults
+    PENDING_AUDIO_FOLDER = CONFIG_OPTIONS.get(PENDING_AUDIO_FOLDER_KEY, "pending_audio")
 
+    ## The file inside the pending audio folder that describes the saved play requests
+    PENDING_AUDIO_MANIFEST_FILE = "pending_audio.json"
 
-    def __init__(self, bot: commands.Bot, channel_timeout_handler, **kwargs):
+
+    def __init__(self, bot: commands.Bot, channel_timeout_handler, reload_state=None, **kwargs):
         self.bot = bot
         self.server_states = {}
         self.channel_timeout_handler = channel_timeout_handler
-        self.dynamo_db = dynamo_helper.DynamoHelper()
+        self.pending_audio_folder_path = os.sep.join([
+            utilities.get_root_path(),
+            kwargs.get(self.PENDING_AUDIO_FOLDER_KEY, self.PENDING_AUDIO_FOLDER)
+        ])
+
+        ## Adopt the previous cog's server states when being reloaded, so queued and playing audio isn't interrupted
+        if (reload_state is not None):
+            for server_id, server_state in reload_state["server_states"].items():
+                server_state.audio_player_cog = self
+                server_state.channel_timeout_handler = channel_timeout_handler
+                self.server_states[server_id] = server_state
+        self.analytics = analytics.get_analytics()
+
+        self.load_config()
+        CONFIG_OPTIONS.subscribe(
+            [self.SKIP_PERCENTAGE_KEY, self.FFMPEG_PARAMETERS_KEY, self.FFMPEG_POST_PARAMETERS_KEY],
+            self.load_config
+        )
+
+    ## Methods
+
+    def load_config(self, changed_keys=None):
+        '''Reads the cog's tunable values out of the config, and again whenever they change'''
 
         ## Clamp between 0.0 and 1.0
-        self.skip_percentage = max(min(float(CONFIG_OPTIONS.get(self.SKIP_PERCENTAGE_KEY, 0.5)), 1.0), 0.0)
-        self.ffmpeg_parameters = CONFIG_OPTIONS.get(self.FFMPEG_PARAMETERS_KEY, "")
-        self.ffmpeg_post_parameters = CONFIG_OPTIONS.get(self.FFMPEG_POST_PARAMETERS_KEY, "")
+        self.skip_percentage = max(min(CONFIG_OPTIONS.get_float(self.SKIP_PERCENTAGE_KEY, 0.5), 1.0), 0.0)
+        self.ffmpeg_parameters = CONFIG_OPTIONS.get_str(self.FFMPEG_PARAMETERS_KEY, "")
+        self.ffmpeg_post_parameters = CONFIG_OPTIONS.get_str(self.FFMPEG_POST_PARAMETERS_KEY, "")
+
+
+    def get_reload_state(self):
+        '''Returns the state to hand over to this cog's replacement when it's reloaded (see ModuleManager)'''
+
+        return {"server_states": self.server_states}
 
-    ## Methods
 
     def get_server_state(self, ctx) -> ServerStateManager:
         '''Retrieves the server state for the provided server_id, or creates a new one if no others exist'''
@@ -306,6 +371,101 @@ class AudioPlayer(commands.Cog):
         return server_state
 
 
+    def save_pending_audio(self) -> int:
+        '''
+        Stops every server's audio player, and saves the play requests that haven't been played yet (along with copies
+        of their audio files, as the TTS output folder gets wiped on startup) to the pending audio folder, so that they
+        can be restored once the bot starts back up (see restore_pending_audio()). Returns the number of saved requests.
+        '''
+
+        temp_folder_path = "{}.tmp".format(self.pending_audio_folder_path)
+        shutil.rmtree(temp_folder_path, ignore_errors=True)
+        os.makedirs(temp_folder_path)
+
+        manifest = []
+        saved_count = 0
+        for server_id, server_state in self.server_states.items():
+            ## Drain before stopping, so the request that's currently playing is still counted as playing
+            play_requests = server_state.drain_play_requests()
+            server_state.stop()
+
+            saved_play_requests = []
+            for index, play_request in enumerate(play_requests):
+                ## Requests without a member are the bot's own (like the channel timeout message), so skip them
+                if (play_request.member is None or not os.path.isfile(play_request.file_path)):
+                    continue
+
+                file_name = "{}_{}{}".format(server_id, index, os.path.splitext(play_request.file_path)[1])
+                shutil.copyfile(play_request.file_path, os.sep.join([temp_folder_path, file_name]))
+                saved_play_requests.append({
+                    "channel_id": play_request.channel.id,
+                    "member_id": play_request.member.id,
+                    "file_name": file_name
+                })
+
+            if (saved_play_requests):
+                manifest.append({
+                    "guild_id": server_id,
+                    "text_channel_id": server_state.ctx.channel.id,
+                    "message_id": server_state.ctx.message.id,
+                    "play_requests": saved_play_requests
+                })
+                saved_count += len(saved_play_requests)
+
+        with open(os.sep.join([temp_folder_path, self.PENDING_AUDIO_MANIFEST_FILE]), 'w') as fd:
+            json.dump(manifest, fd)
+
+        ## The previous pending audio has either been restored (and copied over above), or is out of date by now
+        shutil.rmtree(self.pending_audio_folder_path, ignore_errors=True)
+        os.replace(temp_folder_path, self.pending_audio_folder_path)
+
+        logger.info("Saved {} pending play requests from {} servers".format(saved_count, len(manifest)))
+        return saved_count
+
+
+    async def restore_pending_audio(self) -> int:
+        '''Queues up the play requests saved by save_pending_audio(). Returns the number of restored requests.'''
+
+        manifest_path = os.sep.join([self.pending_audio_folder_path, self.PENDING_AUDIO_MANIFEST_FILE])
+        try:
+            manifest = utilities.load_json(manifest_path)
+        except FileNotFoundError:
+            return 0
+        except Exception:
+            logger.exception("Unable to load the pending audio manifest at {}".format(manifest_path))
+            return 0
+
+        ## Only restore the requests once, even if the bot reconnects later on
+        os.remove(manifest_path)
+
+        restored_count = 0
+        for server_entry in manifest:
+            ## Rebuild the context of the last command that was invoked in the server, so the server state has
+            ## somewhere to send its messages
+            try:
+                text_channel = self.bot.get_channel(server_entry["text_channel_id"])
+                message = await text_channel.fetch_message(server_entry["message_id"])
+                ctx = await self.bot.get_context(message)
+            except Exception:
+                logger.exception("Unable to restore the pending audio for server: {}".format(server_entry["guild_id"]))
+                continue
+
+            server_state = self.get_server_state(ctx)
+            for saved_play_request in server_entry["play_requests"]:
+                voice_channel = self.bot.get_channel(saved_play_request["channel_id"])
+                member = ctx.guild.get_member(saved_play_request["member_id"])
+                file_path = os.sep.join([self.pending_audio_folder_path, saved_play_request["file_name"]])
+                if (voice_channel is None or member is None or not os.path.isfile(file_path)):
+                    continue
+
+                player = self.build_player(file_path)
+                await server_state.add_play_request(AudioPlayRequest(member, voice_channel, player, file_path))
+                restored_count += 1
+
+        logger.info("Restored {} pending play requests".format(restored_count))
+        return restored_count
+
+
     def build_player(self, file_path) -> discord.FFmpegPCMAudio:
         '''Builds an audio player for playing the file located at 'file_path'.'''
 
@@ -393,8 +553,7 @@ class AudioPlayer(commands.Cog):
         player = self.build_player(file_path)
         await state.add_play_request(AudioPlayRequest(ctx.message.author, voice_channel, player, file_path))
 
-        self.dynamo_db.put(dynamo_helper.DynamoItem(
-            ctx, ctx.message.content, inspect.currentframe().f_code.co_name, True))
+        self.analytics.record(ctx, inspect.currentframe().f_code.co_name, True)
 
         return True
 
@@ -0,0 +1,86 @@
+import heapq
+import logging
+
+import utilities
+from phonetics import Phonetics
+from search_index import SearchIndex
+from string_similarity import StringSimilarity
+
+## Logging
+logger = utilities.initialize_logging(logging.getLogger(__name__))
+
+
+class CommandIndex:
+    '''
+    Fuzzy index of the bot's visible command names, used to suggest commands when an invalid one is invoked. It's kept
+    up to date as commands are added and removed (see HawkingBot), so suggestions never have to rebuild the list of
+    commands. Names are indexed by character bigrams (command names are short, and trigrams miss simple transpositions
+    like 'sya'), and only the best matching candidates are scored with StringSimilarity. Commands that sound like the
+    invoked command (ex. 'muzik') are found with a phonetic lookup, and are always considered a close match. Short
+    phonetic keys collide too often to be trusted (ex. 'say', 'so', and 'sea' are all 'S'), so those are only scored
+    normally.
+    '''
+
+    ## Config
+    NGRAM_SIZE = 2
+    CANDIDATE_COUNT = 10
+    PHONETIC_MATCH_SIMILARITY = 0.9
+    MINIMUM_PHONETIC_KEY_LENGTH = 3
+
+
+    def __init__(self, candidate_count=CANDIDATE_COUNT):
+        self.candidate_count = candidate_count
+        self.search_index = SearchIndex(self.NGRAM_SIZE, phonetic=True)
+
+    ## Magic Methods
+
+    def __len__(self):
+        return len(self.search_index)
+
+
+    def __contains__(self, name):
+        return (name in self.search_index)
+
+    ## Methods
+
+    def add(self, command):
+        '''Indexes the given command, provided that it's visible to users'''
+
+        if (command.hidden):
+            return False
+
+        self.search_index.add(command.name, command.name)
+        return True
+
+
+    def add_name(self, name):
+        '''Indexes a name that's invoked like a command, but isn't registered with the bot (see HawkingBot.resolve_command)'''
+
+        self.search_index.add(name, name)
+
+
+    def remove(self, name):
+        return self.search_index.remove(name)
+
+
+    def most_similar(self, query, count=1):
+        '''Returns a list of up to count (name, similarity) tuples for the commands most similar to the query, best first'''
+
+        candidates = self.search_index.candidates(query, max(self.candidate_count, count))
+        if (not candidates):
+            return []
+
+        similarities = StringSimilarity.similarity_many(query, candidates)
+
+        ## Commands that sound like the invoked command (the first word of the query) are at least a close match
+        invoked = query.split(maxsplit=1)[0] if query.strip() else ""
+        sound_alikes = set()
+        if (len(Phonetics.encode(invoked)) >= self.MINIMUM_PHONETIC_KEY_LENGTH):
+            sound_alikes = self.search_index.phonetic_lookup(invoked)
+        if (sound_alikes):
+            similarities = [
+                max(similarity, self.PHONETIC_MATCH_SIMILARITY) if candidate in sound_alikes else similarity
+                for candidate, similarity in zip(candidates, similarities)
+            ]
+
+        return heapq.nlargest(count, zip(candidates, similarities), key=lambda pair: pair[1])
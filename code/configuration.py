@@ -0,0 +1,218 @@
+import os
+import json
+import logging
+import weakref
+import threading
+
+## Logging (utilities depends on this module, so this logger just uses the root logger's handlers)
+logger = logging.getLogger(__name__)
+
+
+class Configuration:
+    '''
+    The bot's configuration (config.json), parsed once and shared by everything in the process (see get_config()). It
+    can be read just like the dict that json.load() would've returned, and has typed accessors for values that need
+    to be a specific type. Components that want to pick up changes to the config without a restart can subscribe to
+    the keys they care about, and they'll be told whenever those keys change in a reload().
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.options = {}
+        self.mtime = None
+
+        ## Lists of (keys, callback reference) tuples, see subscribe()
+        self.subscriptions = []
+        self.lock = threading.Lock()
+
+        self.file_watcher = None
+
+        self.options, self.mtime = self._read()
+
+    ## Magic Methods
+
+    def __getitem__(self, key):
+        return self.options[key]
+
+
+    def __contains__(self, key):
+        return (key in self.options)
+
+
+    def __iter__(self):
+        return iter(self.options)
+
+
+    def __len__(self):
+        return len(self.options)
+
+    ## Methods
+
+    def _read(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path) as fd:
+            return (json.load(fd), mtime)
+
+
+    def get(self, key, default=None):
+        return self.options.get(key, default)
+
+
+    def get_str(self, key, default=None):
+        value = self.options.get(key)
+        return default if value is None else str(value)
+
+
+    def get_int(self, key, default=None):
+        return self._get_converted(key, default, int)
+
+
+    def get_float(self, key, default=None):
+        return self._get_converted(key, default, float)
+
+
+    def get_bool(self, key, default=None):
+        value = self.options.get(key)
+        if (isinstance(value, str)):
+            return value.strip().lower() in ("true", "yes", "on", "1")
+
+        return default if value is None else bool(value)
+
+
+    def get_list(self, key, default=None):
+        value = self.options.get(key)
+        if (value is None):
+            return default
+
+        return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+    def _get_converted(self, key, default, converter):
+        value = self.options.get(key)
+        if (value is None):
+            return default
+
+        try:
+            return converter(value)
+        except (TypeError, ValueError):
+            logger.warning("Config value for {} ({}) isn't a valid {}, using {} instead".format(
+                key, value, converter.__name__, default
+            ))
+            return default
+
+
+    def subscribe(self, keys, callback):
+        '''
+        Calls callback(changed_keys) with the set of keys that changed whenever any of the given keys change in a
+        reload(). Bound methods are only weakly referenced, so subscribing doesn't keep their object (like a cog that
+        gets reloaded) alive.
+        '''
+
+        if (isinstance(keys, str)):
+            keys = [keys]
+
+        if (hasattr(callback, "__self__")):
+            reference = weakref.WeakMethod(callback)
+        else:
+            reference = lambda: callback
+
+        with self.lock:
+            self.subscriptions.append((frozenset(keys), reference))
+
+
+    def unsubscribe(self, callback):
+        with self.lock:
+            self.subscriptions = [
+                (keys, reference) for keys, reference in self.subscriptions if reference() not in (None, callback)
+            ]
+
+
+    def reload(self):
+        '''
+        Reads the config file again, and notifies the subscribers of any keys that changed. Returns the set of changed
+        keys, or None if the file couldn't be read (in which case the current config is kept).
+        '''
+
+        try:
+            options, mtime = self._read()
+        except Exception:
+            logger.exception("Unable to reload config from {}, keeping the current config".format(self.path))
+            return None
+
+        previous_options = self.options
+        self.options = options
+        self.mtime = mtime
+
+        changed_keys = set(
+            key for key in set(previous_options) | set(options) if previous_options.get(key) != options.get(key)
+        )
+        if (changed_keys):
+            logger.info("Reloaded config, changed: {}".format(", ".join(sorted(changed_keys))))
+            self._notify(changed_keys)
+
+        return changed_keys
+
+
+    def reload_if_changed(self):
+        '''Reloads the config, but only if the file has been modified since it was last read'''
+
+        try:
+            if (os.stat(self.path).st_mtime_ns == self.mtime):
+                return set()
+        except OSError:
+            return set()
+
+        return self.reload()
+
+
+    def _notify(self, changed_keys):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+
+        for keys, reference in subscriptions:
+            if (not keys.intersection(changed_keys)):
+                continue
+
+            callback = reference()
+            if (callback is None):
+                continue
+
+            try:
+                callback(changed_keys)
+            except Exception:
+                logger.exception("Exception in config subscriber {}".format(callback))
+
+        ## Clean up after any subscribers that have been garbage collected
+        with self.lock:
+            self.subscriptions = [(keys, reference) for keys, reference in self.subscriptions if reference() is not None]
+
+
+    def watch(self, loop):
+        '''Automatically reloads the config whenever its file changes'''
+
+        ## The file watcher's module needs the config itself, so it can't be imported up top
+        from file_watcher import FileWatcher
+
+        if (self.file_watcher is not None):
+            return
+
+        self.file_watcher = FileWatcher(loop, os.path.dirname(self.path), self.reload_if_changed)
+        self.file_watcher.start()
+
+
+## The process-wide Configuration instance
+_config = None
+_config_lock = threading.Lock()
+
+
+def get_config(path):
+    '''Returns the process-wide Configuration instance, reading it from the given path if necessary'''
+
+    global _config
+
+    if (_config is None):
+        with _config_lock:
+            if (_config is None):
+                _config = Configuration(path)
+
+    return _config
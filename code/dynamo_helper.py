@@ -1,9 +1,9 @@
-import boto3
 import base64
 import time
 import logging
 
 import utilities
+from analytics_writer import AnalyticsWriter
 
 ## Config
 CONFIG_OPTIONS = utilities.load_config()
@@ -63,18 +63,36 @@ class DynamoItem:
         return base64.b64encode(bytes(concatenated, "utf-8")).decode("utf-8")
     
 
+class DynamoSink:
+    '''Analytics sink (see AnalyticsWriter) that batch writes items into a DynamoDB table'''
+
+    def __init__(self, table, primary_key_name):
+        self.table = table
+        self.primary_key_name = primary_key_name
+
+
+    def write_batch(self, items):
+        ## Items with the same primary key (same user, same millisecond) can't be in the same batch
+        with self.table.batch_writer(overwrite_by_pkeys=[self.primary_key_name]) as batch_writer:
+            for item in items:
+                batch_writer.put_item(Item=item)
+
+
 class DynamoHelper:
     ## Keys
     BOTO_ENABLE_KEY = "boto_enable"
     BOTO_RESOURCE_KEY = "boto_resource"
     BOTO_REGION_NAME_KEY = "boto_region_name"
     BOTO_TABLE_NAME_KEY = "boto_table_name"
+    BOTO_PRIMARY_KEY_KEY = "boto_primary_key"
+    SINK_KEY = "sink"
 
     ## Defaults
     BOTO_ENABLE = CONFIG_OPTIONS.get(BOTO_ENABLE_KEY, False)
     BOTO_RESOURCE = CONFIG_OPTIONS.get(BOTO_RESOURCE_KEY, "dynamodb")
     BOTO_REGION_NAME = CONFIG_OPTIONS.get(BOTO_REGION_NAME_KEY, "us-east-2")
     BOTO_TABLE_NAME = CONFIG_OPTIONS.get(BOTO_TABLE_NAME_KEY, "Hawking")
+    BOTO_PRIMARY_KEY = CONFIG_OPTIONS.get(BOTO_PRIMARY_KEY_KEY, "QueryId")
 
 
     def __init__(self, **kwargs):
@@ -82,19 +100,48 @@ class DynamoHelper:
         self.resource = kwargs.get(self.BOTO_RESOURCE_KEY, self.BOTO_RESOURCE)
         self.region_name = kwargs.get(self.BOTO_REGION_NAME_KEY, self.BOTO_REGION_NAME)
         self.table_name = kwargs.get(self.BOTO_TABLE_NAME_KEY, self.BOTO_TABLE_NAME)
-
-        self.dynamo_db = boto3.resource(self.resource, region_name=self.region_name)
-        self.table = self.dynamo_db.Table(self.table_name)
+        self.primary_key_name = kwargs.get(self.BOTO_PRIMARY_KEY_KEY, self.BOTO_PRIMARY_KEY)
+
+        ## Items are written from a background thread, so recording analytics never blocks the event loop. The sink can
+        ## be swapped out (ex. for a FileSink) for testing.
+        sink = kwargs.pop(self.SINK_KEY, None)
+        self.dynamo_db = None
+        self.table = None
+        if(sink is None):
+            ## boto3 is slow to import, so only pull it in when there's actually a table to write to
+            import boto3
+
+            self.dynamo_db = boto3.resource(self.resource, region_name=self.region_name)
+            self.table = self.dynamo_db.Table(self.table_name)
+            sink = DynamoSink(self.table, self.primary_key_name)
+
+        self.writer = AnalyticsWriter(sink, **kwargs)
+        if(self.enabled):
+            self.writer.start()
 
     ## Methods
 
     def put(self, dynamo_item):
+        '''Queues up the item to be written in the background. Returns False if it couldn't be queued.'''
+
         if(self.enabled):
             try:
-                return self.table.put_item(Item=dynamo_item.getDict())
+                return self.writer.put(dynamo_item.getDict())
             except Exception as e:
                 ## Don't let issues with dynamo tank the bot's functionality
-                logger.exception("Exception while performing dynamo put")
-                return None
+                logger.exception("Exception while queueing dynamo put")
+                return False
         else:
             return None
+
+
+    def flush(self, timeout=None):
+        '''Blocks until all of the queued items have been written'''
+
+        return self.writer.flush(timeout)
+
+
+    def close(self, timeout=None):
+        '''Writes out any queued items, and stops the background writer'''
+
+        self.writer.stop(timeout)
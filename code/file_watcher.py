@@ -0,0 +1,177 @@
+import os
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+
+import utilities
+
+## Config
+CONFIG_OPTIONS = utilities.load_config()
+
+## Logging
+logger = utilities.initialize_logging(logging.getLogger(__name__))
+
+
+class FileWatcher:
+    '''
+    Watches a folder, and invokes a callback (either a function or a coroutine function) whenever anything inside of it
+    changes. Uses inotify on Linux, and falls back to polling the folder's file stats everywhere else. Bursts of
+    changes (like an editor writing a temp file and then moving it into place) are debounced into a single callback.
+    The callback isn't told what changed, it's expected to work that out for itself.
+    '''
+
+    ## Keys
+    POLL_INTERVAL_SECONDS_KEY = "file_watcher_poll_interval_seconds"
+    DEBOUNCE_SECONDS_KEY = "file_watcher_debounce_seconds"
+
+    ## Defaults
+    POLL_INTERVAL_SECONDS = CONFIG_OPTIONS.get(POLL_INTERVAL_SECONDS_KEY, 5)
+    DEBOUNCE_SECONDS = CONFIG_OPTIONS.get(DEBOUNCE_SECONDS_KEY, 0.5)
+
+    ## inotify constants, see: man 7 inotify
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+    def __init__(self, loop, path, callback, **kwargs):
+        self.loop = loop
+        self.path = path
+        self.callback = callback
+        self.poll_interval_seconds = float(kwargs.get(self.POLL_INTERVAL_SECONDS_KEY, self.POLL_INTERVAL_SECONDS))
+        self.debounce_seconds = float(kwargs.get(self.DEBOUNCE_SECONDS_KEY, self.DEBOUNCE_SECONDS))
+
+        self.inotify_fd = None
+        self.poll_task = None
+        self.debounce_handle = None
+
+    ## Properties
+
+    @property
+    def is_running(self):
+        return (self.inotify_fd is not None or self.poll_task is not None)
+
+    ## Methods
+
+    def start(self):
+        '''Starts watching the path, preferring inotify, and falling back to polling if that isn't possible'''
+
+        if (self.is_running):
+            return
+
+        if (utilities.is_linux() and self._start_inotify()):
+            logger.info("Watching {} with inotify".format(self.path))
+        else:
+            self.poll_task = self.loop.create_task(self._poll_loop())
+            logger.info("Watching {} by polling every {} seconds".format(self.path, self.poll_interval_seconds))
+
+
+    def stop(self):
+        if (self.debounce_handle):
+            self.debounce_handle.cancel()
+            self.debounce_handle = None
+
+        if (self.inotify_fd is not None):
+            try:
+                self.loop.remove_reader(self.inotify_fd)
+            except Exception:
+                logger.exception("Unable to remove inotify reader for {}".format(self.path))
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+
+        if (self.poll_task):
+            self.poll_task.cancel()
+            self.poll_task = None
+
+
+    def _start_inotify(self):
+        library_path = ctypes.util.find_library("c")
+        if (not library_path):
+            return False
+
+        try:
+            libc = ctypes.CDLL(library_path, use_errno=True)
+            inotify_fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if (inotify_fd < 0):
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+            watch_descriptor = libc.inotify_add_watch(inotify_fd, os.fsencode(self.path), self.IN_WATCH_MASK)
+            if (watch_descriptor < 0):
+                os.close(inotify_fd)
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+            self.loop.add_reader(inotify_fd, self._on_inotify_readable)
+        except Exception:
+            logger.exception("Unable to watch {} with inotify".format(self.path))
+            return False
+
+        self.inotify_fd = inotify_fd
+        return True
+
+
+    def _on_inotify_readable(self):
+        ## The events themselves don't matter, just drain them so the fd stops being readable
+        try:
+            while (os.read(self.inotify_fd, 4096)):
+                pass
+        except BlockingIOError:
+            pass
+        except OSError:
+            logger.exception("Error reading inotify events for {}".format(self.path))
+
+        self._schedule_callback()
+
+
+    def _snapshot(self):
+        snapshot = {}
+        try:
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    stat = entry.stat()
+                    snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            logger.exception("Unable to scan {}".format(self.path))
+
+        return snapshot
+
+
+    async def _poll_loop(self):
+        snapshot = self._snapshot()
+
+        while (True):
+            await asyncio.sleep(self.poll_interval_seconds)
+
+            current_snapshot = self._snapshot()
+            if (current_snapshot != snapshot):
+                snapshot = current_snapshot
+                self._schedule_callback()
+
+
+    def _schedule_callback(self):
+        if (self.debounce_handle):
+            self.debounce_handle.cancel()
+
+        self.debounce_handle = self.loop.call_later(self.debounce_seconds, self._invoke_callback)
+
+
+    def _invoke_callback(self):
+        self.debounce_handle = None
+
+        if (asyncio.iscoroutinefunction(self.callback)):
+            task = self.loop.create_task(self.callback())
+            task.add_done_callback(self._log_callback_exception)
+        else:
+            try:
+                self.callback()
+            except Exception:
+                logger.exception("Exception in file watcher callback for {}".format(self.path))
+
+
+    def _log_callback_exception(self, task):
+        if (not task.cancelled() and task.exception()):
+            logger.error("Exception in file watcher callback for {}".format(self.path), exc_info=task.exception())
@@ -1,6 +1,15 @@
+import sys
+import startup_profiler
+
+## Profile the startup (including all of the imports below) if asked to, see startup_profiler.py
+if (startup_profiler.PROFILE_STARTUP_FLAG in sys.argv):
+    startup_profiler.install()
+
 import inspect
 import os
 import time
+import signal
+import asyncio
 import logging
 from concurrent.futures import TimeoutError
 from collections import OrderedDict
@@ -15,9 +24,10 @@ import speech
 import admin
 import message_parser
 import help_command
-import dynamo_helper
+import analytics
+from loop_watchdog import LoopWatchdog
+from command_index import CommandIndex
 from module_manager import ModuleEntry, ModuleManager
-from string_similarity import StringSimilarity
 
 ## Config
 CONFIG_OPTIONS = utilities.load_config()
@@ -26,6 +36,87 @@ CONFIG_OPTIONS = utilities.load_config()
 logger = utilities.initialize_logging(logging.getLogger(__name__))
 
 
+class HawkingBot(commands.Bot):
+    '''
+    A commands.Bot that keeps a fuzzy index of its command names in sync with its commands. Every path that changes
+    the bot's commands (cogs, the help command) goes through add_command and remove_command, which also invalidate the
+    cached help pages.
+
+    Names that aren't registered commands can still be resolved into commands by command resolvers. This lets large
+    tables of commands (like the phrases) be dispatched through a single command, rather than registering a command
+    for every entry.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        ## The index needs to exist before the base constructor adds the help command
+        self.command_index = CommandIndex()
+        self.command_resolvers = []
+        ## Top level commands of cogs that haven't been loaded yet, keyed by name (see ModuleManager)
+        self.deferred_commands = {}
+        self.help_page_cache = help_command.HelpPageCache()
+        ## Cleared while shutting down, so that nothing new gets started (see Hawking.shutdown())
+        self.is_accepting_commands = True
+
+        super().__init__(*args, **kwargs)
+
+    ## Methods
+
+    def add_command_resolver(self, resolver):
+        '''
+        Registers a callable that takes an invoked command name, and returns the Command to invoke for it (or None).
+        Resolvers are only consulted for names that aren't registered commands.
+        '''
+
+        self.command_resolvers.append(resolver)
+
+
+    def remove_command_resolver(self, resolver):
+        if (resolver in self.command_resolvers):
+            self.command_resolvers.remove(resolver)
+
+
+    def resolve_command(self, name):
+        for resolver in self.command_resolvers:
+            command = resolver(name)
+            if (command is not None):
+                return command
+
+        return None
+
+
+    async def process_commands(self, message):
+        if (not self.is_accepting_commands):
+            return
+
+        await super().process_commands(message)
+
+
+    async def get_context(self, message, *, cls=commands.Context):
+        ctx = await super().get_context(message, cls=cls)
+
+        if (ctx.command is None and ctx.invoked_with):
+            ctx.command = self.resolve_command(ctx.invoked_with)
+
+        return ctx
+
+
+    def add_command(self, command):
+        super().add_command(command)
+        self.command_index.add(command)
+        self.help_page_cache.invalidate()
+
+
+    def remove_command(self, name):
+        command = super().remove_command(name)
+
+        ## Removing an alias leaves the command itself in place
+        if (command is not None and name not in command.aliases):
+            self.command_index.remove(command.name)
+        self.help_page_cache.invalidate()
+
+        return command
+
+
 class Hawking:
     ## Keys and Defaults
     ## Basically, any given class can be configured by changing the respective value for the
@@ -44,6 +135,9 @@ class Hawking:
     TOKEN_FILE_KEY = "token_file"
     TOKEN_FILE_PATH_KEY = "token_file_path"
     INVALID_COMMAND_MINIMUM_SIMILARITY = "invalid_command_minimum_similarity"
+    WATCH_CONFIG_KEY = "watch_config"
+    SHUTDOWN_TIMEOUT_SECONDS_KEY = "shutdown_timeout_seconds"
+    LOOP_WATCHDOG_ENABLE_KEY = "loop_watchdog_enable"
 
     ## Defaults
     VERSION = CONFIG_OPTIONS.get(VERSION_KEY, "Invalid version")
@@ -51,6 +145,7 @@ class Hawking:
     DESCRIPTION = CONFIG_OPTIONS.get(DESCRIPTION_KEY, "A retro TTS bot for Discord\n Visit https://github.com/naschorr/hawking")
     TOKEN_FILE = CONFIG_OPTIONS.get(TOKEN_FILE_KEY, "token.json")
     TOKEN_FILE_PATH = CONFIG_OPTIONS.get(TOKEN_FILE_PATH_KEY, os.sep.join([utilities.get_root_path(), TOKEN_FILE]))
+    SHUTDOWN_TIMEOUT_SECONDS = CONFIG_OPTIONS.get_float(SHUTDOWN_TIMEOUT_SECONDS_KEY, 10)
 
 
     ## Initialize the bot, and add base cogs
@@ -60,27 +155,41 @@ class Hawking:
         self.description = kwargs.get(self.DESCRIPTION_KEY, self.DESCRIPTION)
         self.token_file_path = kwargs.get(self.TOKEN_FILE_PATH_KEY, self.TOKEN_FILE_PATH)
         self.invalid_command_minimum_similarity = float(kwargs.get(self.INVALID_COMMAND_MINIMUM_SIMILARITY, 0.66))
-        self.dynamo_db = dynamo_helper.DynamoHelper()
+        self.shutdown_timeout_seconds = float(kwargs.get(self.SHUTDOWN_TIMEOUT_SECONDS_KEY, self.SHUTDOWN_TIMEOUT_SECONDS))
+        self.analytics = analytics.get_analytics()
+        self.shutdown_task = None
         ## Todo: pass kwargs to the their modules
 
         ## Init the bot and module manager
-        self.bot = commands.Bot(
-            command_prefix=commands.when_mentioned_or(self.activation_str),
-            description=self.description
-        )
-        self.module_manager = ModuleManager(self, self.bot)
+        with startup_profiler.measure("create bot"):
+            self.bot = HawkingBot(
+                command_prefix=commands.when_mentioned_or(self.activation_str),
+                description=self.description
+            )
+            self.module_manager = ModuleManager(self, self.bot)
 
-        ## Apply customized HelpCommand
-        self.bot.help_command = help_command.HawkingHelpCommand()
+            ## Apply customized HelpCommand
+            self.bot.help_command = help_command.HawkingHelpCommand()
 
-        ## Register the modules (Order of registration is important, make sure dependancies are loaded first)
+        ## Register the modules (they're loaded in order of their declared MODULE_DEPENDENCIES, see ModuleManager)
         self.module_manager.register(message_parser.MessageParser, False)
         self.module_manager.register(admin.Admin, True, self, self.bot)
         self.module_manager.register(speech.Speech, True, self)
-        self.module_manager.register(audio_player.AudioPlayer, True, self.bot, self.get_speech_cog().play_random_channel_timeout_message)
+        self.module_manager.register(audio_player.AudioPlayer, True, self.bot, self.play_channel_timeout_message)
 
-        ## Load any dynamic modules inside the /modules folder
+        ## Register any dynamic modules inside the /modules folder, and then load everything
         self.module_manager.discover()
+        self.module_manager.load_all()
+        startup_profiler.mark("modules loaded")
+
+        ## Keep an eye out for anything that blocks the event loop (it's started once the loop is, see run())
+        self.loop_watchdog = None
+        if (CONFIG_OPTIONS.get_bool(self.LOOP_WATCHDOG_ENABLE_KEY, False)):
+            self.loop_watchdog = LoopWatchdog(self.bot.loop)
+
+        ## Pick up changes to the config without needing a restart
+        if (CONFIG_OPTIONS.get_bool(self.WATCH_CONFIG_KEY, False)):
+            CONFIG_OPTIONS.watch(self.bot.loop)
 
         ## Give some feedback for when the bot is ready to go, and provide some help text via the 'playing' status
         @self.bot.event
@@ -91,6 +200,11 @@ class Hawking:
 
             logger.info("Logged in as '{}' (version: {}), (id: {})".format(self.bot.user.name, self.version, self.bot.user.id))
 
+            ## Pick up where the last shutdown left off
+            await self.get_audio_player_cog().restore_pending_audio()
+
+            startup_profiler.finish("on_ready")
+
 
         ## Give some feedback to users when their command doesn't execute.
         @self.bot.event
@@ -98,8 +212,7 @@ class Hawking:
             '''Handles command errors. Attempts to find a similar command and suggests it, otherwise directs the user to the help prompt.'''
             
             logger.exception("Unable to process command.", exc_info=exception)
-            self.dynamo_db.put(dynamo_helper.DynamoItem(
-                ctx, ctx.message.content, inspect.currentframe().f_code.co_name, False, str(exception)))
+            self.analytics.record(ctx, inspect.currentframe().f_code.co_name, False, str(exception))
 
             ## Attempt to find a command that's similar to the one they wanted. Otherwise just direct them to the help page
             most_similar_command = self.find_most_similar_command(ctx.message.content)
@@ -155,6 +268,12 @@ class Hawking:
         return self.bot.get_cog("Music")
 
 
+    ## Plays a message when the bot leaves a channel due to inactivity (resolved at call time, since the speech cog is
+    ## loaded alongside the audio player)
+    async def play_channel_timeout_message(self, server_state, callback):
+        await self.get_speech_cog().play_random_channel_timeout_message(server_state, callback)
+
+
     ## Register an arbitrary module with hawking (easy wrapper for self.module_manager.register)
     def register_module(self, cls, is_cog, *init_args, **init_kwargs):
         self.module_manager.register(cls, is_cog, *init_args, **init_kwargs)
@@ -162,44 +281,103 @@ class Hawking:
 
     ## Finds the most similar command to the supplied one
     def find_most_similar_command(self, command):
+        most_similar_commands = self.find_most_similar_commands(command, 1)
+
+        if (most_similar_commands):
+            return most_similar_commands[0]
+        else:
+            return (None, 0)
+
+
+    ## Finds the count most similar (name, similarity) command tuples to the supplied one, best first
+    def find_most_similar_commands(self, command, count=1):
         ## Build a message string that we can compare with.
         try:
             message = command[len(self.activation_str):]
         except TypeError:
             message = command
 
-        ## Get a list of all visible commands 
-        commands = [cmd.name for cmd in self.bot.commands if not cmd.hidden]
+        ## Look up the visible commands that are close to the message, rather than comparing against all of them
+        return self.bot.command_index.most_similar(message, count)
+
+
+    ## Starts shutting the bot down, if it isn't already
+    def request_shutdown(self):
+        if (self.shutdown_task is None):
+            self.shutdown_task = self.bot.loop.create_task(self.shutdown())
+
+        return self.shutdown_task
+
 
-        ## Find the most similar command
-        most_similar_command = (None, 0)
-        for key in commands:
-            distance = StringSimilarity.similarity(key, message)
-            if (distance > most_similar_command[1]):
-                most_similar_command = (key, distance)
+    ## Shuts the bot down gracefully
+    async def shutdown(self):
+        '''
+        Stops taking commands, saves any audio that's still waiting to be played (see AudioPlayer.save_pending_audio()),
+        leaves every voice channel, and writes out the analytics before closing the bot.
+        '''
 
-        return most_similar_command
+        logger.info("Shutting down the bot.")
+        self.bot.is_accepting_commands = False
+        self.module_manager.stop_watching()
+        if (self.loop_watchdog is not None):
+            self.loop_watchdog.stop(self.shutdown_timeout_seconds)
+
+        audio_player_cog = self.get_audio_player_cog()
+        if (audio_player_cog is not None):
+            try:
+                audio_player_cog.save_pending_audio()
+            except Exception:
+                logger.exception("Unable to save the pending audio")
+
+        ## Explicitly leave the voice channels, otherwise Discord leaves the bot in them until they time out
+        for voice_client in list(self.bot.voice_clients):
+            try:
+                await asyncio.wait_for(voice_client.disconnect(force=True), self.shutdown_timeout_seconds)
+            except Exception:
+                logger.exception("Unable to disconnect from voice channel: {}".format(voice_client.channel))
+
+        await self.bot.loop.run_in_executor(None, self.analytics.close, self.shutdown_timeout_seconds)
+        await self.bot.close()
 
 
     ## Run the bot
     def run(self):
-        '''Starts the bot up'''
-
-        ## So ideally there would be some flavor of atexit.register or signal.signal command to gracefully shut the bot
-        ## down upon SIGTERM or SIGINT. However that doesn't seem to be possible at the moment. Discord.py's got most of
-        ## the functionality built into the base close() method that fires on SIGINT and SIGTERM, but the bot never ends
-        ## up getting properly disconnected from the voice channels that it's connected to. I end up having to wait for
-        ## a time out. Otherwise the bot will be in a weird state upon starting back up, and attempting to speak in one
-        ## of the channels that it was previously in. Fortunately this bad state will self-recover in a minute or so,
-        ## but it's still unpleasant. A temporary fix is to bump up the RestartSec= property in the service config to be
-        ## long enough to allow for the bot to be forcefully disconnected
+        '''Starts the bot up, and shuts it down gracefully upon SIGINT or SIGTERM'''
+
+        ## Discord.py's own run() just stops the event loop and cancels everything upon SIGINT or SIGTERM, so the bot
+        ## never ends up properly disconnected from the voice channels it's in, and stays stuck in them until Discord
+        ## times it out. Instead, the signals trigger shutdown(), which saves any queued audio (it gets played again
+        ## once the bot's back up), and leaves the voice channels before closing the bot.
+        loop = self.bot.loop
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, self.request_shutdown)
+            except NotImplementedError:
+                ## Windows doesn't support signal handlers, but Ctrl+C still raises a KeyboardInterrupt (see below)
+                pass
+
+        if (self.loop_watchdog is not None):
+            loop.call_soon(self.loop_watchdog.start)
 
         logger.info('Starting up the bot.')
-        self.bot.run(utilities.load_json(self.token_file_path)["token"])
+        try:
+            loop.run_until_complete(self.bot.start(utilities.load_json(self.token_file_path)["token"]))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.run_until_complete(self.request_shutdown())
+
+            ## Clean up anything that's still running
+            tasks = [task for task in utilities.get_all_tasks(loop) if not task.done()]
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.close()
 
 
 if(__name__ == "__main__"):
-    hawking = Hawking()
+    with startup_profiler.measure("Hawking()"):
+        hawking = Hawking()
     # hawking.register_module(ArbitraryClass(*init_args, **init)kwargs))
     # or,
     # hawking.add_cog(ArbitaryClass(*args, **kwargs))
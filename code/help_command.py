@@ -1,8 +1,8 @@
+import inspect
 import logging
 import random
 
 import utilities
-import dynamo_helper
 
 from discord.ext import commands
 from discord.ext.commands import DefaultHelpCommand, Paginator
@@ -13,7 +13,39 @@ CONFIG_OPTIONS = utilities.load_config()
 ## Logging
 logger = utilities.initialize_logging(logging.getLogger(__name__))
 
+class HelpPageCache:
+    '''
+    Holds help pages that have already been rendered, so they're ready to send. Help command instances are rebuilt
+    for every invocation, so the cache lives on the bot (see HawkingBot). The bot invalidates it whenever its commands
+    change (like when a cog is loaded or reloaded), and so do the phrases whenever they're reloaded.
+    '''
+
+    def __init__(self):
+        self.pages = {}
+
+    ## Methods
+
+    def get(self, key):
+        return self.pages.get(key)
+
+
+    def set(self, key, pages):
+        self.pages[key] = pages
+        return pages
+
+
+    def invalidate(self):
+        if (self.pages):
+            logger.debug("Invalidated {} cached help page set{}".format(len(self.pages), "s" if len(self.pages) != 1 else ""))
+        self.pages = {}
+
+
 class HawkingHelpCommand(commands.DefaultHelpCommand):
+    @property
+    def page_cache(self):
+        return self.context.bot.help_page_cache
+
+
     @property
     def max_name_size(self):
         """
@@ -22,9 +54,15 @@ class HawkingHelpCommand(commands.DefaultHelpCommand):
 
         size = 0
         try:
-            commands = self.context.bot.commands
+            ## Include commands from cogs that haven't been loaded yet, see ModuleManager
+            commands = list(self.context.bot.commands) + list(self.context.bot.deferred_commands.values())
             if commands:
                 size = max(map(lambda c: len(c.name) if self.show_hidden or not c.hidden else 0, commands))
+
+            ## Phrases aren't registered as commands, so include their names too
+            phrase_cog = self.context.bot.get_cog("Phrases")
+            if (phrase_cog != None):
+                size = max(size, phrase_cog.max_phrase_name_length)
         except AttributeError as e:
             size = 15
 
@@ -46,18 +84,39 @@ class HawkingHelpCommand(commands.DefaultHelpCommand):
         self.paginator.add_line(activation_note, empty=True)
 
 
-    def dump_footer_boilerplate(self, categories):
+    def build_footer_boilerplate(self, categories):
         """
-        Adds the footer boilerplate text (Using the help interface) to the paginator
+        Returns the footer boilerplate text (Using the help interface). It suggests a random category, so it's never
+        cached with the rest of the page
         """
         # Ending note logic from HelpFormatter.format
         command_name = self.context.invoked_with
-        ending_note = "Check out the other phrase categories! Why not try '{0}{1} {2}'?".format(
+        return "Check out the other phrase categories! Why not try '{0}{1} {2}'?".format(
             self.clean_prefix,
             command_name,
             random.choice(categories)
         )
-        self.paginator.add_line(ending_note)
+
+
+    def add_footer_to_pages(self, pages, footer):
+        """
+        Returns a copy of the (cached) pages, with the footer added to the end of the last page (or on its own page, if
+        it doesn't fit)
+        """
+        pages = list(pages)
+        prefix = self.paginator.prefix
+        suffix = self.paginator.suffix
+
+        if (pages and len(pages[-1]) + len(footer) + 1 <= self.paginator.max_size):
+            last_page = pages[-1]
+            if (suffix is not None and last_page.endswith(suffix)):
+                pages[-1] = last_page[:-len(suffix)] + footer + "\n" + suffix
+            else:
+                pages[-1] = last_page + "\n" + footer
+        else:
+            pages.append("\n".join(line for line in (prefix, footer, suffix) if line is not None))
+
+        return pages
 
 
     def dump_commands(self):
@@ -65,13 +124,15 @@ class HawkingHelpCommand(commands.DefaultHelpCommand):
         Adds information about the bot's available commands (unrelated to the phrase commands) to the paginator
         """
         self.paginator.add_line("Basic Commands:")
-        for command in sorted(self.context.bot.commands, key=lambda cmd: cmd.name):
+        width = self.max_name_size
+        commands = list(self.context.bot.commands) + list(self.context.bot.deferred_commands.values())
+        for command in sorted(commands, key=lambda cmd: cmd.name):
             if((command.module != "phrases" or command.name == 'random' or command.name == 'find') and not command.hidden):
                 entry = '  {0}{1:<{width}} {2}'.format(
                     CONFIG_OPTIONS.get('activation_str', ''),
                     command.name,
                     command.short_doc,
-                    width=self.max_name_size
+                    width=width
                 )
                 self.paginator.add_line(self.shorten_text(entry))
         self.paginator.add_line()
@@ -85,11 +146,12 @@ class HawkingHelpCommand(commands.DefaultHelpCommand):
             width = self.max_name_size
 
         self.paginator.add_line(phrase_group.name + ":")
-        for name, phrase in sorted(phrase_group.phrases.items(), key=lambda tup: tup[0]):
+        ## Phrases are already sorted by name, see PhraseCatalog
+        for name, phrase in phrase_group.phrases.items():
             entry = '  {0}{1:<{width}} {2}'.format(
                 CONFIG_OPTIONS.get('activation_str', ''),
                 name,
-                phrase.kwargs.get("help"),
+                phrase.help,
                 width=width
             )
             self.paginator.add_line(self.shorten_text(entry))
@@ -108,7 +170,8 @@ class HawkingHelpCommand(commands.DefaultHelpCommand):
         width += len(help_string)
 
         self.paginator.add_line('Phrase Category Help:')
-        for name, group in sorted(phrase_groups.items(), key=lambda tup: tup[0]):
+        ## Phrase groups are already sorted by key, see Phrases._apply_catalog
+        for name, group in phrase_groups.items():
             ## Don't insert empty groups
             if(len(group.phrases) > 0):
                 entry = '  {0}{1:<{width}} {2}'.format(
@@ -121,72 +184,133 @@ class HawkingHelpCommand(commands.DefaultHelpCommand):
         self.paginator.add_line()
 
 
-    async def send_phrase_category_help(self, command):
-        '''Sends help information for a given command representing a phrase Category'''
+    async def command_callback(self, ctx, *, command=None):
+        '''
+        Phrases and phrase categories aren't registered as commands, so look them up in the phrase table before falling
+        back to the usual command lookup (Overridden)
+        '''
+
+        phrase_cog = ctx.bot.get_cog("Phrases")
+        if (command is not None and phrase_cog != None):
+            name = command.split(' ')[0]
+            if (name not in ctx.bot.all_commands):
+                phrase_group = phrase_cog.phrase_groups.get(name)
+                if (phrase_group != None):
+                    await self.prepare_help_command(ctx, command)
+                    return await self.send_phrase_category_help(phrase_group)
+
+                phrase = phrase_cog.phrases.get(name)
+                if (phrase != None):
+                    await self.prepare_help_command(ctx, command)
+                    return await self.send_phrase_help(phrase)
+
+        ## Commands from cogs that haven't been loaded yet need to be resolved (and loaded) first
+        if (command is not None):
+            ctx.bot.resolve_command(command.split(' ')[0])
+
+        return await super().command_callback(ctx, command=command)
+
+
+    async def send_phrase_category_help(self, phrase_group):
+        '''Sends help information for a given phrase Category'''
 
-        ## Initial setup
-        max_width = self.max_name_size
         phrase_groups = self.context.bot.get_cog("Phrases").phrase_groups
 
-        self.dump_header_boilerplate()
-        # self.dump_commands()
-        self.dump_phrase_group(phrase_groups[command.name], max_width)
-        self.dump_phrase_categories(phrase_groups, max_width)
-        self.dump_footer_boilerplate(list(phrase_groups.keys()))
-        
-        self.paginator.close_page()
-        await self.send_pages()
+        ## Render the category's pages, unless they're already cached
+        key = ("category", phrase_group.key, self.clean_prefix)
+        pages = self.page_cache.get(key)
+        if (pages is None):
+            self.paginator = Paginator()
+            max_width = self.max_name_size
+
+            self.dump_header_boilerplate()
+            # self.dump_commands()
+            self.dump_phrase_group(phrase_group, max_width)
+            self.dump_phrase_categories(phrase_groups, max_width)
+
+            self.paginator.close_page()
+            pages = self.page_cache.set(key, self.paginator.pages)
+
+        footer = self.build_footer_boilerplate(list(phrase_groups.keys()))
+        await self.send_cached_pages(self.add_footer_to_pages(pages, footer))
 
 
     async def send_bot_help(self, mapping):
         '''The main bot help command (overridden)'''
 
         ## Initial setup
-        self.paginator = Paginator()
         phrase_cog = self.context.bot.get_cog("Phrases")
         phrase_groups = None
         if (phrase_cog != None):
             phrase_groups = phrase_cog.phrase_groups
 
-        self.dump_header_boilerplate()
+        ## Render the main help pages, unless they're already cached
+        key = ("bot", self.clean_prefix)
+        pages = self.page_cache.get(key)
+        if (pages is None):
+            self.paginator = Paginator()
+            max_width = self.max_name_size
+
+            self.dump_header_boilerplate()
 
-        ## Dump the non-phrase commands
-        self.dump_commands()
+            ## Dump the non-phrase commands
+            self.dump_commands()
+
+            ## Dump the base phrase commands
+            if (phrase_groups != None):
+                phrases_group = phrase_groups.get("phrases")
+                if(phrases_group):
+                    self.dump_phrase_group(phrases_group, max_width)
+
+                ## Dump the names of the additional phrases. Don't print their commands because that's too much info.
+                ## This is a help interface, not a CVS receipt
+                self.dump_phrase_categories(phrase_groups, max_width)
+
+            self.paginator.close_page()
+            pages = self.page_cache.set(key, self.paginator.pages)
 
-        ## Dump the base phrase commands
         if (phrase_groups != None):
-            phrases_group = phrase_groups["phrases"]
-            if(phrases_group):
-                self.dump_phrase_group(phrases_group)
+            pages = self.add_footer_to_pages(pages, self.build_footer_boilerplate(list(phrase_groups.keys())))
 
-            ## Dump the names of the additional phrases. Don't print their commands because that's too much info.
-            ## This is a help interface, not a CVS receipt
-            self.dump_phrase_categories(phrase_groups)
+        await self.send_cached_pages(pages)
 
-            self.dump_footer_boilerplate(list(phrase_groups.keys()))
 
-        await self.send_pages()
+    async def send_cached_pages(self, pages):
+        '''Sends already rendered pages to the help command's destination'''
+
+        destination = self.get_destination()
+        for page in pages:
+            await destination.send(page)
+
+
+    async def send_phrase_help(self, phrase):
+        '''Help interface for a single phrase, laid out just like the help for a command'''
+
+        ## Phrases don't take any arguments, so their signature is just their name
+        signature = '{0}{1} '.format(self.clean_prefix, phrase.name)
+        help_section = inspect.cleandoc(phrase.help) if phrase.help else None
+
+        await self.send_help_section(signature, help_section)
 
 
     async def send_command_help(self, command):
         '''Help interface for the commands themselves (Overridden)'''
 
+        # <signature> section
+        signature = self.get_command_signature(command)
+
+        await self.send_help_section(signature, command.help)
+
+
+    async def send_help_section(self, signature, help_section):
+        '''Sends the signature and long doc for a command (or phrase)'''
+
         ## Initial setup
         self.paginator = Paginator()
-        phrase_groups = self.context.bot.get_cog("Phrases").phrase_groups
 
-        ## Is the help command a category? If so only dump the relv
-        command_str = command.__str__()
-        if(command.name in phrase_groups):
-            await self.send_phrase_category_help(command)
-            return
-
-        # <signature> section
-        signature = self.get_command_signature(command)
         self.paginator.add_line(signature, empty=True)
 
         # <long doc> section
-        help_section = command.help
         if help_section:
             if(len(help_section) > self.paginator.max_size):
                 for line in help_section.splitlines():
@@ -0,0 +1,150 @@
+import copy
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+
+class BoundedQueueHandler(QueueHandler):
+    '''
+    Hands records off to a bounded queue, so that logging never has to wait on file I/O (see LogPipeline). If the
+    queue is full the record is dropped, and counted, rather than blocking the caller. Records are only formatted once
+    they're written, on the writer's thread.
+    '''
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+
+        self.dropped = 0
+        self.unreported_dropped = 0
+
+
+    def prepare(self, record):
+        ## Resolve the message now, as its args could change before it's written. Exceptions are formatted later.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self.unreported_dropped += 1
+            return
+
+        ## Let the log know that records went missing, once there's room again
+        if (self.unreported_dropped):
+            dropped_record = logging.makeLogRecord({
+                "name": __name__,
+                "levelno": logging.WARNING,
+                "levelname": logging.getLevelName(logging.WARNING),
+                "module": "log_pipeline",
+                "funcName": "enqueue",
+                "msg": "Log queue was full, dropped {} records".format(self.unreported_dropped)
+            })
+            try:
+                self.queue.put_nowait(dropped_record)
+                self.unreported_dropped = 0
+            except queue.Full:
+                pass
+
+
+class SamplingFilter(logging.Filter):
+    '''
+    Only lets one out of every N similar records through, to keep repetitive events (like a flood of CommandNotFound
+    tracebacks) from swamping the log. Records are grouped by the name of their exception's type, or by their message
+    if they don't have one. The records that do get through note how many similar ones were left out.
+    '''
+
+    def __init__(self, sample_rates):
+        super().__init__()
+
+        ## Maps exception names or messages to N
+        self.sample_rates = {key: int(rate) for key, rate in sample_rates.items() if int(rate) > 1}
+        self.counts = {}
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+
+    def _get_key(self, record):
+        if (record.exc_info and record.exc_info[0] is not None):
+            key = record.exc_info[0].__name__
+            if (key in self.sample_rates):
+                return key
+
+        key = str(record.msg)
+        return key if key in self.sample_rates else None
+
+
+    def filter(self, record):
+        if (not self.sample_rates):
+            return True
+
+        key = self._get_key(record)
+        if (key is None):
+            return True
+
+        with self.lock:
+            count = self.counts.get(key, 0)
+            self.counts[key] = count + 1
+            if (count % self.sample_rates[key] != 0):
+                self.suppressed += 1
+                return False
+
+        if (count > 0):
+            record.msg = "{} ({} similar records were sampled out)".format(record.msg, self.sample_rates[key] - 1)
+
+        return True
+
+
+class LogPipeline:
+    '''
+    The process-wide logging pipeline. Every logger set up with utilities.initialize_logging() shares a single
+    BoundedQueueHandler, and a single background thread (a QueueListener) does the actual formatting and writing to
+    the log file and the console.
+    '''
+
+    def __init__(self, handlers, max_queued_records=10000, sample_rates=None):
+        self.queue = queue.Queue(max(int(max_queued_records), 1))
+        self.handler = BoundedQueueHandler(self.queue)
+        self.sampling_filter = SamplingFilter(sample_rates or {})
+        self.handler.addFilter(self.sampling_filter)
+
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        self.is_running = True
+        atexit.register(self.stop)
+
+    ## Properties
+
+    @property
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "sampled_out": self.sampling_filter.suppressed
+        }
+
+    ## Methods
+
+    def attach(self, logger):
+        '''Routes the logger's records through the pipeline, instead of writing them on the caller's thread'''
+
+        if (self.handler not in logger.handlers):
+            logger.addHandler(self.handler)
+
+        ## The pipeline writes to the console itself, so don't pass records on to the root logger's console handler
+        logger.propagate = False
+        return logger
+
+
+    def stop(self):
+        '''Writes out any queued records, and stops the writer thread'''
+
+        if (self.is_running):
+            self.is_running = False
+            self.listener.stop()
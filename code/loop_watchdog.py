@@ -0,0 +1,194 @@
+import os
+import sys
+import time
+import logging
+import threading
+import traceback
+
+import utilities
+
+## Config
+CONFIG_OPTIONS = utilities.load_config()
+
+## Logging
+logger = utilities.initialize_logging(logging.getLogger(__name__))
+
+
+class LoopStall:
+    '''The stalls that were caught at a single call site'''
+
+    def __init__(self, call_site, stack):
+        self.call_site = call_site
+        ## The formatted stack of the most recent stall at this call site
+        self.stack = stack
+        self.count = 0
+        self.total_seconds = 0
+        self.max_seconds = 0
+
+
+    def add(self, seconds, stack):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.stack = stack
+
+
+class LoopWatchdog:
+    '''
+    Watches for anything that blocks the event loop. A background thread regularly schedules a heartbeat on the loop,
+    and if the heartbeat takes longer than the threshold to run, then the loop is blocked. While it's blocked, the
+    loop thread's stack is captured (with sys._current_frames()), which points at whatever's doing the blocking. The
+    stalls are logged, and aggregated by call site (the innermost frame in Hawking's own code) for get_report().
+    '''
+
+    ## Keys
+    INTERVAL_SECONDS_KEY = "loop_watchdog_interval_seconds"
+    THRESHOLD_SECONDS_KEY = "loop_watchdog_threshold_seconds"
+    STACK_DEPTH_KEY = "loop_watchdog_stack_depth"
+
+    ## Defaults
+    INTERVAL_SECONDS = CONFIG_OPTIONS.get_float(INTERVAL_SECONDS_KEY, 0.5)
+    THRESHOLD_SECONDS = CONFIG_OPTIONS.get_float(THRESHOLD_SECONDS_KEY, 0.1)
+    STACK_DEPTH = CONFIG_OPTIONS.get_int(STACK_DEPTH_KEY, 20)
+
+
+    def __init__(self, loop, **kwargs):
+        self.loop = loop
+        self.interval_seconds = float(kwargs.get(self.INTERVAL_SECONDS_KEY, self.INTERVAL_SECONDS))
+        self.threshold_seconds = float(kwargs.get(self.THRESHOLD_SECONDS_KEY, self.THRESHOLD_SECONDS))
+        self.stack_depth = int(kwargs.get(self.STACK_DEPTH_KEY, self.STACK_DEPTH))
+        self.root_path = utilities.get_root_path()
+
+        ## LoopStalls keyed by their call site
+        self.stalls = {}
+        self.lock = threading.Lock()
+        ## The id of the thread that the loop runs on, which is filled in by the first heartbeat
+        self.loop_thread_id = None
+
+        self.thread = None
+        self.stopping = threading.Event()
+
+    ## Properties
+
+    @property
+    def is_running(self):
+        return (self.thread is not None and self.thread.is_alive())
+
+    ## Methods
+
+    def start(self):
+        '''Starts watching the loop. This should be called once the loop is running, otherwise it'll look blocked.'''
+
+        if (self.is_running):
+            return
+
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._run, name="LoopWatchdog", daemon=True)
+        self.thread.start()
+
+
+    def stop(self, timeout=None):
+        if (not self.is_running):
+            return
+
+        self.stopping.set()
+        self.thread.join(timeout)
+        self.thread = None
+
+
+    def _heartbeat(self, event):
+        self.loop_thread_id = threading.get_ident()
+        event.set()
+
+
+    def _run(self):
+        while (not self.stopping.is_set()):
+            heartbeat = threading.Event()
+            sent_time = time.perf_counter()
+            try:
+                self.loop.call_soon_threadsafe(self._heartbeat, heartbeat)
+            except RuntimeError:
+                ## The loop has been closed
+                return
+
+            ## Grab the loop's stack as soon as it's been blocked for longer than the threshold, as that's when it's
+            ## still stuck in whatever is blocking it
+            stack = None
+            while (not heartbeat.wait(self.threshold_seconds if stack is None else self.interval_seconds)):
+                if (self.stopping.is_set()):
+                    return
+                if (stack is None):
+                    stack = self._capture_stack()
+
+            if (stack is not None):
+                self._record(time.perf_counter() - sent_time, stack)
+
+            self.stopping.wait(self.interval_seconds)
+
+
+    def _capture_stack(self):
+        frame = sys._current_frames().get(self.loop_thread_id)
+        if (frame is None):
+            return []
+
+        return traceback.extract_stack(frame, limit=self.stack_depth)
+
+
+    def _get_call_site(self, stack):
+        '''Returns the innermost frame from Hawking's own code, or just the innermost frame if there aren't any'''
+
+        if (not stack):
+            return "unknown"
+
+        for frame in reversed(stack):
+            if (frame.filename.startswith(self.root_path)):
+                break
+        else:
+            frame = stack[-1]
+
+        file_name = os.path.relpath(frame.filename, self.root_path) if frame.filename.startswith(self.root_path) else frame.filename
+        return "{}:{} in {}".format(file_name, frame.lineno, frame.name)
+
+
+    def _record(self, seconds, stack):
+        call_site = self._get_call_site(stack)
+        formatted_stack = "".join(traceback.format_list(stack))
+
+        with self.lock:
+            stall = self.stalls.get(call_site)
+            if (stall is None):
+                stall = self.stalls[call_site] = LoopStall(call_site, formatted_stack)
+            stall.add(seconds, formatted_stack)
+
+        logger.warning("Event loop was blocked for {:.0f} ms, at {}\n{}".format(seconds * 1000, call_site, formatted_stack))
+
+
+    def get_stalls(self, count=None):
+        '''Returns up to count LoopStalls, with the ones that have blocked the loop the longest in total first'''
+
+        with self.lock:
+            stalls = sorted(self.stalls.values(), key=lambda stall: stall.total_seconds, reverse=True)
+
+        return stalls[:count] if count is not None else stalls
+
+
+    def get_report(self, count=5):
+        stalls = self.get_stalls(count)
+        if (not stalls):
+            return "The event loop hasn't been blocked for longer than {:.0f} ms.".format(self.threshold_seconds * 1000)
+
+        lines = ["{:>8} {:>10} {:>8}  {}".format("stalls", "total ms", "max ms", "call site")]
+        for stall in stalls:
+            lines.append("{:>8} {:>10.0f} {:>8.0f}  {}".format(
+                stall.count,
+                stall.total_seconds * 1000,
+                stall.max_seconds * 1000,
+                stall.call_site
+            ))
+
+        return "\n".join(lines)
+
+
+    def reset(self):
+        with self.lock:
+            self.stalls = {}
@@ -26,12 +26,16 @@ class MessageParser:
     def parse_message(self, message, ctx):
         message = self._replace_mentions(message, ctx)
 
+        return self.parse_emoji(message)
+
+
+    ## Replaces (or strips, depending on the config) the emoji in a given message. Unlike parse_message, this doesn't
+    ## need a message's context, so it can be used on text that didn't come from Discord.
+    def parse_emoji(self, message):
         if(self.replace_emoji):
-            message = self._replace_emoji(message)
+            return self._replace_emoji(message)
         else:
-            message = self._strip_emoji(message)
-
-        return message
+            return self._strip_emoji(message)
 
 
     ## Removes all underscores from a string, and replaces them with spaces.
@@ -1,11 +1,15 @@
 import os
 import sys
+import hashlib
 import logging
 import inspect
 import importlib
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import utilities
+import startup_profiler
+from file_watcher import FileWatcher
 
 ## Config
 CONFIG_OPTIONS = utilities.load_config()
@@ -15,6 +19,23 @@ logger = utilities.initialize_logging(logging.getLogger(__name__))
 
 
 class ModuleEntry:
+    '''
+    A registered module. Module classes can declare the names of the modules that need to be loaded before them with a
+    MODULE_DEPENDENCIES list, and can mark themselves as optional with MODULE_IS_OPTIONAL = True. Optional cogs aren't
+    loaded until one of their commands is first invoked (unless a module that isn't optional depends on them).
+
+    Entries also keep track of their module's source file, so that only modules that have actually changed need to be
+    reloaded (see ModuleManager.reload_changed). Cogs that have state worth keeping across a reload (like queued
+    audio) can define a get_reload_state() method, and whatever it returns will be passed into the constructor of the
+    cog's replacement as the 'reload_state' keyword argument.
+
+    Cogs are always built and added to the bot on the main thread, since building them touches the bot. Any slow work
+    that doesn't (like reading and parsing files) can go in a preload() class method instead, which is run on a thread
+    pool alongside the other modules' preloads. Whatever it returns is passed into the constructor as the 'preloaded'
+    keyword argument. Cogs can also be built without being preloaded first (ex. when they're reloaded), so preloaded
+    may be None.
+    '''
+
     def __init__(self, cls, is_cog, *init_args, **init_kwargs):
         self.module = sys.modules[cls.__module__]
         self.cls = cls
@@ -23,6 +44,15 @@ class ModuleEntry:
         self.args = init_args
         self.kwargs = init_kwargs
 
+        self.dependencies = list(getattr(cls, "MODULE_DEPENDENCIES", []))
+        self.is_optional = bool(getattr(cls, "MODULE_IS_OPTIONAL", False))
+        self.is_loaded = False
+
+        self.file_path = getattr(self.module, "__file__", None)
+        self.source_mtime = None
+        self.source_hash = None
+        self.update_source_stamp()
+
     ## Methods
 
     ## Returns an invokable object to instantiate the class defined in self.cls
@@ -30,20 +60,89 @@ class ModuleEntry:
         return getattr(self.module, self.name)
 
 
+    ## Returns the modification time and content hash of the module's source file, or (None, None) if it can't be read
+    def _read_source_stamp(self, mtime=None):
+        try:
+            if(mtime is None):
+                mtime = os.stat(self.file_path).st_mtime_ns
+            with open(self.file_path, "rb") as file:
+                return (mtime, hashlib.sha1(file.read()).hexdigest())
+        except (OSError, TypeError):
+            return (None, None)
+
+
+    ## Records the current state of the module's source file, as the state that's currently loaded
+    def update_source_stamp(self):
+        self.source_mtime, self.source_hash = self._read_source_stamp()
+
+
+    ## Returns True if the module's source file has changed since it was loaded. Only files with a new modification
+    ## time get hashed, and files that were just touched (same contents) aren't considered changed.
+    def has_source_changed(self):
+        try:
+            mtime = os.stat(self.file_path).st_mtime_ns
+        except (OSError, TypeError):
+            return False
+
+        if(mtime == self.source_mtime):
+            return False
+
+        source_mtime, source_hash = self._read_source_stamp(mtime)
+        if(source_hash == self.source_hash):
+            self.source_mtime = source_mtime
+            return False
+
+        return True
+
+
+    ## Runs the module's preload() class method (if it has one), and returns the result. Safe to call off of the main
+    ## thread, as preloads mustn't touch the bot.
+    def preload(self):
+        preload = getattr(self.get_class_callable(), "preload", None)
+        if(preload is None):
+            return None
+
+        with startup_profiler.measure("preload {}".format(self.name)):
+            return preload()
+
+
+    ## Returns the top level commands that the cog will add to the bot, without instantiating it
+    def get_commands(self):
+        return [command for command in getattr(self.get_class_callable(), "__cog_commands__", ()) if command.parent is None]
+
+
 class ModuleManager:
     ## Keys
     MODULES_FOLDER_KEY = "modules_folder"
+    MODULE_INIT_WORKERS_KEY = "module_init_workers"
+    WATCH_MODULES_KEY = "watch_modules"
+
+    ## Defaults
+    MODULE_INIT_WORKERS = CONFIG_OPTIONS.get(MODULE_INIT_WORKERS_KEY, 4)
+    WATCH_MODULES = CONFIG_OPTIONS.get(WATCH_MODULES_KEY, False)
+
 
     def __init__(self, hawking, bot):
         self.modules_folder = CONFIG_OPTIONS.get(self.MODULES_FOLDER_KEY, "")
+        self.module_init_workers = max(int(self.MODULE_INIT_WORKERS), 1)
+        self.watch_modules = self.WATCH_MODULES
 
         self.hawking = hawking
         self.bot = bot
         self.modules = OrderedDict()
+        self.is_loaded = False
+
+        ## Maps the names of commands belonging to optional cogs that haven't been loaded yet, to their ModuleEntry
+        self.deferred_commands = {}
+        self.bot.add_command_resolver(self.resolve_deferred_command)
+
+        ## Watches the folders that the registered modules live in, see start_watching()
+        self.file_watchers = []
 
     ## Methods
 
-    ## Registers a module, class, and args necessary to instantiate the class
+    ## Registers a module, class, and args necessary to instantiate the class. Modules registered before load_all() is
+    ## called are loaded by it, anything registered afterwards is loaded right away.
     def register(self, cls, is_cog=True, *init_args, **init_kwargs):
         if(not inspect.isclass(cls)):
             raise RuntimeError("Provided class parameter '{}' isn't actually a class.".format(cls))
@@ -51,15 +150,182 @@ class ModuleManager:
         if(not init_args):
             init_args = [self.hawking, self.bot]
 
-        module_entry = ModuleEntry(cls, is_cog, *init_args, **init_kwargs)
-        self.modules[module_entry.name] = module_entry
+        with startup_profiler.measure("register {}".format(cls.__name__)):
+            module_entry = ModuleEntry(cls, is_cog, *init_args, **init_kwargs)
+            self.modules[module_entry.name] = module_entry
+
+        if(self.is_loaded):
+            self.load_all()
+
+
+    ## Builds an instance of the module's class, handing it whatever its preload() returned (see ModuleEntry)
+    def _build_module(self, module_entry, preloaded=None):
+        with startup_profiler.measure("build {}".format(module_entry.name)):
+            kwargs = dict(module_entry.kwargs)
+            if(preloaded is not None):
+                kwargs["preloaded"] = preloaded
 
-        ## Add the module to the bot (if it's a cog), provided it hasn't already been added.
-        if(not self.bot.get_cog(module_entry.name) and module_entry.is_cog):
             cog_cls = module_entry.get_class_callable()
-            self.bot.add_cog(cog_cls(*module_entry.args, **module_entry.kwargs))
+            return cog_cls(*module_entry.args, **kwargs)
+
+
+    ## Adds a built module to the bot (if it's a cog), provided it hasn't already been added.
+    def _add_module(self, module_entry, instance):
+        if(module_entry.is_cog and not self.bot.get_cog(module_entry.name)):
+            self.bot.add_cog(instance)
             logger.info("Registered cog: {} on bot.".format(module_entry.name))
 
+        module_entry.is_loaded = True
+
+
+    ## Sorts the given modules into waves. Every module in a wave only depends on modules in earlier waves (or ones that
+    ## are already loaded). Modules with missing or circular dependencies are logged and left out.
+    def _build_load_waves(self, module_entries):
+        pending = OrderedDict((entry.name, entry) for entry in module_entries)
+        satisfied = set(name for name, entry in self.modules.items() if entry.is_loaded)
+        waves = []
+
+        while(pending):
+            wave = [entry for entry in pending.values() if satisfied.issuperset(entry.dependencies)]
+            if(not wave):
+                for entry in pending.values():
+                    missing = [dependency for dependency in entry.dependencies if dependency not in self.modules]
+                    if(missing):
+                        logger.error("Unable to load module {}, missing dependencies: {}".format(entry.name, missing))
+                    else:
+                        logger.error("Unable to load module {}, it has circular dependencies.".format(entry.name))
+                break
+
+            waves.append(wave)
+            for entry in wave:
+                del pending[entry.name]
+                satisfied.add(entry.name)
+
+        return waves
+
+
+    ## Returns the names of the modules that must be loaded now, because a module that isn't optional depends on them
+    def _get_required_module_names(self):
+        required = set()
+        to_visit = [entry for entry in self.modules.values() if not entry.is_optional]
+        while(to_visit):
+            entry = to_visit.pop()
+            if(entry.name in required):
+                continue
+
+            required.add(entry.name)
+            to_visit.extend(self.modules[name] for name in entry.dependencies if name in self.modules)
+
+        return required
+
+
+    ## Loads every registered module in dependency order, preloading them all concurrently. Optional cogs are deferred
+    ## until one of their commands is invoked.
+    def load_all(self):
+        with startup_profiler.measure("load modules"):
+            return self._load_all()
+
+
+    def _load_all(self):
+        required = self._get_required_module_names()
+        to_load = []
+        for entry in self.modules.values():
+            if(entry.is_loaded):
+                continue
+
+            if(entry.is_cog and entry.name not in required):
+                self._defer_module(entry)
+            else:
+                to_load.append(entry)
+
+        loaded = 0
+        failed = set()
+        with ThreadPoolExecutor(self.module_init_workers, "ModulePreload") as executor:
+            ## Preloads don't depend on each other, so start them all right away. They're collected in dependency order.
+            preloads = {entry.name: executor.submit(entry.preload) for entry in to_load if entry.is_cog}
+
+            for wave in self._build_load_waves(to_load):
+                ## Skip anything that depends on a module that failed to load
+                for entry in [entry for entry in wave if failed.intersection(entry.dependencies)]:
+                    logger.error("Unable to load module {}, its dependencies failed to load.".format(entry.name))
+                    failed.add(entry.name)
+                wave = [entry for entry in wave if entry.name not in failed]
+
+                ## Only cogs need to be built, other modules just need to be importable. Building and adding them
+                ## touches the bot, so it all happens on this thread, in registration order.
+                for entry in wave:
+                    try:
+                        instance = None
+                        if(entry.is_cog):
+                            instance = self._build_module(entry, preloads[entry.name].result())
+                        self._add_module(entry, instance)
+                    except Exception:
+                        logger.exception("Unable to register module {} on bot.".format(entry.name))
+                        failed.add(entry.name)
+                    else:
+                        loaded += 1
+
+        self.is_loaded = True
+        if(self.watch_modules):
+            self.start_watching()
+
+        logger.info("Loaded {} module{} ({} deferred).".format(loaded, "s" if loaded != 1 else "", len(set(self.deferred_commands.values()))))
+        return loaded
+
+
+    ## Defers loading an optional cog until one of its commands is invoked
+    def _defer_module(self, module_entry):
+        for command in module_entry.get_commands():
+            for name in [command.name] + list(command.aliases):
+                self.deferred_commands[name] = module_entry
+
+            self.bot.deferred_commands[command.name] = command
+            ## Keep the deferred commands discoverable by the invalid command suggestions
+            self.bot.command_index.add(command)
+
+        self.bot.help_page_cache.invalidate()
+        logger.info("Deferred loading cog: {} until it's needed.".format(module_entry.name))
+
+
+    ## Removes a deferred cog's commands from the bot, so it can be loaded (or deferred again)
+    def _undefer_module(self, module_entry):
+        for name in [name for name, entry in self.deferred_commands.items() if entry is module_entry]:
+            del self.deferred_commands[name]
+
+            ## Aliases are only tracked by the manager
+            if(self.bot.deferred_commands.pop(name, None) is not None):
+                self.bot.command_index.remove(name)
+
+        self.bot.help_page_cache.invalidate()
+
+
+    ## Loads a deferred cog (and anything it depends on) right away
+    def load_deferred_module(self, module_entry):
+        self._undefer_module(module_entry)
+
+        for dependency in module_entry.dependencies:
+            dependency_entry = self.modules.get(dependency)
+            if(dependency_entry and not dependency_entry.is_loaded):
+                self.load_deferred_module(dependency_entry)
+
+        self._add_module(module_entry, self._build_module(module_entry))
+
+
+    ## Command resolver for the bot (see HawkingBot.add_command_resolver). Loads the deferred cog that owns the invoked
+    ## command, and returns its freshly added command.
+    def resolve_deferred_command(self, name):
+        module_entry = self.deferred_commands.get(name)
+        if(module_entry is None):
+            return None
+
+        try:
+            self.load_deferred_module(module_entry)
+        except Exception:
+            logger.exception("Unable to load deferred module {}.".format(module_entry.name))
+            return None
+
+        return self.bot.all_commands.get(name)
+
 
     ## Finds and registers modules inside the modules folder
     def discover(self):
@@ -81,8 +347,10 @@ class ModuleManager:
                 ##       contain a reference to the class that serves as an entry point to the module. You should also
                 ##       specify whether or not a given module is a cog (for discord.py) or not.
                 try:
-                    module = importlib.import_module(name)
-                    declarations = module.main()
+                    with startup_profiler.measure("discover {}".format(name)):
+                        module = importlib.import_module(name)
+                        with startup_profiler.measure("{}.main()".format(name)):
+                            declarations = module.main()
 
                     ## Validate the shape of the main() method's data, and attempt to tolerate poor formatting
                     if(not isinstance(declarations, list)):
@@ -93,52 +361,154 @@ class ModuleManager:
                     self.register(*declarations)
                 except Exception as e:
                     logger.exception("Unable to register module {} on bot.".format(name))
-                    del module
+
+
+    ## Starts watching the folders that the registered modules live in, and reloads any modules that change
+    def start_watching(self):
+        if(self.file_watchers):
+            return
+
+        folder_paths = set(os.path.dirname(entry.file_path) for entry in self.modules.values() if entry.file_path)
+        for folder_path in sorted(folder_paths):
+            file_watcher = FileWatcher(self.bot.loop, folder_path, self.reload_changed)
+            file_watcher.start()
+            self.file_watchers.append(file_watcher)
+
+
+    ## Stops watching the modules' folders
+    def stop_watching(self):
+        for file_watcher in self.file_watchers:
+            file_watcher.stop()
+
+        self.file_watchers = []
+
+
+    ## Returns the given modules ordered so that every module comes after the modules it depends on
+    def _sort_by_dependencies(self, module_entries):
+        names = set(entry.name for entry in module_entries)
+        visited = set()
+        ordered = []
+
+        def visit(entry):
+            if(entry.name in visited):
+                return
+            visited.add(entry.name)
+
+            for dependency in entry.dependencies:
+                if(dependency in names):
+                    visit(self.modules[dependency])
+            ordered.append(entry)
+
+        for entry in module_entries:
+            visit(entry)
+
+        return ordered
+
+
+    ## Returns the given modules along with every module that (directly or indirectly) depends on them
+    def _with_dependents(self, module_entries):
+        names = set(entry.name for entry in module_entries)
+        has_grown = True
+        while(has_grown):
+            has_grown = False
+            for entry in self.modules.values():
+                if(entry.name not in names and names.intersection(entry.dependencies)):
+                    names.add(entry.name)
+                    has_grown = True
+
+        return [entry for entry in self.modules.values() if entry.name in names]
 
 
     ## Reimport a single module
-    def _reimport_module(self, module):
+    def _reimport_module(self, module_entry):
         try:
-            importlib.reload(module)
+            importlib.reload(module_entry.module)
         except Exception as e:
-            logger.error("Error: ({}) reloading module: {}".format(e, module))
+            logger.error("Error: ({}) reloading module: {}".format(e, module_entry.module))
             return False
         else:
+            module_entry.update_source_stamp()
             return True
 
 
     ## Reloads a module with the provided name
-    def _reload_module(self, module_name):
+    def _reload_module(self, module_name, reimport=True):
         module_entry = self.modules.get(module_name)
         assert module_entry is not None
 
-        self._reimport_module(module_entry.module)
+        if(reimport):
+            self._reimport_module(module_entry)
 
 
-    ## Reload a cog attached to the bot
-    def _reload_cog(self, cog_name):
+    ## Reload a cog attached to the bot, passing along any state that it wants to keep to its replacement. Cogs that
+    ## haven't changed themselves (but depend on one that has) don't need to be reimported, just rebuilt.
+    def _reload_cog(self, cog_name, reimport=True):
         module_entry = self.modules.get(cog_name)
         assert module_entry is not None
 
+        ## Deferred cogs just need to be reimported, they'll be built whenever they're first used
+        if(not module_entry.is_loaded):
+            is_deferred = module_entry in self.deferred_commands.values()
+            if(reimport):
+                self._reimport_module(module_entry)
+            if(is_deferred):
+                self._undefer_module(module_entry)
+                self._defer_module(module_entry)
+            return
+
+        kwargs = dict(module_entry.kwargs)
+        cog = self.bot.get_cog(cog_name)
+        if(cog is not None and hasattr(cog, "get_reload_state")):
+            kwargs["reload_state"] = cog.get_reload_state()
+
         self.bot.remove_cog(cog_name)
-        self._reimport_module(module_entry.module)
+        if(reimport):
+            self._reimport_module(module_entry)
         cog_cls = module_entry.get_class_callable()
-        self.bot.add_cog(cog_cls(*module_entry.args, **module_entry.kwargs))
+        self.bot.add_cog(cog_cls(*module_entry.args, **kwargs))
 
 
-    ## Reload all of the registered modules
-    def reload_all(self):
+    ## Reloads the given modules, reimporting the ones in reimport_names, and returns how many were reloaded
+    def _reload_modules(self, module_entries, reimport_names):
         counter = 0
-        for module_name in self.modules:
+        for module_entry in self._sort_by_dependencies(module_entries):
+            module_name = module_entry.name
+            reimport = (module_name in reimport_names)
             try:
-                if(self.modules[module_name].is_cog):
-                    self._reload_cog(module_name)
+                if(module_entry.is_cog):
+                    self._reload_cog(module_name, reimport)
                 else:
-                    self._reload_module(module_name)
+                    self._reload_module(module_name, reimport)
             except Exception as e:
                 logger.error("Error: {} when reloading cog: {}".format(e, module_name))
             else:
                 counter += 1
 
+        return counter
+
+
+    ## Reload all of the registered modules
+    def reload_all(self):
+        counter = self._reload_modules(list(self.modules.values()), set(self.modules))
+
         logger.info("Loaded {}/{} cogs.".format(counter, len(self.modules)))
         return counter
+
+
+    ## Reloads the modules whose source files have changed, along with the modules that depend on them
+    def reload_changed(self):
+        changed = [entry for entry in self.modules.values() if entry.has_source_changed()]
+        if(not changed):
+            logger.debug("No modules have changed, nothing to reload.")
+            return 0
+
+        changed_names = set(entry.name for entry in changed)
+        counter = self._reload_modules(self._with_dependents(changed), changed_names)
+
+        logger.info("Reloaded {} module{} ({} changed: {}).".format(
+            counter,
+            "s" if counter != 1 else "",
+            len(changed),
+            ", ".join(sorted(changed_names))
+        ))
+        return counter
@@ -0,0 +1,143 @@
+import re
+from functools import lru_cache
+
+
+class Phonetics:
+    '''
+    Builds phonetic keys for words, so that words that sound alike (ex. 'jon maddn' and 'john madden') share the same
+    key. Based on Lawrence Philips' original Metaphone algorithm, which is far simpler than Double Metaphone, but works
+    well enough for the short english-ish words that make up phrase names and descriptions.
+    '''
+
+    ## Config
+    VOWELS = frozenset("AEIOU")
+    FRONT_VOWELS = frozenset("EIY")
+    SILENT_INITIAL_LETTER_PAIRS = ("AE", "GN", "KN", "PN", "WR")
+    NON_ALPHA_REGEX = re.compile(r"[^A-Z]")
+    CACHE_SIZE = 4096
+
+    @staticmethod
+    @lru_cache(maxsize=CACHE_SIZE)
+    def encode(word):
+        '''Returns the phonetic key for a single word, or an empty string if the word has no letters'''
+
+        word = Phonetics.NON_ALPHA_REGEX.sub("", word.upper())
+        if (not word):
+            return ""
+
+        ## Handle the special cases at the beginning of the word
+        if (word[:2] in Phonetics.SILENT_INITIAL_LETTER_PAIRS):
+            word = word[1:]
+        elif (word[0] == "X"):
+            word = "S" + word[1:]
+        elif (word[:2] == "WH"):
+            word = "W" + word[2:]
+
+        vowels = Phonetics.VOWELS
+        front_vowels = Phonetics.FRONT_VOWELS
+        length = len(word)
+        key = []
+
+        for index, char in enumerate(word):
+            previous = word[index - 1] if index > 0 else ""
+            following = word[index + 1] if index + 1 < length else ""
+            after_following = word[index + 2] if index + 2 < length else ""
+
+            ## Doubled letters only count once, except for C
+            if (char == previous and char != "C"):
+                continue
+
+            if (char in vowels):
+                if (index == 0):
+                    key.append(char)
+
+            elif (char == "B"):
+                ## Silent in a trailing 'MB', like 'dumb'
+                if (not (previous == "M" and following == "")):
+                    key.append("B")
+
+            elif (char == "C"):
+                if (following == "I" and after_following == "A"):
+                    key.append("X")
+                elif (following == "H"):
+                    key.append("K" if previous == "S" else "X")
+                elif (following in front_vowels):
+                    if (previous != "S"):
+                        key.append("S")
+                else:
+                    key.append("K")
+
+            elif (char == "D"):
+                if (following == "G" and after_following in front_vowels):
+                    key.append("J")
+                else:
+                    key.append("T")
+
+            elif (char == "G"):
+                if (following == "H" and after_following != "" and after_following not in vowels):
+                    continue
+                if (following == "N" and (after_following == "" or word[index + 1:] == "NED")):
+                    continue
+                if (previous == "D" and following in front_vowels):
+                    continue
+                key.append("J" if (following in front_vowels and previous != "G") else "K")
+
+            elif (char == "H"):
+                if (previous in "CSPTG" and previous != ""):
+                    continue
+                if (previous in vowels and previous != "" and following not in vowels):
+                    continue
+                key.append("H")
+
+            elif (char == "K"):
+                if (previous != "C"):
+                    key.append("K")
+
+            elif (char == "P"):
+                key.append("F" if following == "H" else "P")
+
+            elif (char == "Q"):
+                key.append("K")
+
+            elif (char == "S"):
+                if (following == "H" or (following == "I" and after_following in ("O", "A"))):
+                    key.append("X")
+                else:
+                    key.append("S")
+
+            elif (char == "T"):
+                if (following == "I" and after_following in ("O", "A")):
+                    key.append("X")
+                elif (following == "H"):
+                    key.append("0")
+                elif (not (following == "C" and after_following == "H")):
+                    key.append("T")
+
+            elif (char == "V"):
+                key.append("F")
+
+            elif (char in "WY"):
+                if (following in vowels and following != ""):
+                    key.append(char)
+
+            elif (char == "X"):
+                key.append("KS")
+
+            elif (char == "Z"):
+                key.append("S")
+
+            else:
+                ## F, J, L, M, N, R all map to themselves
+                key.append(char)
+
+        return "".join(key)
+
+
+    @staticmethod
+    def encode_all(words):
+        '''Returns the set of (non-empty) phonetic keys for the given words'''
+
+        keys = set(Phonetics.encode(word) for word in words)
+        keys.discard("")
+
+        return keys
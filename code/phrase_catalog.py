@@ -0,0 +1,412 @@
+import os
+import re
+import sys
+import json
+import mmap
+import struct
+import hashlib
+import logging
+
+import utilities
+
+## Config
+CONFIG_OPTIONS = utilities.load_config()
+
+## Logging
+logger = utilities.initialize_logging(logging.getLogger(__name__))
+
+
+class CatalogEntry:
+    '''
+    A single compiled phrase file inside of a PhraseCatalog. The compiled record is either held in memory (freshly
+    compiled), or left in the memory mapped catalog file until it's needed (offset and length).
+    '''
+
+    __slots__ = ("mtime_ns", "size", "hash", "offset", "length", "record")
+
+    def __init__(self, mtime_ns, size, file_hash, offset=None, length=None, record=None):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.hash = file_hash
+        self.offset = offset
+        self.length = length
+        self.record = record
+
+
+class PhraseCatalog:
+    '''
+    A compiled, memory mappable cache of the phrase files. The phrase json files are still the source of truth, but
+    each one only has to be read, validated and compiled when it changes. Unchanged files are detected with a stat()
+    call (falling back to a content hash), and their compiled records are pulled straight out of the catalog.
+
+    Compiled records are plain dicts that look like:
+        {"name": str, "key": str, "description": str, "phrases": [{"name", "message", "music", "description",
+        ("help"), ("brief")}, ...]}
+    where the phrases are sorted by name, and each phrase's description has already been made searchable.
+
+    The catalog file is laid out as: MAGIC | header length (uint32) | header json | record json...
+    '''
+
+    ## Keys
+    PHRASES_CATALOG_FILE_KEY = "phrases_catalog_file"
+    PHRASES_CATALOG_FILE_PATH_KEY = "phrases_catalog_file_path"
+    PHRASES_KEY = "phrases"
+    NAME_KEY = "name"
+    KEY_KEY = "key"
+    MESSAGE_KEY = "message"
+    IS_MUSIC_KEY = "music"
+    HELP_KEY = "help"
+    BRIEF_KEY = "brief"
+    DESCRIPTION_KEY = "description"
+
+    ## Defaults
+    PHRASES_CATALOG_FILE = CONFIG_OPTIONS.get(PHRASES_CATALOG_FILE_KEY, "phrases.catalog")
+    PHRASES_CATALOG_FILE_PATH = CONFIG_OPTIONS.get(
+        PHRASES_CATALOG_FILE_PATH_KEY,
+        os.sep.join([utilities.get_root_path(), PHRASES_CATALOG_FILE])
+    )
+
+    ## Config
+    MAGIC = b"HWKPHRS1"
+    CATALOG_VERSION = 1 # Bump this whenever the compiled record format changes
+    HEADER_LENGTH_STRUCT = struct.Struct("<I")
+    NON_LETTER_REGEX = re.compile(r"\W+")
+    WHITESPACE_REGEX = re.compile(r"\s")
+
+    ## Schemas, in the form of: key -> (type, is_required)
+    PHRASE_FILE_SCHEMA = {
+        NAME_KEY: (str, False),
+        KEY_KEY: (str, False),
+        DESCRIPTION_KEY: (str, False),
+        PHRASES_KEY: (list, True)
+    }
+    PHRASE_SCHEMA = {
+        NAME_KEY: (str, True),
+        MESSAGE_KEY: (str, True),
+        HELP_KEY: (str, False),
+        BRIEF_KEY: (str, False),
+        DESCRIPTION_KEY: (str, False),
+        IS_MUSIC_KEY: (bool, False)
+    }
+
+
+    def __init__(self, path=None):
+        self.path = path or self.PHRASES_CATALOG_FILE_PATH
+        self.entries = {}   # phrase file path -> CatalogEntry
+        self.is_dirty = False
+
+        self._file = None
+        self._mmap = None
+        self._records_offset = 0
+
+    ## Static Methods
+
+    @staticmethod
+    def scan(path_to_scan, extension):
+        '''Returns a sorted list of the paths to the phrase files inside of path_to_scan'''
+
+        return sorted(
+            os.sep.join([path_to_scan, file]) for file in os.listdir(path_to_scan) if file.endswith(extension)
+        )
+
+
+    @staticmethod
+    def hash_bytes(data):
+        return hashlib.sha1(data).hexdigest()
+
+
+    @staticmethod
+    def process_string_into_searchable(string):
+        '''(Attempt to) process a given string down into a searchable string'''
+
+        return PhraseCatalog.NON_LETTER_REGEX.sub(' ', string).lower()
+
+
+    @staticmethod
+    def validate(obj, schema):
+        '''Returns a list of the ways that obj (a dict) doesn't match the given schema. An empty list means it's valid.'''
+
+        if (not isinstance(obj, dict)):
+            return ["expected an object, got {}".format(type(obj).__name__)]
+
+        errors = []
+        for key, (expected_type, is_required) in schema.items():
+            if (key not in obj):
+                if (is_required):
+                    errors.append("missing required '{}'".format(key))
+            elif (not isinstance(obj[key], expected_type)):
+                errors.append("'{}' should be a {}, got {}".format(key, expected_type.__name__, type(obj[key]).__name__))
+
+        return errors
+
+
+    @staticmethod
+    def compile_phrase_file(path, data):
+        '''
+        Validates the parsed contents of a phrase file, and compiles them down into a record (see the class
+        docstring). Invalid phrases are skipped, and returned alongside the record in a list of error strings. Raises
+        ValueError if the file as a whole is invalid.
+        '''
+
+        errors = PhraseCatalog.validate(data, PhraseCatalog.PHRASE_FILE_SCHEMA)
+        if (errors):
+            raise ValueError("Invalid phrase file {}: {}".format(path, ", ".join(errors)))
+
+        name = data.get(PhraseCatalog.NAME_KEY, path.split(os.path.sep)[-1].split('.')[0])
+        record = {
+            PhraseCatalog.NAME_KEY: name,
+            PhraseCatalog.KEY_KEY: data.get(PhraseCatalog.KEY_KEY, name),
+            PhraseCatalog.DESCRIPTION_KEY: data.get(PhraseCatalog.DESCRIPTION_KEY, None),
+            PhraseCatalog.PHRASES_KEY: []
+        }
+
+        phrase_errors = []
+        for index, phrase_raw in enumerate(data[PhraseCatalog.PHRASES_KEY]):
+            errors = PhraseCatalog.validate(phrase_raw, PhraseCatalog.PHRASE_SCHEMA)
+            if (not errors):
+                phrase_name = phrase_raw[PhraseCatalog.NAME_KEY]
+                if (not phrase_name or PhraseCatalog.WHITESPACE_REGEX.search(phrase_name)):
+                    errors.append("'name' can't be empty or contain whitespace")
+            if (errors):
+                phrase_errors.append("{} phrase #{}: {}".format(path, index, ", ".join(errors)))
+                continue
+
+            phrase = {
+                PhraseCatalog.NAME_KEY: phrase_raw[PhraseCatalog.NAME_KEY],
+                PhraseCatalog.MESSAGE_KEY: phrase_raw[PhraseCatalog.MESSAGE_KEY],
+                PhraseCatalog.IS_MUSIC_KEY: phrase_raw.get(PhraseCatalog.IS_MUSIC_KEY, False)
+            }
+            for key in (PhraseCatalog.HELP_KEY, PhraseCatalog.BRIEF_KEY):
+                if (key in phrase_raw):
+                    phrase[key] = phrase_raw[key]
+
+            ## Attempt to populate the description, but if it isn't available, then try and parse the message down
+            ## into something usable instead.
+            if (PhraseCatalog.DESCRIPTION_KEY in phrase_raw):
+                phrase[PhraseCatalog.DESCRIPTION_KEY] = phrase_raw[PhraseCatalog.DESCRIPTION_KEY]
+            else:
+                phrase[PhraseCatalog.DESCRIPTION_KEY] = PhraseCatalog.process_string_into_searchable(
+                    phrase_raw[PhraseCatalog.MESSAGE_KEY]
+                )
+
+            record[PhraseCatalog.PHRASES_KEY].append(phrase)
+
+        record[PhraseCatalog.PHRASES_KEY].sort(key=lambda phrase: phrase[PhraseCatalog.NAME_KEY])
+
+        return record, phrase_errors
+
+    ## Methods
+
+    def load(self):
+        '''Memory maps the catalog file and reads its header. Records are only decoded when they're asked for.'''
+
+        self.close()
+        self.entries = {}
+        self.is_dirty = False
+
+        try:
+            self._file = open(self.path, 'rb')
+            if (os.fstat(self._file.fileno()).st_size == 0):
+                raise ValueError("Catalog is empty")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            magic_length = len(self.MAGIC)
+            if (self._mmap[:magic_length] != self.MAGIC):
+                raise ValueError("Catalog has an unknown format")
+
+            header_start = magic_length + self.HEADER_LENGTH_STRUCT.size
+            (header_length,) = self.HEADER_LENGTH_STRUCT.unpack(self._mmap[magic_length:header_start])
+            header = json.loads(self._mmap[header_start:header_start + header_length].decode("utf-8"))
+            if (header.get("version") != self.CATALOG_VERSION):
+                raise ValueError("Catalog version {} is out of date".format(header.get("version")))
+
+            self._records_offset = header_start + header_length
+            for path, (mtime_ns, size, file_hash, offset, length) in header.get("files", {}).items():
+                self.entries[path] = CatalogEntry(mtime_ns, size, file_hash, offset, length)
+        except FileNotFoundError:
+            self.close()
+        except Exception:
+            logger.exception("Unable to load phrase catalog at {}, it'll be rebuilt".format(self.path))
+            self.close()
+            self.entries = {}
+
+        logger.debug("Loaded {} compiled phrase file{} from the catalog".format(
+            len(self.entries), "s" if len(self.entries) != 1 else ""
+        ))
+        return len(self.entries)
+
+
+    def close(self):
+        if (self._mmap is not None):
+            self._mmap.close()
+            self._mmap = None
+        if (self._file is not None):
+            self._file.close()
+            self._file = None
+
+
+    def _read_raw_record(self, entry):
+        if (entry.record is not None):
+            return json.dumps(entry.record, separators=(',', ':')).encode("utf-8")
+
+        start = self._records_offset + entry.offset
+        return self._mmap[start:start + entry.length]
+
+
+    def _get_record(self, entry):
+        if (entry.record is not None):
+            return entry.record
+
+        return json.loads(self._read_raw_record(entry).decode("utf-8"))
+
+
+    def get_or_compile(self, path):
+        '''
+        Returns a (hash, record) tuple for the phrase file at path, compiling (and validating) the file only if it's
+        changed since it was last compiled.
+        '''
+
+        stat = os.stat(path)
+        entry = self.entries.get(path)
+        if (entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size):
+            return entry.hash, self._get_record(entry)
+
+        with open(path, 'rb') as fd:
+            data = fd.read()
+        file_hash = self.hash_bytes(data)
+
+        ## The file's been touched, but its contents are the same
+        if (entry is not None and entry.hash == file_hash):
+            entry.mtime_ns = stat.st_mtime_ns
+            entry.size = stat.st_size
+            self.is_dirty = True
+            return entry.hash, self._get_record(entry)
+
+        record, errors = self._compile_entry(path, stat, data, file_hash)
+        for error in errors:
+            logger.warning("Skipping invalid phrase: {}".format(error))
+
+        return file_hash, record
+
+
+    def _compile_entry(self, path, stat, data, file_hash):
+        record, errors = self.compile_phrase_file(path, json.loads(data.decode("utf-8")))
+
+        self.entries[path] = CatalogEntry(stat.st_mtime_ns, stat.st_size, file_hash, record=record)
+        self.is_dirty = True
+        logger.debug("Compiled phrase file: {}".format(path))
+
+        return record, errors
+
+
+    def prune(self, paths):
+        '''Removes the entries for any phrase files that aren't in paths'''
+
+        for path in [path for path in self.entries if path not in paths]:
+            del self.entries[path]
+            self.is_dirty = True
+
+
+    def save(self):
+        '''Writes the catalog out to disk (atomically) if anything's changed, and then memory maps the new catalog'''
+
+        if (not self.is_dirty):
+            return False
+
+        header_files = {}
+        records = []
+        offset = 0
+        for path, entry in self.entries.items():
+            raw_record = self._read_raw_record(entry)
+            header_files[path] = [entry.mtime_ns, entry.size, entry.hash, offset, len(raw_record)]
+            records.append(raw_record)
+            offset += len(raw_record)
+
+        header = json.dumps({"version": self.CATALOG_VERSION, "files": header_files}, separators=(',', ':')).encode("utf-8")
+
+        ## The old catalog has to be unmapped before it can be replaced on Windows
+        self.close()
+
+        temp_path = "{}.tmp".format(self.path)
+        try:
+            with open(temp_path, 'wb') as fd:
+                fd.write(self.MAGIC)
+                fd.write(self.HEADER_LENGTH_STRUCT.pack(len(header)))
+                fd.write(header)
+                for raw_record in records:
+                    fd.write(raw_record)
+            os.replace(temp_path, self.path)
+        except OSError:
+            logger.exception("Unable to save the phrase catalog to {}".format(self.path))
+            ## Keep the compiled records around in memory so nothing needs to be recompiled
+            for entry, raw_record in zip(self.entries.values(), records):
+                entry.record = json.loads(raw_record.decode("utf-8"))
+            return False
+
+        self.load()
+        return True
+
+
+    def update(self, phrases_folder_path, extension):
+        '''
+        Compiles any phrase files in the given folder that have changed since they were last compiled, and saves the
+        catalog. Files that can't be compiled are logged and left out.
+        '''
+
+        paths = self.scan(phrases_folder_path, extension)
+        for path in paths:
+            try:
+                self.get_or_compile(path)
+            except Exception:
+                logger.exception("Unable to compile phrase file: {}".format(path))
+
+        self.prune(paths)
+        self.save()
+
+
+    def compile(self, phrases_folder_path, extension):
+        '''Compiles every phrase file in the given folder, and saves the catalog. Returns a list of validation errors.'''
+
+        errors = []
+        paths = self.scan(phrases_folder_path, extension)
+        for path in paths:
+            ## Always recompile, so that every file gets revalidated
+            try:
+                stat = os.stat(path)
+                with open(path, 'rb') as fd:
+                    data = fd.read()
+                _, phrase_errors = self._compile_entry(path, stat, data, self.hash_bytes(data))
+                errors.extend(phrase_errors)
+            except Exception as e:
+                errors.append("{}: {}".format(path, e))
+
+        self.prune(paths)
+        self.save()
+
+        return errors
+
+
+if(__name__ == "__main__"):
+    ## Validates and compiles the phrase files, ex. 'python phrase_catalog.py [phrases folder]'
+    phrases_folder_path = CONFIG_OPTIONS.get(
+        "phrases_folder_path",
+        os.sep.join([utilities.get_root_path(), CONFIG_OPTIONS.get("phrases_folder", "phrases")])
+    )
+    if (len(sys.argv) > 1):
+        phrases_folder_path = sys.argv[1]
+
+    catalog = PhraseCatalog()
+    catalog.load()
+    compile_errors = catalog.compile(phrases_folder_path, CONFIG_OPTIONS.get("phrases_file_extension", "json"))
+    catalog.close()
+
+    for compile_error in compile_errors:
+        print(compile_error)
+    print("Compiled {} phrase file{} into {}, with {} error{}.".format(
+        len(catalog.entries),
+        "s" if len(catalog.entries) != 1 else "",
+        catalog.path,
+        len(compile_errors),
+        "s" if len(compile_errors) != 1 else ""
+    ))
+    sys.exit(1 if compile_errors else 0)
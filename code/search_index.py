@@ -0,0 +1,201 @@
+import re
+import heapq
+import logging
+
+import utilities
+from phonetics import Phonetics
+
+## Logging
+logger = utilities.initialize_logging(logging.getLogger(__name__))
+
+
+class SearchIndex:
+    '''
+    Inverted index over short text documents (phrase descriptions, command names, etc). Each document is stored under a
+    unique key, and is indexed by its whole word tokens as well as by the character n-grams of those tokens. Lookups
+    only touch the postings for the query's own terms, so they return a small set of likely candidates without
+    scanning every document. Candidates are meant to be reranked with a more expensive similarity metric afterwards.
+
+    Phonetic indexes also store each token's phonetic key (see Phonetics), so that sound-alike words can be matched
+    with a single hash lookup.
+    '''
+
+    ## Config
+    NGRAM_SIZE = 3
+    TOKEN_WEIGHT = 2.0
+    NGRAM_WEIGHT = 1.0
+    PHONETIC_WEIGHT = 1.5
+    NON_WORD_REGEX = re.compile(r"\W+")
+
+
+    def __init__(self, ngram_size=NGRAM_SIZE, phonetic=False):
+        self.ngram_size = ngram_size
+        self.phonetic = phonetic
+
+        self.documents = {}         # key -> tuple of the indexed field strings
+        self.token_postings = {}    # token -> set of keys
+        self.ngram_postings = {}    # ngram -> set of keys
+        self.phonetic_postings = {} # phonetic key -> set of keys
+        self._document_terms = {}   # key -> (tokens, ngrams, phonetic keys), kept so that documents can be removed cheaply
+
+    ## Magic Methods
+
+    def __len__(self):
+        return len(self.documents)
+
+
+    def __contains__(self, key):
+        return (key in self.documents)
+
+    ## Methods
+
+    def tokenize(self, string):
+        '''Splits a string into a set of lowercase word tokens'''
+
+        return set(token for token in self.NON_WORD_REGEX.split(string.lower()) if token)
+
+
+    def build_ngrams(self, tokens):
+        '''Builds the set of character n-grams for the given tokens. Tokens are padded so short words still index.'''
+
+        ngrams = set()
+        for token in tokens:
+            padded = " {} ".format(token)
+            for index in range(max(len(padded) - self.ngram_size + 1, 1)):
+                ngrams.add(padded[index:index + self.ngram_size])
+
+        return ngrams
+
+
+    def add(self, key, *fields):
+        '''Indexes the given text fields under key, replacing any document that was previously stored there'''
+
+        if (key in self.documents):
+            self.remove(key)
+
+        tokens = set()
+        for field in fields:
+            if (field):
+                tokens |= self.tokenize(field)
+        ngrams = self.build_ngrams(tokens)
+        phonetic_keys = Phonetics.encode_all(tokens) if self.phonetic else set()
+
+        for token in tokens:
+            self.token_postings.setdefault(token, set()).add(key)
+        for ngram in ngrams:
+            self.ngram_postings.setdefault(ngram, set()).add(key)
+        for phonetic_key in phonetic_keys:
+            self.phonetic_postings.setdefault(phonetic_key, set()).add(key)
+
+        self.documents[key] = fields
+        self._document_terms[key] = (tokens, ngrams, phonetic_keys)
+
+
+    def remove(self, key):
+        '''Removes the document stored under key from the index, if it exists'''
+
+        terms = self._document_terms.pop(key, None)
+        if (terms is None):
+            return False
+        del self.documents[key]
+
+        tokens, ngrams, phonetic_keys = terms
+        all_postings = (
+            (self.token_postings, tokens),
+            (self.ngram_postings, ngrams),
+            (self.phonetic_postings, phonetic_keys)
+        )
+        for postings, document_terms in all_postings:
+            for term in document_terms:
+                keys = postings.get(term)
+                if (keys is not None):
+                    keys.discard(key)
+                    if (not keys):
+                        del postings[term]
+
+        return True
+
+
+    def sync(self, documents):
+        '''
+        Incrementally brings the index in line with the supplied {key: (field, ...)} dict. Only documents that were
+        added, removed or whose fields changed are touched. Returns a tuple of the (added, removed, changed) keys.
+        '''
+
+        removed = [key for key in self.documents if key not in documents]
+        for key in removed:
+            self.remove(key)
+
+        added = []
+        changed = []
+        for key, fields in documents.items():
+            fields = tuple(fields)
+            existing = self.documents.get(key)
+            if (existing == fields):
+                continue
+
+            (changed if existing is not None else added).append(key)
+            self.add(key, *fields)
+
+        if (added or removed or changed):
+            logger.debug("Synced search index: {} added, {} removed, {} changed".format(
+                len(added), len(removed), len(changed)
+            ))
+
+        return added, removed, changed
+
+
+    def clear(self):
+        self.documents.clear()
+        self.token_postings.clear()
+        self.ngram_postings.clear()
+        self.phonetic_postings.clear()
+        self._document_terms.clear()
+
+
+    def get_phonetic_keys(self, key):
+        '''Returns the set of phonetic keys for the document stored under key'''
+
+        terms = self._document_terms.get(key)
+        if (terms is None):
+            return set()
+
+        return terms[2]
+
+
+    def phonetic_lookup(self, word):
+        '''Returns the set of keys for the documents containing a word that sounds like the given word'''
+
+        return self.phonetic_postings.get(Phonetics.encode(word), set())
+
+
+    def candidates(self, query, limit=None):
+        '''
+        Returns up to limit keys of the documents that share the most terms with the query, best first. Whole token
+        matches are weighted above sound-alike matches, which are weighted above partial n-gram matches that mostly
+        serve to catch typos.
+        '''
+
+        tokens = self.tokenize(query)
+        scores = {}
+
+        for token in tokens:
+            for key in self.token_postings.get(token, ()):
+                scores[key] = scores.get(key, 0) + self.TOKEN_WEIGHT
+
+        if (self.phonetic):
+            for phonetic_key in Phonetics.encode_all(tokens):
+                for key in self.phonetic_postings.get(phonetic_key, ()):
+                    scores[key] = scores.get(key, 0) + self.PHONETIC_WEIGHT
+
+        ngrams = self.build_ngrams(tokens)
+        if (ngrams):
+            ngram_weight = self.NGRAM_WEIGHT / len(ngrams)
+            for ngram in ngrams:
+                for key in self.ngram_postings.get(ngram, ()):
+                    scores[key] = scores.get(key, 0) + ngram_weight
+
+        if (limit is None or limit >= len(scores)):
+            return sorted(scores, key=scores.get, reverse=True)
+
+        return heapq.nlargest(limit, scores, key=scores.get)
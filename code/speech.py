@@ -10,7 +10,6 @@ from math import ceil
 
 import utilities
 import message_parser
-import dynamo_helper
 import exceptions
 
 import async_timeout
@@ -71,22 +70,27 @@ class TTSController:
         self.xvfb_prepend = kwargs.get(self.XVFB_PREPEND_KEY, self.XVFB_PREPEND)
         self.is_headless = kwargs.get(self.HEADLESS_KEY, self.HEADLESS)
 
-        self.paths_to_delete = []
+        ## Files that couldn't be deleted yet, see delete()
+        self.paths_to_delete = list(kwargs.get("paths_to_delete", []))
 
+        ## The output directory gets wiped out when the controller's built and when it's collected. Controllers that are
+        ## taking over from an old one (see Speech.get_reload_state) keep whatever audio is still waiting to be played.
+        self.owns_output_dir = True
         if(self.output_dir_path):
-            self._init_dir()
+            self._init_dir(kwargs.get("clean_output_dir", True))
 
         self.async_os = aioify(obj=os, name='async_os')
 
 
     def __del__(self):
-        self._init_dir()
+        if(self.owns_output_dir):
+            self._init_dir()
 
 
-    def _init_dir(self):
+    def _init_dir(self, clean=True):
         if(not os.path.exists(self.output_dir_path)):
             os.makedirs(self.output_dir_path)
-        else:
+        elif(clean):
             for root, dirs, files in os.walk(self.output_dir_path, topdown=False):
                 for file in files:
                     try:
@@ -200,14 +204,23 @@ class TTSController:
 
 
 class Speech(commands.Cog):
+    ## Module
+    MODULE_DEPENDENCIES = ["MessageParser", "AudioPlayer"]
 
-    def __init__(self, hawking):
+
+    def __init__(self, hawking, reload_state=None):
         self.hawking = hawking
 
         self.channel_timeout_phrases = CONFIG_OPTIONS.get('channel_timeout_phrases', [])
-        self.tts_controller = TTSController()
         self.message_parser = message_parser.MessageParser()
 
+        ## When being reloaded, take over the previous TTSController's output directory without wiping it out (along
+        ## with any audio that's still waiting to be played)
+        if (reload_state is not None):
+            self.tts_controller = TTSController(paths_to_delete=reload_state["paths_to_delete"], clean_output_dir=False)
+        else:
+            self.tts_controller = TTSController()
+
     ## Properties
 
     @property
@@ -216,6 +229,16 @@ class Speech(commands.Cog):
 
     ## Methods
 
+    def get_reload_state(self):
+        '''Returns the state to hand over to this cog's replacement when it's reloaded (see ModuleManager)'''
+
+        ## The replacement's TTSController takes over the output directory, so this one mustn't wipe it out when it's
+        ## collected
+        self.tts_controller.owns_output_dir = False
+
+        return {"paths_to_delete": list(self.tts_controller.paths_to_delete)}
+
+
     async def play_random_channel_timeout_message(self, server_state, callback):
         '''Channel timeout logic, picks an appropriate sign-off message and plays it'''
 
@@ -0,0 +1,236 @@
+import os
+import sys
+import time
+import atexit
+import logging
+import threading
+import contextlib
+import importlib.abc
+
+## Flag that turns on startup profiling (see hawking.py)
+PROFILE_STARTUP_FLAG = "--profile-startup"
+
+## Output files, which are written to Hawking's root
+REPORT_FILE = "startup_profile.txt"
+FOLDED_FILE = "startup_profile.folded"
+
+## The active StartupProfiler, if startup is being profiled (see install())
+_profiler = None
+
+
+class _TimingLoader(importlib.abc.Loader):
+    '''Wraps a module's loader, and times how long it takes to execute the module (ie. import it)'''
+
+    def __init__(self, profiler, loader, name):
+        self.profiler = profiler
+        self.loader = loader
+        self.name = name
+
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+
+    def create_module(self, spec):
+        create_module = getattr(self.loader, "create_module", None)
+        return create_module(spec) if create_module else None
+
+
+    def exec_module(self, module):
+        with self.profiler.measure("import {}".format(self.name)):
+            self.loader.exec_module(module)
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    '''Finds modules with the rest of the import system, and wraps their loaders with a _TimingLoader'''
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if (finder is self or not hasattr(finder, "find_spec")):
+                continue
+
+            spec = finder.find_spec(name, path, target)
+            if (spec is not None):
+                break
+        else:
+            return None
+
+        if (spec.loader is not None and hasattr(spec.loader, "exec_module")):
+            spec.loader = _TimingLoader(self.profiler, spec.loader, name)
+
+        return spec
+
+
+class StartupProfiler:
+    '''
+    Measures where the time goes while the bot starts up. Imports are timed automatically (by hooking into the import
+    system), and anything else can be timed with measure(). Measurements nest, so each one knows both its total time
+    and its self time (total time minus the time spent in the measurements inside of it). The results are written out
+    as a report sorted by self time, and as folded stacks that flamegraph.pl (or speedscope) can render.
+    '''
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.finder = _TimingFinder(self)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+        ## Name -> [count, total seconds, self seconds]
+        self.totals = {}
+        ## Folded stack -> self seconds
+        self.stacks = {}
+        ## (name, seconds since start) tuples, see mark()
+        self.marks = []
+        self.is_finished = False
+
+    ## Methods
+
+    def install(self):
+        sys.meta_path.insert(0, self.finder)
+        atexit.register(self.finish, "exit")
+
+
+    def uninstall(self):
+        if (self.finder in sys.meta_path):
+            sys.meta_path.remove(self.finder)
+
+
+    def _get_stack(self):
+        stack = getattr(self.local, "stack", None)
+        if (stack is None):
+            stack = self.local.stack = []
+            ## Keep work done on other threads (like building modules) separate from the main thread's
+            if (threading.current_thread() is not threading.main_thread()):
+                stack.append([threading.current_thread().name, 0, 0])
+
+        return stack
+
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        '''Times the code inside the with block, under the given name'''
+
+        stack = self._get_stack()
+        frame = [name, time.perf_counter(), 0]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            self_time = max(elapsed - frame[2], 0)
+            if (stack):
+                stack[-1][2] += elapsed
+
+            folded_stack = ";".join([entry[0] for entry in stack] + [name])
+            with self.lock:
+                totals = self.totals.setdefault(name, [0, 0, 0])
+                totals[0] += 1
+                totals[1] += elapsed
+                totals[2] += self_time
+                self.stacks[folded_stack] = self.stacks.get(folded_stack, 0) + self_time
+
+
+    def mark(self, name):
+        '''Records how long it's been since profiling started'''
+
+        self.marks.append((name, time.perf_counter() - self.start_time))
+
+
+    def build_report(self):
+        lines = ["Hawking startup profile"]
+        for name, seconds in self.marks:
+            lines.append("  {:<32} {:>10.1f} ms".format(name, seconds * 1000))
+
+        lines.append("")
+        lines.append("  {:>10} {:>10} {:>6}  {}".format("self ms", "total ms", "count", "name"))
+        with self.lock:
+            totals = sorted(self.totals.items(), key=lambda item: item[1][2], reverse=True)
+        for name, (count, total, self_time) in totals:
+            lines.append("  {:>10.2f} {:>10.2f} {:>6}  {}".format(self_time * 1000, total * 1000, count, name))
+
+        return "\n".join(lines) + "\n"
+
+
+    def build_folded_stacks(self):
+        ## Folded stacks use integer sample counts, so use microseconds
+        with self.lock:
+            stacks = sorted(self.stacks.items())
+
+        return "".join(
+            "{} {}\n".format(stack.replace(" ", "_"), int(seconds * 1000000))
+            for stack, seconds in stacks if seconds >= 0.000001
+        )
+
+
+    def finish(self, mark_name="finished", output_dir_path=None):
+        '''Stops profiling, and writes out the report and folded stacks. Returns the report's path.'''
+
+        if (self.is_finished):
+            return None
+        self.is_finished = True
+
+        self.mark(mark_name)
+        self.uninstall()
+
+        if (output_dir_path is None):
+            output_dir_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+        report_path = os.path.sep.join([output_dir_path, REPORT_FILE])
+        with open(report_path, "w") as fd:
+            fd.write(self.build_report())
+        with open(os.path.sep.join([output_dir_path, FOLDED_FILE]), "w") as fd:
+            fd.write(self.build_folded_stacks())
+
+        ## Imported here so that setting up the config and logging isn't left out of the profile
+        import utilities
+        logger = utilities.initialize_logging(logging.getLogger(__name__))
+        logger.info("Wrote startup profile to {}".format(report_path))
+        return report_path
+
+
+def install():
+    '''Starts profiling the startup, including every import from here on out'''
+
+    global _profiler
+
+    if (_profiler is None):
+        _profiler = StartupProfiler()
+        _profiler.install()
+
+    return _profiler
+
+
+def is_profiling():
+    return (_profiler is not None and not _profiler.is_finished)
+
+
+@contextlib.contextmanager
+def _measure_nothing():
+    ## contextlib.nullcontext() isn't available until Python 3.7
+    yield
+
+
+def measure(name):
+    '''Times the code inside the with block if startup is being profiled, and does nothing otherwise'''
+
+    if (not is_profiling()):
+        return _measure_nothing()
+
+    return _profiler.measure(name)
+
+
+def mark(name):
+    if (is_profiling()):
+        _profiler.mark(name)
+
+
+def finish(mark_name="finished"):
+    if (is_profiling()):
+        return _profiler.finish(mark_name)
+
+    return None
@@ -10,29 +10,242 @@ class StringSimilarity:
     ## https://stackoverflow.com/questions/17388213/find-the-similarity-metric-between-two-strings
     ## https://stackoverflow.com/questions/6690739/fuzzy-string-comparison-in-python-confused-with-which-library-to-use
 
+    ## Keys
+    STRING_SIMILARITY_ALGORITHM_KEY = "string_similarity_algorithm"
+
+    ## Algorithms
+    JARO_WINKLER = "jaro-winkler"
+    DAMERAU_LEVENSHTEIN = "damerau-levenshtein"
+    DIFFLIB = "difflib"
+
+    ## Config
+    WINKLER_PREFIX_LENGTH = 4
+    WINKLER_SCALING_FACTOR = 0.1
+    WINKLER_BOOST_THRESHOLD = 0.7
+    BIT_PARALLEL_MAX_LENGTH = 64    # Queries longer than this fall back to the dynamic programming implementation
+
+    ## The configured algorithm, looked up once rather than on every comparison (see _update_algorithm)
+    algorithm = None
+
     @staticmethod
-    def _calcJaroWinkleDistance(stringA, stringB):
-        raise NotImplementedError(
-            "Jaro-Winkle distance calculation hasn't been implemented. Use difflib implementation"
-        )
+    def _update_algorithm(changed_keys=None):
+        ## Tolerate the en dash that older configs used for damerau–levenshtein
+        algorithm = CONFIG_OPTIONS.get_str(StringSimilarity.STRING_SIMILARITY_ALGORITHM_KEY, "")
+        StringSimilarity.algorithm = algorithm.replace("–", "-").lower()
+
 
     @staticmethod
-    def _calcDamerauLevenshteinDistance(stringA, stringB):
-        raise NotImplementedError(
-            "Damerau-Levenshtein distance calculation hasn't been implemented. Use difflib implementation"
-        )
+    def _build_position_map(string):
+        '''Maps each character in the string to the (ascending) list of indexes that it appears at'''
+
+        positions = {}
+        for index, char in enumerate(string):
+            positions.setdefault(char, []).append(index)
+
+        return positions
+
+
+    @staticmethod
+    def _calcJaroWinkleDistance(stringA, stringB, positionsB=None):
+        '''
+        Jaro-Winkler similarity between 0 and 1. The optional positionsB (see _build_position_map) lets a preprocessed
+        stringB be reused across many comparisons.
+        '''
+
+        if (stringA == stringB):
+            return 1.0
+
+        lengthA = len(stringA)
+        lengthB = len(stringB)
+        if (lengthA == 0 or lengthB == 0):
+            return 0.0
+
+        if (positionsB is None):
+            positionsB = StringSimilarity._build_position_map(stringB)
+
+        ## Characters only match if they're within this many positions of each other
+        window = max(max(lengthA, lengthB) // 2 - 1, 0)
+        matchedB = [False] * lengthB
+        matchesA = []
+        for indexA, char in enumerate(stringA):
+            low = indexA - window
+            high = indexA + window
+            for indexB in positionsB.get(char, ()):
+                if (indexB > high):
+                    break
+                if (indexB >= low and not matchedB[indexB]):
+                    matchedB[indexB] = True
+                    matchesA.append(char)
+                    break
+
+        matches = len(matchesA)
+        if (matches == 0):
+            return 0.0
+
+        ## Count the matched characters that are out of order (each transposition is counted twice)
+        matchesB = [char for char, matched in zip(stringB, matchedB) if matched]
+        transpositions = sum(1 for charA, charB in zip(matchesA, matchesB) if charA != charB) // 2
+
+        jaro = (matches / lengthA + matches / lengthB + (matches - transpositions) / matches) / 3
+        if (jaro <= StringSimilarity.WINKLER_BOOST_THRESHOLD):
+            return jaro
+
+        ## Boost strings that share a common prefix
+        prefix = 0
+        for charA, charB in zip(stringA[:StringSimilarity.WINKLER_PREFIX_LENGTH], stringB):
+            if (charA != charB):
+                break
+            prefix += 1
+
+        return jaro + prefix * StringSimilarity.WINKLER_SCALING_FACTOR * (1 - jaro)
+
+
+    @staticmethod
+    def _build_pattern_masks(string):
+        '''Builds the per-character match bitmasks used by the bit-parallel edit distance'''
+
+        masks = {}
+        for index, char in enumerate(string):
+            masks[char] = masks.get(char, 0) | (1 << index)
+
+        return masks
+
+
+    @staticmethod
+    def _calcBitParallelDistance(pattern, pattern_masks, text):
+        '''
+        Hyyrö's bit-parallel extension of Myers' algorithm for the restricted Damerau-Levenshtein (optimal string
+        alignment) distance. Each character of text is processed in a handful of integer operations.
+        '''
+
+        length = len(pattern)
+        if (length == 0):
+            return len(text)
+
+        full_mask = (1 << length) - 1
+        last_bit = 1 << (length - 1)
+        vertical_positive = full_mask
+        vertical_negative = 0
+        diagonal_zero = 0
+        previous_match = 0
+        distance = length
+
+        for char in text:
+            match = pattern_masks.get(char, 0)
+            transposition = (((~diagonal_zero) & match) << 1) & previous_match
+            diagonal_zero = (((match & vertical_positive) + vertical_positive) ^ vertical_positive) | match | \
+                vertical_negative | transposition
+            horizontal_positive = vertical_negative | ~(diagonal_zero | vertical_positive)
+            horizontal_negative = diagonal_zero & vertical_positive
+
+            if (horizontal_positive & last_bit):
+                distance += 1
+            elif (horizontal_negative & last_bit):
+                distance -= 1
+
+            horizontal_positive = (horizontal_positive << 1) | 1
+            horizontal_negative = horizontal_negative << 1
+            vertical_positive = (horizontal_negative | ~(diagonal_zero | horizontal_positive)) & full_mask
+            vertical_negative = diagonal_zero & horizontal_positive & full_mask
+            diagonal_zero &= full_mask
+            previous_match = match
+
+        return distance
+
+
+    @staticmethod
+    def _calcOptimalStringAlignmentDistance(stringA, stringB):
+        '''Dynamic programming restricted Damerau-Levenshtein distance, used for strings too long to bit-pack'''
+
+        lengthB = len(stringB)
+        previous_previous = None
+        previous = list(range(lengthB + 1))
+        for indexA in range(1, len(stringA) + 1):
+            charA = stringA[indexA - 1]
+            current = [indexA] + [0] * lengthB
+            for indexB in range(1, lengthB + 1):
+                charB = stringB[indexB - 1]
+                cost = 0 if charA == charB else 1
+                current[indexB] = min(previous[indexB] + 1, current[indexB - 1] + 1, previous[indexB - 1] + cost)
+
+                if (indexA > 1 and indexB > 1 and charA == stringB[indexB - 2] and stringA[indexA - 2] == charB):
+                    current[indexB] = min(current[indexB], previous_previous[indexB - 2] + 1)
+
+            previous_previous, previous = previous, current
+
+        return previous[lengthB]
+
+
+    @staticmethod
+    def _calcDamerauLevenshteinDistance(stringA, stringB, patternB_masks=None):
+        '''
+        Damerau-Levenshtein (optimal string alignment) similarity between 0 and 1. The optional patternB_masks (see
+        _build_pattern_masks) lets a preprocessed stringB be reused across many comparisons.
+        '''
+
+        longest = max(len(stringA), len(stringB))
+        if (longest == 0):
+            return 1.0
+
+        if (len(stringB) <= StringSimilarity.BIT_PARALLEL_MAX_LENGTH):
+            if (patternB_masks is None):
+                patternB_masks = StringSimilarity._build_pattern_masks(stringB)
+            distance = StringSimilarity._calcBitParallelDistance(stringB, patternB_masks, stringA)
+        else:
+            distance = StringSimilarity._calcOptimalStringAlignmentDistance(stringA, stringB)
+
+        return 1 - (distance / longest)
+
 
     @staticmethod
     def _calcDifflibDistance(stringA, stringB):
         return SequenceMatcher(None, stringA, stringB).ratio()
 
+
     @staticmethod
     def similarity(stringA, stringB):
-        similarity_algorithm = CONFIG_OPTIONS.get("string_similarity_algorithm")
+        similarity_algorithm = StringSimilarity.algorithm
 
-        if (similarity_algorithm == "jaro-winkler"):
+        if (similarity_algorithm == StringSimilarity.JARO_WINKLER):
             return StringSimilarity._calcJaroWinkleDistance(stringA, stringB)
-        elif (similarity_algorithm == "damerau–levenshtein"):
+        elif (similarity_algorithm == StringSimilarity.DAMERAU_LEVENSHTEIN):
             return StringSimilarity._calcDamerauLevenshteinDistance(stringA, stringB)
         else:
-            return StringSimilarity._calcDifflibDistance(stringA, stringB)
\ No newline at end of file
+            return StringSimilarity._calcDifflibDistance(stringA, stringB)
+
+
+    @staticmethod
+    def similarity_many(query, candidates):
+        '''
+        Scores every candidate against the query, and returns the scores in the same order as the candidates. The
+        query is only preprocessed once, so this is much cheaper than calling similarity(candidate, query) in a loop.
+        '''
+
+        similarity_algorithm = StringSimilarity.algorithm
+
+        if (similarity_algorithm == StringSimilarity.JARO_WINKLER):
+            positions = StringSimilarity._build_position_map(query)
+            return [StringSimilarity._calcJaroWinkleDistance(candidate, query, positions) for candidate in candidates]
+
+        elif (similarity_algorithm == StringSimilarity.DAMERAU_LEVENSHTEIN):
+            masks = StringSimilarity._build_pattern_masks(query)
+            return [
+                StringSimilarity._calcDamerauLevenshteinDistance(candidate, query, masks) for candidate in candidates
+            ]
+
+        else:
+            ## SequenceMatcher caches its analysis of the second sequence, so keep the query there
+            matcher = SequenceMatcher(None)
+            matcher.set_seq2(query)
+
+            scores = []
+            for candidate in candidates:
+                matcher.set_seq1(candidate)
+                scores.append(matcher.ratio())
+
+            return scores
+
+
+## Keep the algorithm up to date with the config
+StringSimilarity._update_algorithm()
+CONFIG_OPTIONS.subscribe(StringSimilarity.STRING_SIMILARITY_ALGORITHM_KEY, StringSimilarity._update_algorithm)
@@ -0,0 +1,131 @@
+import os
+import wave
+import logging
+import tempfile
+
+import numpy
+
+import utilities
+
+## Config
+CONFIG_OPTIONS = utilities.load_config()
+
+## Logging
+logger = utilities.initialize_logging(logging.getLogger(__name__))
+
+
+class ToneSynthesizer:
+    '''
+    Synthesizes tones straight into a 16 bit PCM buffer, rather than asking the TTS engine to do it. Each voice is a
+    sequence of notes, given as flat arrays of pitches (in Hz) and durations (in milliseconds), with a mask of which
+    notes are rests (see Music._compile_notes). Tones are built from a handful of harmonics, dropping any that would
+    land above the Nyquist frequency so they don't alias, and each note gets a short attack and release so that notes
+    don't click into each other. Chords and polyphony are just multiple voices summed together.
+    '''
+
+    ## Keys
+    SAMPLE_RATE_KEY = "tone_sample_rate"
+    HARMONICS_KEY = "tone_harmonics"
+    ATTACK_MS_KEY = "tone_attack_ms"
+    RELEASE_MS_KEY = "tone_release_ms"
+    VOLUME_KEY = "tone_volume"
+
+    ## Defaults
+    SAMPLE_RATE = CONFIG_OPTIONS.get(SAMPLE_RATE_KEY, 48000)
+    HARMONICS = CONFIG_OPTIONS.get(HARMONICS_KEY, 4)
+    ATTACK_MS = CONFIG_OPTIONS.get(ATTACK_MS_KEY, 5)
+    RELEASE_MS = CONFIG_OPTIONS.get(RELEASE_MS_KEY, 20)
+    VOLUME = CONFIG_OPTIONS.get(VOLUME_KEY, 0.5)
+
+    ## Config
+    SAMPLE_WIDTH = 2    # 16 bit PCM
+    MAX_AMPLITUDE = 32767
+
+
+    def __init__(self, **kwargs):
+        self.sample_rate = int(kwargs.get(self.SAMPLE_RATE_KEY, self.SAMPLE_RATE))
+        self.harmonics = max(int(kwargs.get(self.HARMONICS_KEY, self.HARMONICS)), 1)
+        self.attack_ms = float(kwargs.get(self.ATTACK_MS_KEY, self.ATTACK_MS))
+        self.release_ms = float(kwargs.get(self.RELEASE_MS_KEY, self.RELEASE_MS))
+        self.volume = min(max(float(kwargs.get(self.VOLUME_KEY, self.VOLUME)), 0.0), 1.0)
+
+        ## Harmonic amplitudes fall off as 1/k, normalized so a full set of harmonics peaks at roughly 1.0
+        self.harmonic_amplitudes = 1 / numpy.arange(1, self.harmonics + 1)
+        self.harmonic_amplitudes /= self.harmonic_amplitudes.sum()
+
+    ## Methods
+
+    def render_voice(self, pitches, milliseconds, is_rest=None):
+        '''Renders a single voice into an array of float samples between -1.0 and 1.0'''
+
+        pitches = numpy.asarray(pitches, dtype=numpy.float64)
+        lengths = (numpy.asarray(milliseconds, dtype=numpy.float64) * self.sample_rate / 1000).astype(numpy.int64)
+        lengths = numpy.maximum(lengths, 0)
+        total_length = int(lengths.sum())
+        if (total_length == 0):
+            return numpy.zeros(0, dtype=numpy.float64)
+
+        ## Expand the per note values out to per sample values
+        frequencies = numpy.repeat(pitches, lengths)
+        starts = numpy.cumsum(lengths) - lengths
+        positions = numpy.arange(total_length) - numpy.repeat(starts, lengths)
+        remaining = numpy.repeat(lengths, lengths) - positions
+
+        ## Accumulate the phase, so that the waveform stays continuous between notes
+        phases = numpy.cumsum(frequencies * (2 * numpy.pi / self.sample_rate))
+
+        nyquist = self.sample_rate / 2
+        samples = numpy.zeros(total_length, dtype=numpy.float64)
+        for harmonic, amplitude in enumerate(self.harmonic_amplitudes, start=1):
+            audible = (frequencies * harmonic) < nyquist
+            if (not audible.any()):
+                break
+            samples += numpy.where(audible, numpy.sin(phases * harmonic) * amplitude, 0.0)
+
+        ## Simple linear attack and release envelope for each note
+        attack_samples = max(self.attack_ms * self.sample_rate / 1000, 1)
+        release_samples = max(self.release_ms * self.sample_rate / 1000, 1)
+        envelope = numpy.minimum(1.0, numpy.minimum((positions + 1) / attack_samples, remaining / release_samples))
+        samples *= envelope
+
+        ## Silence the rests
+        if (is_rest is not None):
+            samples[numpy.repeat(numpy.asarray(is_rest, dtype=bool), lengths)] = 0.0
+
+        return samples
+
+
+    def mix(self, voices):
+        '''Sums the given voices (arrays of float samples) into 16 bit PCM samples, scaling them down if they'd clip'''
+
+        length = max((len(voice) for voice in voices), default=0)
+        mixed = numpy.zeros(length, dtype=numpy.float64)
+        for voice in voices:
+            mixed[:len(voice)] += voice
+
+        peak = numpy.abs(mixed).max() if length else 0.0
+        if (peak > 1.0):
+            mixed /= peak
+
+        return (mixed * (self.volume * self.MAX_AMPLITUDE)).astype(numpy.int16)
+
+
+    def render(self, voices):
+        '''Renders a list of (pitches, milliseconds, is_rest) voices into 16 bit PCM samples'''
+
+        return self.mix([self.render_voice(*voice) for voice in voices])
+
+
+    def save(self, samples, output_dir_path):
+        '''Writes the given 16 bit PCM samples into a new mono .wav file inside output_dir_path, and returns its path'''
+
+        file_descriptor, file_path = tempfile.mkstemp(suffix=".wav", dir=output_dir_path)
+        with os.fdopen(file_descriptor, "wb") as file:
+            with wave.open(file, "wb") as wav_file:
+                wav_file.setnchannels(1)
+                wav_file.setsampwidth(self.SAMPLE_WIDTH)
+                wav_file.setframerate(self.sample_rate)
+                wav_file.writeframes(samples.astype("<i2").tobytes())
+
+        logger.debug("Saved {} samples of synthesized tones to {}".format(len(samples), file_path))
+        return file_path
@@ -0,0 +1,167 @@
+import time
+import base64
+import logging
+import threading
+from collections import Counter
+
+import utilities
+
+## Config
+CONFIG_OPTIONS = utilities.load_config()
+
+## Logging
+logger = utilities.initialize_logging(logging.getLogger(__name__))
+
+
+class UsageCounters:
+    '''
+    Rolling, in-memory usage counters keyed by (command, guild, hour, is_valid). Rather than writing a row for every
+    command, the counters are periodically flushed as compact aggregate rows (one per key, with a count), which is
+    what analytics end up being queried for anyway. The counters also keep a short history of per-command totals, so
+    the currently popular commands (see get_hot_commands) are available to the rest of the bot.
+    '''
+
+    ## Keys
+    FLUSH_INTERVAL_SECONDS_KEY = "analytics_aggregate_flush_interval_seconds"
+    RANKING_WINDOW_HOURS_KEY = "analytics_ranking_window_hours"
+    BOTO_PRIMARY_KEY_KEY = "boto_primary_key"
+
+    ## Defaults
+    FLUSH_INTERVAL_SECONDS = CONFIG_OPTIONS.get(FLUSH_INTERVAL_SECONDS_KEY, 300)
+    RANKING_WINDOW_HOURS = CONFIG_OPTIONS.get(RANKING_WINDOW_HOURS_KEY, 24)
+    BOTO_PRIMARY_KEY = CONFIG_OPTIONS.get(BOTO_PRIMARY_KEY_KEY, "QueryId")
+
+    ## Config
+    MILLISECONDS_PER_HOUR = 60 * 60 * 1000
+
+
+    def __init__(self, **kwargs):
+        self.flush_interval_seconds = float(kwargs.get(self.FLUSH_INTERVAL_SECONDS_KEY, self.FLUSH_INTERVAL_SECONDS))
+        self.ranking_window_hours = max(int(kwargs.get(self.RANKING_WINDOW_HOURS_KEY, self.RANKING_WINDOW_HOURS)), 1)
+        self.primary_key_name = kwargs.get(self.BOTO_PRIMARY_KEY_KEY, self.BOTO_PRIMARY_KEY)
+
+        ## Counts that haven't been flushed yet, keyed by (command, guild_id, hour, is_valid)
+        self.counters = Counter()
+        ## Per command totals for each of the recent hours, keyed by hour
+        self.hourly_totals = {}
+        self.lock = threading.Lock()
+
+        self.thread = None
+        self.stopping = threading.Event()
+
+    ## Properties
+
+    @property
+    def is_running(self):
+        return (self.thread is not None and self.thread.is_alive())
+
+    ## Methods
+
+    def record(self, command, guild_id, timestamp, is_valid):
+        '''Counts a single invocation of a command, at the given timestamp (in milliseconds)'''
+
+        hour = int(timestamp // self.MILLISECONDS_PER_HOUR)
+
+        with self.lock:
+            ## Only keep the counts around if they're actually going to be flushed somewhere
+            if (self.thread is not None):
+                self.counters[(command, guild_id, hour, bool(is_valid))] += 1
+
+            hourly_total = self.hourly_totals.get(hour)
+            if (hourly_total is None):
+                hourly_total = self.hourly_totals[hour] = Counter()
+                self._prune_hourly_totals(hour)
+            hourly_total[command] += 1
+
+
+    def _prune_hourly_totals(self, current_hour):
+        oldest_hour = current_hour - self.ranking_window_hours
+        for hour in [hour for hour in self.hourly_totals if hour <= oldest_hour]:
+            del self.hourly_totals[hour]
+
+
+    def get_hot_commands(self, count=10, predicate=None):
+        '''
+        Returns a list of up to count (command, uses) tuples for the most used commands over the ranking window, most
+        used first. If a predicate is given, only commands that satisfy it are ranked.
+        '''
+
+        oldest_hour = int(time.time() * 1000 // self.MILLISECONDS_PER_HOUR) - self.ranking_window_hours
+        totals = Counter()
+        with self.lock:
+            for hour, hourly_total in self.hourly_totals.items():
+                if (hour > oldest_hour):
+                    totals.update(hourly_total)
+
+        if (predicate):
+            totals = Counter({command: uses for command, uses in totals.items() if predicate(command)})
+
+        return totals.most_common(count)
+
+
+    def drain(self):
+        '''Returns the counts recorded since the last drain as a list of aggregate items (dicts), and resets them'''
+
+        with self.lock:
+            counters = self.counters
+            self.counters = Counter()
+
+        flushed_at = int(time.time() * 1000)
+        items = []
+        for (command, guild_id, hour, is_valid), count in counters.items():
+            item = {
+                "command": command,
+                "server_id": guild_id,
+                "timestamp": hour * self.MILLISECONDS_PER_HOUR,
+                "is_valid": is_valid,
+                "count": count,
+                "flushed_at": flushed_at
+            }
+            ## The same key can be flushed more than once in an hour, so the flush time is part of the primary key
+            concatenated = "{}{}{}{}{}".format(command, guild_id, hour, is_valid, flushed_at)
+            item[self.primary_key_name] = base64.b64encode(bytes(concatenated, "utf-8")).decode("utf-8")
+            items.append(item)
+
+        return items
+
+
+    def start(self, callback):
+        '''Starts periodically draining the counters, and passing the aggregate items to the callback'''
+
+        if (self.is_running):
+            return
+
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._run, args=(callback,), name="UsageCounters", daemon=True)
+        self.thread.start()
+
+
+    def stop(self, timeout=None):
+        '''Stops the periodic draining, after draining any remaining counts one last time'''
+
+        if (not self.is_running):
+            return
+
+        self.stopping.set()
+        self.thread.join(timeout)
+        self.thread = None
+
+
+    def _run(self, callback):
+        while (not self.stopping.wait(self.flush_interval_seconds)):
+            self._flush(callback)
+
+        self._flush(callback)
+
+
+    def _flush(self, callback):
+        items = self.drain()
+        if (not items):
+            return
+
+        try:
+            callback(items)
+        except Exception:
+            logger.exception("Unable to flush {} aggregate usage counts".format(len(items)))
+        else:
+            logger.debug("Flushed {} aggregate usage counts".format(len(items)))
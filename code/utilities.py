@@ -1,10 +1,15 @@
 import os
 import sys
 import json
+import asyncio
 import logging
 import pathlib
+import threading
 from logging.handlers import RotatingFileHandler
 
+import configuration
+from log_pipeline import LogPipeline
+
 ## Config
 CONFIG_OPTIONS = {}         # This'll be populated on import
 DEBUG_LEVEL_KEY = "debug_level"
@@ -12,6 +17,11 @@ CONFIG_NAME = "config.json"	# The name of the config file
 DIRS_FROM_ROOT = 1			# How many directories away this script is from the root
 PLATFORM = sys.platform
 
+## Logging
+LOG_FORMAT = "%(asctime)s - %(module)s - %(funcName)s - %(levelname)s - %(message)s"
+LOG_PIPELINE = None         # The process-wide LogPipeline, see get_log_pipeline()
+LOG_PIPELINE_LOCK = threading.Lock()
+
 
 def get_root_path():
 	## -1 includes this script itself in the realpath
@@ -24,7 +34,8 @@ def load_json(path):
 
 
 def load_config():
-	return load_json(os.sep.join([get_root_path(), CONFIG_NAME]))
+    ## The config is only read and parsed once, everything else shares the same Configuration
+    return configuration.get_config(os.sep.join([get_root_path(), CONFIG_NAME]))
 
 
 def is_linux():
@@ -35,10 +46,51 @@ def is_windows():
     return ("win" in PLATFORM)
 
 
+def get_all_tasks(loop):
+    ## asyncio.all_tasks() was added in Python 3.7, and Task.all_tasks() was removed in 3.9
+    if (hasattr(asyncio, "all_tasks")):
+        return asyncio.all_tasks(loop)
+
+    return asyncio.Task.all_tasks(loop)
+
+
+def get_log_pipeline():
+    '''Returns the process-wide LogPipeline, setting it up on first use'''
+
+    global LOG_PIPELINE
+
+    with LOG_PIPELINE_LOCK:
+        if (LOG_PIPELINE is not None):
+            return LOG_PIPELINE
+
+        formatter = logging.Formatter(LOG_FORMAT)
+
+        ## Get the directory containing the logs and make sure it exists, creating it if it doesn't
+        log_path = CONFIG_OPTIONS.get("log_path")
+        if (not log_path):
+            log_path = os.path.sep.join([get_root_path(), "logs"]) # Default logs to a 'logs' folder inside the hawking directory
+
+        pathlib.Path(log_path).mkdir(parents=True, exist_ok=True)    # Basically a mkdir -p $log_path
+        log_file = os.path.sep.join([log_path, "hawking.log"])   # Build the true path to the log file
+
+        ## Setup the rotating log handler, and the console handler. Both are only ever written to by the pipeline's thread.
+        max_bytes = CONFIG_OPTIONS.get("log_max_bytes", 1024 * 1024 * 10)   # 10 MB
+        backup_count = CONFIG_OPTIONS.get("log_backup_count", 10)
+        rotating_log_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count)
+        rotating_log_handler.setFormatter(formatter)
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+
+        LOG_PIPELINE = LogPipeline(
+            [rotating_log_handler, console_handler],
+            CONFIG_OPTIONS.get_int("log_max_queued_records", 10000),
+            CONFIG_OPTIONS.get("log_sample_rates", {})
+        )
+        return LOG_PIPELINE
+
+
 def initialize_logging(logger):
-    FORMAT = "%(asctime)s - %(module)s - %(funcName)s - %(levelname)s - %(message)s"
-    formatter = logging.Formatter(FORMAT)
-    logging.basicConfig(format=FORMAT)
+    logging.basicConfig(format=LOG_FORMAT)
 
     log_level = str(CONFIG_OPTIONS.get("log_level", "DEBUG"))
     if (log_level == "DEBUG"):
@@ -54,21 +106,7 @@ def initialize_logging(logger):
     else:
         logger.setLevel(logging.DEBUG)
 
-    ## Get the directory containing the logs and make sure it exists, creating it if it doesn't
-    log_path = CONFIG_OPTIONS.get("log_path")
-    if (not log_path):
-        log_path = os.path.sep.join([get_root_path(), "logs"]) # Default logs to a 'logs' folder inside the hawking directory
-
-    pathlib.Path(log_path).mkdir(parents=True, exist_ok=True)    # Basically a mkdir -p $log_path
-    log_file = os.path.sep.join([log_path, "hawking.log"])   # Build the true path to the log file
-
-    ## Setup and add the rotating log handler to the logger
-    max_bytes = CONFIG_OPTIONS.get("log_max_bytes", 1024 * 1024 * 10)   # 10 MB
-    backup_count = CONFIG_OPTIONS.get("log_backup_count", 10)
-    rotating_log_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count)
-    rotating_log_handler.setFormatter(formatter)
-    logger.addHandler(rotating_log_handler)
-
-    return logger
+    ## Every logger shares the one queue backed pipeline, so writing to the log never blocks the caller
+    return get_log_pipeline().attach(logger)
 
 CONFIG_OPTIONS = load_config()
@@ -11,6 +11,10 @@ logger = utilities.initialize_logging(logging.getLogger(__name__))
 
 
 class Fortune(commands.Cog):
+    ## Module. It's rarely used, so it isn't loaded until someone first asks for their fortune.
+    MODULE_DEPENDENCIES = ["Speech"]
+    MODULE_IS_OPTIONAL = True
+
     ## Defaults
     FORTUNES = [
         ## Positive
@@ -1,11 +1,11 @@
 import re
 import math
-import random
 import logging
-from collections import OrderedDict
+
+import numpy
 
 import utilities
-import dynamo_helper
+from tone_synthesizer import ToneSynthesizer
 from discord.ext import commands
 
 ## Config
@@ -16,244 +16,92 @@ logger = utilities.initialize_logging(logging.getLogger(__name__))
 
 
 class Note:
-    def __init__(self, beat_length, duration, note, sharp=False, octave=4, sub_notes=[]):
+    ## Songs can have thousands of notes, so keep them compact
+    __slots__ = ("beat_length", "duration", "note", "sharp", "octave")
+
+    def __init__(self, beat_length, duration, note, sharp=False, octave=4):
         self.beat_length = beat_length
         self.duration = duration
         self.note = note
         self.sharp = sharp
         self.octave = octave
-        self.sub_notes = sub_notes
-
-        self.dynamo_db = dynamo_helper.DynamoHelper()
 
 
     def __str__(self):
-        return "{}{}{} {}*{} [{}]".format(
+        return "{}{}{} {}*{}".format(
             self.note,
-            self.sharp or "",
+            "#" if self.sharp else "",
             self.octave,
             self.beat_length,
-            self.duration,
-            ", ".join(self.sub_notes)
+            self.duration
         )
 
 
 class MusicParser:
-    ## Config
-    INVALID_CHARS = ["|", ","]
-    CHAR_REGEX = r"([a-z])"
-    INT_REGEX = r"(\d)"
-    SHARP_REGEX = r"(#)"
-    CATCHALL_REGEX = r"(.?)"
-    FRACTIONAL_REGEX = r"(\/)"
-
-    ## Start State Machine Classes
-
-    ## Base state that all other states inherit from
-    class BaseState:    # Todo: make virtual
-        def __init__(self, exit_dict={}, error_handler=None):
-            self.exit_dict = exit_dict
-            self.error_handler = error_handler
-
-
-        ## Try to get the first character of a string
-        def emit_char(self, string):
-            try:
-                return string[0]
-            except:
-                return ""
-
-
-        ## Try to get the first character of a string, and return the string that it was emitted from
-        def emit_consume_char(self, string):
-            try:
-                return string[0], string[1:]
-            except:
-                return "", ""
-
-
-        ## Unimplemented state enter handler
-        def enter(self):
-            raise NotImplementedError("State.enter() isn't implemented")
-
-
-        ## State exit handler
-        def exit(self, char, string, **kwargs):
-            for regex_string, handler in self.exit_dict.items():
-                match = re.match(regex_string, char)
-                ## logger.debug("MATCHING {}, {}, {}".format(regex_string, char, handler.__self__.__class__.__name__))
-                if(match):
-                    return handler(string, **kwargs)
-
-            if(self.error_handler):
-                self.error_handler(char, string)
-            return None
-
-
-    ## Initial state
-    class StartState(BaseState):
-        def enter(self, string, **kwargs):
-            char = self.emit_char(string)
-            ## logger.debug("Enter {} '{}', {}".format(self.__class__.__name__, string, kwargs))
-
-            return self.exit(char, string, **kwargs)
-
-
-    ## Duration parsing state
-    class DurationState(BaseState):
-        def enter(self, string, **kwargs):
-            char, consumed_str = self.emit_consume_char(string)
-            ## logger.debug("Enter {} '{}' '{}', {}".format(self.__class__.__name__, consumed_str, char, kwargs))
-
-            return self.exit(self.emit_char(consumed_str), consumed_str, duration=int(char), **kwargs)
-
-
-    ## Note parsing state
-    class NoteState(BaseState):
-        def enter(self, string, **kwargs):
-            char, consumed_str = self.emit_consume_char(string)
-            ## logger.debug("Enter {} '{}' '{}', {}".format(self.__class__.__name__, consumed_str, char, kwargs))
-
-            return self.exit(self.emit_char(consumed_str), consumed_str, note=char, **kwargs)
-
-
-    ## Sharp parsing state
-    class SharpState(BaseState):
-        def enter(self, string, **kwargs):
-            char, consumed_str = self.emit_consume_char(string)
-            ## logger.debug("Enter {} '{}' '{}', {}".format(self.__class__.__name__, consumed_str, char, kwargs))
-
-            return self.exit(self.emit_char(consumed_str), consumed_str, sharp=char, **kwargs)
-
-
-    ## Octave parsing state
-    class OctaveState(BaseState):
-        def enter(self, string, **kwargs):
-            char, consumed_str = self.emit_consume_char(string)
-            ## logger.debug("Enter {} '{}' '{}', {}".format(self.__class__.__name__, consumed_str, char, kwargs))
-
-            return self.exit(self.emit_char(consumed_str), consumed_str, octave=int(char), **kwargs)
-
-
-    ## NoteObj creation state
-    class NoteObjState(BaseState):
-        def enter(self, string, **kwargs):
-            char, consumed_str = self.emit_consume_char(string)
-            ## logger.debug("Enter {} '{}' '{}', {}".format(self.__class__.__name__, consumed_str, char, kwargs))
-
-            beat_length = kwargs.get("beat_length", 0.25)
-            duration = kwargs.get("duration", 1)
-            note = kwargs.get("note")
-            assert note is not None
-            sharp = kwargs.get("sharp", False)
-            octave = kwargs.get("octave", kwargs.get("default_octave", 2))
-
-            note_obj = Note(beat_length, duration, note, sharp, octave, [])
-
-            ## Clean up kwargs for next pass
-            kwargs.pop("note_obj", None)
-            kwargs.pop("duration", None)
-            kwargs.pop("note", None)
-            kwargs.pop("sharp", None)
-            kwargs.pop("octave", None)
-
-            ## Next state
-            return self.exit(char, string, note_obj=note_obj, **kwargs)
-
-
-    ## SubNote creation state
-    class SubNoteState(BaseState):
-        def enter(self, string, **kwargs):
-            char, consumed_str = self.emit_consume_char(string)
-            ## logger.debug("Enter {} '{}' '{}', {}".format(self.__class__.__name__, consumed_str, char, kwargs))
-
-            note_obj = kwargs.get("note_obj")
-            assert note_obj is not None
-            sub_notes = kwargs.get("sub_notes", [])
-            sub_notes.append(note_obj)
-
-            ## Clean up kwargs for next pass
-            kwargs.pop("note_obj", None)
-            kwargs.pop("sub_notes", None)
-
-            return self.exit(self.emit_char(consumed_str), consumed_str, sub_notes=sub_notes, **kwargs)
-
-
-    ## Final output state
-    class FinalState(BaseState):
-        def enter(self, string, **kwargs):
-            ## logger.debug("Enter {} '{}', {}".format(self.__class__.__name__, string, kwargs))
-
-            note_obj = kwargs.get("note_obj")
-            sub_notes = kwargs.get("sub_notes", [])
-            beat_length = kwargs.get("beat_length", 0.25) / (len(sub_notes) + 1)
-
-            if(note_obj):
-                for note in sub_notes:
-                    note.beat_length = beat_length
-                note_obj.beat_length = beat_length
-
-                note_obj.sub_notes = sub_notes
-                
-            return note_obj
+    '''
+    Parses a string of notes (see Music.music) into a flat list of Notes, in the order that they should be played.
 
+    Each whitespace separated token is one or more notes chained together with '/', and each note is made up of
+    (Duration?)(Note)(Sharp?)(Octave?). The whole note grammar is a single compiled regex, so every token is parsed in
+    one pass, left to right. Chained notes split the token's beat between them.
+    '''
 
-    ## Error handling state
-    class ErrorState(BaseState):
-        def enter(self, char, string):
-            logger.debug("Error in music state machine", char, string)
-            return None
+    ## Config
+    INVALID_CHARS = ["|", ","]
+    NOTE_REGEX = re.compile(r"(\d)?([a-z])(#)?(\d)?")
+    CHAIN_CHAR = "/"
 
-    ## End State Machine Classes
 
     def __init__(self, notes, beat_length=0.25, octave=4):
         self.beat_length = beat_length
         self.octave = octave
         self.notes_preparsed = self._notes_preparser(notes)
 
-        self.parse_note = self._init_state_machine()
-
         self.notes = []
-        for note in self.notes_preparsed:
-            parsed = self.parse_note(note.lower(), beat_length=self.beat_length, default_octave=self.octave)
+        for token in self.notes_preparsed:
+            parsed = self._parse_token(token.lower())
             if(parsed):
-                self.notes.append(parsed)
+                self.notes.extend(parsed)
 
     ## Methods
 
-    ## Initialize the note parsing state machine, returning a callable entry point (start.enter())
-    def _init_state_machine(self):
-        ## Init error handler state
-        error_state_dict = {}
-        error_handler = self.ErrorState(error_state_dict, None).enter
-
-        ## Init states
-        start_state = self.StartState({}, error_handler)
-        duration_state = self.DurationState({}, error_handler)
-        note_state = self.NoteState({}, error_handler)
-        sharp_state = self.SharpState({}, error_handler)
-        octave_state = self.OctaveState({}, error_handler)
-        note_obj_state = self.NoteObjState({}, error_handler)
-        sub_note_state = self.SubNoteState({}, error_handler)
-        final_state = self.FinalState({}, error_handler)
-
-        ## Populate state exit_dicts
-        start_state.exit_dict = OrderedDict([(self.INT_REGEX, duration_state.enter),
-                                             (self.CHAR_REGEX, note_state.enter),
-                                             (self.CATCHALL_REGEX, final_state.enter)])
-        duration_state.exit_dict = OrderedDict([(self.CHAR_REGEX, note_state.enter)])
-        note_state.exit_dict = OrderedDict([(self.SHARP_REGEX, sharp_state.enter),
-                                            (self.INT_REGEX, octave_state.enter),
-                                            (self.CATCHALL_REGEX, note_obj_state.enter)])
-        sharp_state.exit_dict = OrderedDict([(self.INT_REGEX, octave_state.enter),
-                                             (self.CATCHALL_REGEX, note_obj_state.enter)])
-        octave_state.exit_dict = OrderedDict([(self.CATCHALL_REGEX, note_obj_state.enter)])
-        note_obj_state.exit_dict = OrderedDict([(self.FRACTIONAL_REGEX, sub_note_state.enter),
-                                                (self.CATCHALL_REGEX, final_state.enter)])
-        sub_note_state.exit_dict = OrderedDict([(self.CATCHALL_REGEX, start_state.enter)])
-
-        ## Return an entry point into the fsm
-        return start_state.enter
+    ## Parses a single token (ex. '2c#/d#/a3/f') into a list of Notes, or None if the token isn't valid
+    def _parse_token(self, token):
+        note_regex = self.NOTE_REGEX
+        token_length = len(token)
+        parsed = []
+        position = 0
+
+        while(True):
+            match = note_regex.match(token, position)
+            if(not match):
+                ## Either the token doesn't start with a note, or it ends with a dangling '/'
+                logger.debug("Unable to parse note token: '{}' at position {}".format(token, position))
+                return None
+
+            duration, note, sharp, octave = match.groups()
+            parsed.append(Note(
+                self.beat_length,
+                int(duration) if duration else 1,
+                note,
+                bool(sharp),
+                int(octave) if octave else self.octave
+            ))
+
+            ## Anything trailing the last note in a token is ignored
+            position = match.end()
+            if(position < token_length and token[position] == self.CHAIN_CHAR):
+                position += 1
+            else:
+                break
+
+        ## Chained notes share the token's beat
+        if(len(parsed) > 1):
+            beat_length = self.beat_length / len(parsed)
+            for note in parsed:
+                note.beat_length = beat_length
+
+        return parsed
 
 
     def _notes_preparser(self, notes):
@@ -262,17 +110,19 @@ class MusicParser:
             notes = notes.replace(char, "")
 
         ## Convert to a list of notes sans whitespace
-        notes_list = " ".join(notes.split()).split()
+        notes_list = notes.split()
 
         return notes_list
 
 
 class Music(commands.Cog):
     '''
-    Note that there's something wrong with the note parsing logic. It still works, but it takes waaay too long now. I'll
-    look into it later.
+    Turns notes (see MusicParser) into something that Hawking can sing, or play as tones.
     '''
 
+    ## Module
+    MODULE_DEPENDENCIES = ["Speech", "AudioPlayer"]
+
     ## Keys
     BPM_KEY = "bpm"
     OCTAVE_KEY = "octave"
@@ -297,6 +147,14 @@ class Music(commands.Cog):
     REST_REPLACEMENT = "[_<{},{}>]"
     TONE_REPLACEMENT = "[:t <{},{}>]"
     SHARP = "#"
+    VOICE_SEPARATOR = "&"
+    REST_PITCH = 10 # Arbitrary low pitch
+    TTS_CONFIG_REGEX = re.compile(r"(\[:.+?\])")
+    MUSIC_CONFIG_REGEX = re.compile(r"\\([a-z_]+)\s?=\s?(\d+)")
+
+    ## Note types, see _compile_notes()
+    NOTE_TYPE = 0
+    REST_TYPE = 1
 
 
     def __init__(self, hawking, bot, **kwargs):
@@ -313,12 +171,25 @@ class Music(commands.Cog):
         for octave in range(self.OCTAVES):
             self.pitches.append(self._build_pitch_dict(octave))
 
+        ## The same pitches, as an [octave, note index] table for vectorized lookups
+        self.pitch_table = numpy.array([[pitches[note] for note in self.NOTES] for pitches in self.pitches])
+        self.note_types = {note: index for index, note in enumerate(self.NOTES)}
+        self.note_types[self.REST] = self.HALF_STEPS
+
+        self.random = numpy.random.default_rng()
+        self.tone_synthesizer = ToneSynthesizer()
+
     ## Properties
 
     @property
     def audio_player_cog(self):
         return self.hawking.get_audio_player_cog()
 
+
+    @property
+    def speech_cog(self):
+        return self.hawking.get_speech_cog()
+
     ## Methods
 
     ## Calculates the frequency of a note at a given number of half steps from the reference frequency
@@ -347,86 +218,114 @@ class Music(commands.Cog):
 
     ## Pulls any TTS config options (ex. [:dv hs 10]) from the message string
     def _extract_tts_configs(self, string):
-        tts_config_regex = r"(\[:.+?\])"
-        tts_configs = []
-
-        tts_config = re.search(tts_config_regex, string)
-        while(tts_config):
-            tts_configs.append(tts_config.group(1))
-            string = string[:tts_config.start()] + string[tts_config.end():]
-            tts_config = re.search(tts_config_regex, string)
+        tts_configs = self.TTS_CONFIG_REGEX.findall(string)
+        if (tts_configs):
+            string = self.TTS_CONFIG_REGEX.sub("", string)
 
         return tts_configs, string
 
 
     ## Pulls any music config options (ex. \bpm=N) from the message string
     def _extract_music_configs(self, string):
-        music_config_regex = r"\\([a-z_]+)\s?=\s?(\d+)"
-        music_configs = {}
+        ## Later configs override earlier ones
+        music_configs = {key: int(value) for key, value in self.MUSIC_CONFIG_REGEX.findall(string)}
+        if (music_configs):
+            string = self.MUSIC_CONFIG_REGEX.sub("", string)
 
-        music_config = re.search(music_config_regex, string)
-        while(music_config):
-            key = music_config.group(1)
-            value = int(music_config.group(2))
-            music_configs[key] = value
+        return music_configs, string
 
-            string = string[:music_config.start()] + string[music_config.end():]
-            music_config = re.search(music_config_regex, string)
 
-        return music_configs, string
+    ## Compiles a list of Note objects into flat arrays of note types (NOTE_TYPE or REST_TYPE), pitches (in Hz) and
+    ## durations (in milliseconds). Notes that can't be played are dropped.
+    def _compile_notes(self, notes, **configs):
+        use_bad = configs.get(self.BAD_KEY, self.bad)
+        bad_percent = configs.get(self.BAD_PERCENT_KEY, self.bad_percent)
+
+        ## Look up every note's index into NOTES (or HALF_STEPS for rests) in one pass
+        note_types = self.note_types
+        count = len(notes)
+        note_indexes = numpy.fromiter(
+            (note_types.get(note.note + self.SHARP if note.sharp else note.note, -1) for note in notes),
+            dtype=numpy.int64,
+            count=count
+        )
+        octaves = numpy.fromiter((note.octave for note in notes), dtype=numpy.int64, count=count)
+        durations = numpy.fromiter((note.duration for note in notes), dtype=numpy.float64, count=count)
+        beat_lengths = numpy.fromiter((note.beat_length for note in notes), dtype=numpy.float64, count=count)
+
+        ## Drop any unknown notes, and any notes outside of the available octaves
+        is_rest = note_indexes == self.HALF_STEPS
+        valid = (note_indexes >= 0) & (is_rest | ((octaves >= -self.OCTAVES) & (octaves < self.OCTAVES)))
+        note_indexes = note_indexes[valid]
+        octaves = octaves[valid]
+        durations = durations[valid]
+        beat_lengths = beat_lengths[valid]
+        is_rest = is_rest[valid]
+
+        pitches = numpy.full(len(note_indexes), self.REST_PITCH, dtype=numpy.float64)
+        is_note = ~is_rest
+        pitches[is_note] = self.pitch_table[octaves[is_note], note_indexes[is_note]]
+
+        ## Randomize the notes' pitches and durations if use_bad is True
+        if (use_bad):
+            bad_ratio = bad_percent / 100
+            pitches += pitches * bad_ratio * self.random.uniform(-1, 1, len(pitches))
+            durations += durations * bad_ratio * self.random.uniform(-1, 1, len(durations))
+
+        types = numpy.where(is_rest, self.REST_TYPE, self.NOTE_TYPE)
+        milliseconds = beat_lengths * durations * 1000
+
+        return types, pitches.astype(numpy.int64), milliseconds.astype(numpy.int64)
 
 
     ## Turns a list of Note objects into a string of TTS friendly phonemes
     def _build_tts_note_string(self, notes, **configs):
         use_tones = configs.get(self.TONE_KEY, self.tone)
-        use_bad = configs.get(self.BAD_KEY, self.bad)
-        bad_percent = configs.get(self.BAD_PERCENT_KEY, self.bad_percent)
 
-        string = ""
-        note_index = 0
-        for note in notes:
-            ## Push any sub_notes into their appropriate position in the notes list
-            sub_note_index = 0
-            for sub_note in note.sub_notes:
-                notes.insert(note_index + 1 + sub_note_index, sub_note)
-                sub_note_index += 1
-
-            ## Create a textual representation of the note
-            note_str = note.note
-            if(note.sharp):
-                note_str += self.SHARP
-
-            ## Select a format string for the type of note
-            if(note_str in self.NOTES):
-                replacement_str = self.NOTE_REPLACEMENT
-                try:
-                    pitch = self.pitches[note.octave][note_str]
-                except IndexError:
-                    continue
-            elif(note_str == self.REST):
-                replacement_str = self.REST_REPLACEMENT
-                pitch = 10  # Arbitrary low pitch
-            else:
-                continue
+        types, pitches, milliseconds = self._compile_notes(notes, **configs)
 
-            ## Assign a duration of time to hold the note for
-            duration = note.duration
+        ## Create the TTS friendly string for the notes, and use the tone format string if necessary
+        if (use_tones):
+            return "".join(map(self.TONE_REPLACEMENT.format, pitches.tolist(), milliseconds.tolist()))
 
-            ## Randomize the note's pitch and duration if use_bad is True
-            if(use_bad):
-                pitch_offset_max = pitch * (bad_percent / 100)
-                pitch += random.uniform(-pitch_offset_max, pitch_offset_max)
-                duration_offset_max = duration * (bad_percent / 100)
-                duration += random.uniform(-duration_offset_max, duration_offset_max)
+        replacements = (self.NOTE_REPLACEMENT, self.REST_REPLACEMENT)
+        return "".join(
+            replacements[note_type].format(duration, pitch)
+            for note_type, duration, pitch in zip(types.tolist(), milliseconds.tolist(), pitches.tolist())
+        )
 
-            ## Create the TTS friendly string for the note, and use the tone format string if necessary
-            if(use_tones):
-                string += self.TONE_REPLACEMENT.format(int(pitch), int(note.beat_length * duration * 1000))
-            else:
-                string += replacement_str.format(int(note.beat_length * duration * 1000), int(pitch))
-            note_index += 1
+    ## Synthesizes the given voices (lists of Note objects) as tones, and returns the path to the resulting .wav file
+    def _build_tone_file(self, voices, configs):
+        compiled_voices = []
+        for notes in voices:
+            types, pitches, milliseconds = self._compile_notes(notes, **configs)
+            compiled_voices.append((pitches, milliseconds, types == self.REST_TYPE))
+
+        samples = self.tone_synthesizer.render(compiled_voices)
+
+        return self.tone_synthesizer.save(samples, self.speech_cog.tts_controller.output_dir_path)
 
-        return string
+
+    ## Plays the given message as tones, skipping the TTS engine entirely. Voices separated by VOICE_SEPARATOR are
+    ## played at the same time.
+    async def _play_tones(self, ctx, message, beat_length, octave, configs, ignore_char_limit=False):
+        tts_controller = self.speech_cog.tts_controller
+        if (not tts_controller.check_length(message) and not ignore_char_limit):
+            await ctx.send("Wow, <@{}>, that's waaay too much! You've gotta keep messages shorter than {} characters.".format(
+                ctx.message.author.id,
+                tts_controller.char_limit
+            ))
+            return
+
+        voices = [MusicParser(voice, beat_length, octave).notes for voice in message.split(self.VOICE_SEPARATOR)]
+        voices = [notes for notes in voices if notes]
+        if (not voices):
+            return
+
+        ## Rendering is all CPU bound, so keep it off of the event loop
+        file_path = await self.bot.loop.run_in_executor(None, lambda: self._build_tone_file(voices, configs))
+
+        await self.audio_player_cog.play_audio(ctx, file_path)
 
     ## Commands
 
@@ -456,6 +355,8 @@ class Music(commands.Cog):
                 really any other division of notes. (Twelfth, Twentieth, etc)
             You can also use the | character to help with formatting your bars
                 (ex. 'c d e f | r g a b')
+            When using tones, you can play multiple voices at once by separating them with the &
+                character. (ex. 'c d e & e f g' plays two voices in harmony)
 
         Inline Configuration:
             BPM:
@@ -497,12 +398,17 @@ class Music(commands.Cog):
 
         ## Todo: preserve the position of tts_configs in the message
         tts_configs, message = self._extract_tts_configs(notes)
-        music_configs, message = self._extract_music_configs(notes)
+        music_configs, message = self._extract_music_configs(message)
 
         bpm = music_configs.get(self.BPM_KEY, self.bpm)
         beat_length = 60 / bpm  # for a quarter note
         octave = music_configs.get(self.OCTAVE_KEY, self.octave)
 
+        ## Tones are synthesized directly, without going through the TTS engine
+        if (music_configs.get(self.TONE_KEY, self.tone)):
+            await self._play_tones(ctx, message, beat_length, octave, music_configs, ignore_char_limit)
+            return
+
         notes = MusicParser(message, beat_length, octave).notes
         tts_notes = self._build_tts_note_string(notes, **music_configs)
 
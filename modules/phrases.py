@@ -1,12 +1,14 @@
-import json
 import os
 import random
-import re
 import logging
 import asyncio
 
 import utilities
-import dynamo_helper
+import analytics
+from file_watcher import FileWatcher
+from phonetics import Phonetics
+from phrase_catalog import PhraseCatalog
+from search_index import SearchIndex
 from string_similarity import StringSimilarity
 
 from discord import errors
@@ -21,14 +23,31 @@ logger = utilities.initialize_logging(logging.getLogger(__name__))
 
 
 class Phrase:
+    ## Phrases are stored in a table rather than as individual commands (see Phrases.resolve_phrase_command), and there
+    ## can be a lot of them, so keep them compact.
+    __slots__ = ("name", "message", "is_music", "help", "brief", "description")
+
     def __init__(self, name, message, is_music=False, **kwargs):
         self.name = name
         self.message = message
         self.is_music = is_music
-        self.kwargs = kwargs
+        self.help = kwargs.get("help")
+        self.brief = kwargs.get("brief")
+        self.description = kwargs.get("description")
 
     def __str__(self):
-        return "{} music={} {}".format(self.name, self.is_music, self.kwargs)
+        return "{} music={} help={} brief={} description={}".format(
+            self.name, self.is_music, self.help, self.brief, self.description
+        )
+
+    def __eq__(self, other):
+        if (not isinstance(other, Phrase)):
+            return NotImplemented
+
+        return all(getattr(self, attribute) == getattr(other, attribute) for attribute in self.__slots__)
+
+    def __hash__(self):
+        return hash((self.name, self.message, self.is_music))
 
 
 class PhraseGroup:
@@ -46,11 +65,17 @@ class PhraseGroup:
 
 
 class Phrases(commands.Cog):
+    ## Module
+    MODULE_DEPENDENCIES = ["Speech"]
+
     ## Keys
-    PHRASES_KEY = "phrases"
     PHRASES_FILE_EXTENSION_KEY = "phrases_file_extension"
     PHRASES_FOLDER_KEY = "phrases_folder"
     PHRASES_FOLDER_PATH_KEY = "phrases_folder_path"
+    WATCH_PHRASES_FOLDER_KEY = "watch_phrases_folder"
+    FIND_COMMAND_MINIMUM_SIMILARITY_KEY = "find_command_minimum_similarity"
+    FIND_COMMAND_CANDIDATE_COUNT_KEY = "find_command_candidate_count"
+    PHRASE_DISPATCHER_NAME_KEY = "phrase"
     NAME_KEY = "name"
     MESSAGE_KEY = "message"
     IS_MUSIC_KEY = "music"
@@ -62,18 +87,20 @@ class Phrases(commands.Cog):
     PHRASES_FILE_EXTENSION = CONFIG_OPTIONS.get(PHRASES_FILE_EXTENSION_KEY, ".json")
     PHRASES_FOLDER = CONFIG_OPTIONS.get(PHRASES_FOLDER_KEY, "phrases")
     PHRASES_FOLDER_PATH = CONFIG_OPTIONS.get(PHRASES_FOLDER_PATH_KEY, os.sep.join([utilities.get_root_path(), PHRASES_FOLDER]))
+    WATCH_PHRASES_FOLDER = CONFIG_OPTIONS.get(WATCH_PHRASES_FOLDER_KEY, False)
 
 
-    def __init__(self, hawking, bot, *args, **command_kwargs):
+    def __init__(self, hawking, bot, *args, preloaded=None, **command_kwargs):
         self.hawking = hawking
         self.bot = bot
         self.phrases_file_extension = self.PHRASES_FILE_EXTENSION
         self.phrases_folder_path = self.PHRASES_FOLDER_PATH
+        self.watch_phrases_folder = self.WATCH_PHRASES_FOLDER
         self.command_kwargs = command_kwargs
-        self.command_names = []
-        self.find_command_minimum_similarity = float(CONFIG_OPTIONS.get('find_command_minimum_similarity', 0.5))
-
-        self.dynamo_db = dynamo_helper.DynamoHelper()
+        self.phrase_names = []
+        self.max_phrase_name_length = 0
+        self.load_config()
+        CONFIG_OPTIONS.subscribe([self.FIND_COMMAND_MINIMUM_SIMILARITY_KEY, self.FIND_COMMAND_CANDIDATE_COUNT_KEY], self.load_config)
 
         ## Make sure context is always passed to the callbacks
         self.command_kwargs["pass_context"] = True
@@ -81,11 +108,52 @@ class Phrases(commands.Cog):
         ## The mapping of phrases into groups 
         self.phrase_groups = {}
 
-        ## Compile a regex for filtering non-letter characters
-        self.non_letter_regex = re.compile('\W+')
+        ## The mapping of phrase names to phrases (the phrase table), and the search index over their names and
+        ## descriptions. Phrases aren't registered with the bot as commands, instead the bot asks the phrase table to
+        ## resolve any commands it doesn't know about, and invokes the single phrase dispatcher command for them.
+        self.phrases = {}
+        self.phrase_dispatcher = self._create_phrase_dispatcher()
+        self.search_index = SearchIndex(phonetic=True)
+
+        ## The parsed contents of each phrase file, keyed by path. See _build_catalog()
+        self.phrase_files = {}
+
+        ## The compiled phrase files, so that only phrase files that have changed need to be parsed. It's usually already
+        ## been brought up to date off of the main thread, see preload()
+        self.phrase_catalog = preloaded
+        if (self.phrase_catalog is None):
+            self.phrase_catalog = PhraseCatalog()
+            self.phrase_catalog.load()
+
+        ## Callables that get told which phrases were (added, removed, changed) after every (re)load
+        self.phrase_change_listeners = []
+
+        ## Reloads are serialized, so that concurrent builds never share the PhraseCatalog, and a slow build can't
+        ## apply a stale set of phrases over a newer one
+        self.reload_lock = asyncio.Lock()
+        self.is_unloaded = False
 
         ## Load and add the phrases
         self.init_phrases()
+        self.bot.add_command_resolver(self.resolve_phrase_command)
+
+        ## Automatically reload the phrases when their files change
+        self.phrases_file_watcher = None
+        if (self.watch_phrases_folder):
+            self.phrases_file_watcher = FileWatcher(self.bot.loop, self.phrases_folder_path, self.reload_phrases)
+            self.phrases_file_watcher.start()
+
+    ## Class Methods
+
+    ## Module preload hook (see ModuleEntry). Compiles any phrase files that have changed into the PhraseCatalog, which
+    ## is only file I/O, so that building the cog itself just needs to read the compiled records.
+    @classmethod
+    def preload(cls):
+        phrase_catalog = PhraseCatalog()
+        phrase_catalog.load()
+        phrase_catalog.update(cls.PHRASES_FOLDER_PATH, cls.PHRASES_FILE_EXTENSION)
+
+        return phrase_catalog
 
     ## Properties
 
@@ -99,183 +167,230 @@ class Phrases(commands.Cog):
 
     ## Methods
 
+    ## Reads the cog's tunable values out of the config, and again whenever they change
+    def load_config(self, changed_keys=None):
+        self.find_command_minimum_similarity = CONFIG_OPTIONS.get_float(self.FIND_COMMAND_MINIMUM_SIMILARITY_KEY, 0.5)
+        self.find_command_candidate_count = CONFIG_OPTIONS.get_int(self.FIND_COMMAND_CANDIDATE_COUNT_KEY, 25)
+
+
     ## Removes all existing phrases when the cog is unloaded
     def cog_unload(self):
+        self.is_unloaded = True
+        if (self.phrases_file_watcher):
+            self.phrases_file_watcher.stop()
+
+        CONFIG_OPTIONS.unsubscribe(self.load_config)
+
+        self.bot.remove_command_resolver(self.resolve_phrase_command)
         self.remove_phrases()
+        self.phrase_catalog.close()
 
 
     ## Searches the phrases folder for .json files that can potentially contain phrases.
     def scan_phrases(self, path_to_scan):
-        def is_phrase_file(file_path):
-            to_check = file_path[-len(self.phrases_file_extension):]
-            return (to_check == self.phrases_file_extension)
+        return PhraseCatalog.scan(path_to_scan, self.phrases_file_extension)
 
-        phrase_files = []
-        for file in os.listdir(path_to_scan):
-            if(is_phrase_file(file)):
-                phrase_files.append(os.sep.join([path_to_scan, file]))
 
-        return phrase_files
-
-
-    ## Builds a PhraseGroup object from a phrase file
-    def _build_phrase_group(self, path):
-        with open(path) as fd:
-            group_raw = json.load(fd)
-            name = group_raw.get('name', path.split(os.path.sep)[-1].split('.')[0])
-            key = group_raw.get('key', name)
-            description = group_raw.get('description', None)
+    ## Builds a PhraseGroup object (and its Phrases) from a compiled phrase file record. See PhraseCatalog.
+    def _build_phrase_group(self, record):
+        phrase_group = PhraseGroup(
+            record[PhraseCatalog.NAME_KEY],
+            record[PhraseCatalog.KEY_KEY],
+            record[PhraseCatalog.DESCRIPTION_KEY]
+        )
 
-            return PhraseGroup(name, key, description)
+        for phrase_record in record[PhraseCatalog.PHRASES_KEY]:
+            kwargs = {key: phrase_record[key] for key in (self.HELP_KEY, self.BRIEF_KEY) if key in phrase_record}
+            kwargs[self.DESCRIPTION_KEY] = phrase_record[PhraseCatalog.DESCRIPTION_KEY]
 
+            phrase_group.add_phrase(Phrase(
+                phrase_record[PhraseCatalog.NAME_KEY],
+                phrase_record[PhraseCatalog.MESSAGE_KEY],
+                phrase_record[PhraseCatalog.IS_MUSIC_KEY],
+                **kwargs
+            ))
 
-    ## (Attempt to) process a given string down into a searchable string
-    def process_string_into_searchable(self, string):
-        return self.non_letter_regex.sub(' ', string).lower()
+        return phrase_group
 
 
     ## Initialize the phrases available to the bot
     def init_phrases(self):
+        return self._apply_catalog(self._build_catalog())
+
+
+    ## Reloads the phrases from the phrase files. Only files that have changed are reparsed (off of the event loop),
+    ## and only the commands for phrases that were added, removed or changed are touched. Returns the number of
+    ## phrases loaded, or -1 if the cog was unloaded mid reload.
+    async def reload_phrases(self):
+        async with self.reload_lock:
+            if (self.is_unloaded):
+                return -1
+
+            catalog = await self.bot.loop.run_in_executor(None, self._build_catalog)
+            if (self.is_unloaded):
+                return -1
+
+            return self._apply_catalog(catalog)
+
+
+    ## Registers a callable that'll be invoked with the lists of (added, removed, changed) phrase names after each load
+    def add_phrase_change_listener(self, listener):
+        self.phrase_change_listeners.append(listener)
+
+
+    def remove_phrase_change_listener(self, listener):
+        if (listener in self.phrase_change_listeners):
+            self.phrase_change_listeners.remove(listener)
+
+
+    ## Builds a new {path: (hash, PhraseGroup)} catalog of the phrase files off to the side, without touching any of the
+    ## currently loaded phrases. Files whose contents haven't changed reuse their previously built PhraseGroup, and
+    ## files that haven't changed since they were last compiled are pulled straight from the PhraseCatalog.
+    def _build_catalog(self):
+        catalog = {}
         phrase_file_paths = self.scan_phrases(self.phrases_folder_path)
-        counter = 0
         for phrase_file_path in phrase_file_paths:
-            starting_count = counter
-            phrase_group = self._build_phrase_group(phrase_file_path)
-
-            for phrase in self.load_phrases(phrase_file_path):
-                try:
-                    self.add_phrase(phrase)
-                    phrase_group.add_phrase(phrase)
-                except Exception as e:
-                    logger.warning("Skipping...", e)
-                else:
-                    counter += 1
+            existing = self.phrase_files.get(phrase_file_path)
+            try:
+                file_hash, record = self.phrase_catalog.get_or_compile(phrase_file_path)
+                if (existing and existing[0] == file_hash):
+                    catalog[phrase_file_path] = existing
+                    continue
 
-            ## Ensure we don't add in empty phrase files into the groupings
-            if(counter > starting_count):
-                self.phrase_groups[phrase_group.key] = phrase_group
+                catalog[phrase_file_path] = (file_hash, self._build_phrase_group(record))
+            except Exception:
+                ## Keep serving the last good version of the file (if any) rather than dropping its phrases
+                logger.exception("Unable to load phrase file: {}".format(phrase_file_path))
+                if (existing):
+                    catalog[phrase_file_path] = existing
 
-                ## Set up a dummy command for the category, to help with the help interface. See help_formatter.py
-                ## asyncio.sleep is just a dummy command since commands.Command needs some kind of async callback
-                help_command = commands.Command(self._create_noop_callback(), name=phrase_group.key, hidden=True, no_pm=True)
-                self.bot.add_command(help_command)
-                self.command_names.append(phrase_group.key) # Keep track of the 'parent' commands for later use
+        self.phrase_catalog.prune(phrase_file_paths)
+        self.phrase_catalog.save()
 
-        logger.info("Loaded {} phrase{}.".format(counter, "s" if counter != 1 else ""))
-        return counter
+        return catalog
 
 
-    ## Unloads all phrase commands, then reloads them from the phrases.json file
-    def reload_phrases(self):
-        self.remove_phrases()
-        return self.init_phrases()
-
-
-    ## Load phrases from json into a list of phrase objects
-    def load_phrases(self, path):
-        ## Insert source[key] (if it exists) into target[key], else insert a default string
-        def insert_if_exists(target, source, key, default=None):
-            if(key in source):
-                target[key] = source[key]
-            return target
-
-        phrases = []
-        with open(path) as fd:
-            for phrase_raw in json.load(fd)[self.PHRASES_KEY]:
-                try:
-                    message = phrase_raw[self.MESSAGE_KEY]
-
-                    ## Todo: make this less ugly
-                    kwargs = {}
-                    help_value = phrase_raw.get(self.HELP_KEY)  # fallback for the help submenus
-                    kwargs = insert_if_exists(kwargs, phrase_raw, self.HELP_KEY)
-                    kwargs = insert_if_exists(kwargs, phrase_raw, self.BRIEF_KEY, help_value)
-
-                    ## Attempt to populate the description kwarg, but if it isn't available, then try and parse the
-                    ## message down into something usable instead.
-                    if (self.DESCRIPTION_KEY in phrase_raw):
-                        kwargs[self.DESCRIPTION_KEY] = phrase_raw[self.DESCRIPTION_KEY]
-                    else:
-                        kwargs[self.DESCRIPTION_KEY] = self.process_string_into_searchable(message)
-
-                    phrase_name = phrase_raw[self.NAME_KEY]
-                    phrase = Phrase(
-                        phrase_name,
-                        message,
-                        phrase_raw.get(self.IS_MUSIC_KEY, False),
-                        **kwargs
-                    )
-                    phrases.append(phrase)
-                    self.command_names.append(phrase_name)
-                except Exception as e:
-                    logger.warning("Error loading {} from {}. Skipping...".format(phrase_raw, fd), e)
-
-        ## Todo: This doesn't actually result in the phrases in the help menu being sorted?
-        return sorted(phrases, key=lambda phrase: phrase.name)
-
-
-    ## Unloads the preset phrases from the bot's command list
+    ## Swaps the given catalog in as the currently loaded set of phrases, and works out which phrases actually changed.
+    ## Returns the number of phrases loaded.
+    def _apply_catalog(self, catalog):
+        ## Build the new groups and phrases, skipping any that would collide with existing commands
+        phrase_groups = {}
+        phrases = {}
+        for _, parsed_group in sorted(catalog.values(), key=lambda entry: entry[1].key):
+            phrase_group = PhraseGroup(parsed_group.name, parsed_group.key, parsed_group.description)
+
+            for name, phrase in parsed_group.phrases.items():
+                if (name in phrases or name in self.bot.all_commands):
+                    logger.warning("Phrase name: {} is already in use. Skipping...".format(name))
+                    continue
+
+                phrase_group.add_phrase(phrase)
+                phrases[name] = phrase
+
+            ## Ensure we don't add in empty phrase files into the groupings
+            if (phrase_group.phrases):
+                phrase_groups[phrase_group.key] = phrase_group
+
+        ## Work out exactly which phrases have changed
+        added = [name for name in phrases if name not in self.phrases]
+        removed = [name for name in self.phrases if name not in phrases]
+        changed = [name for name, phrase in phrases.items() if name in self.phrases and self.phrases[name] != phrase]
+
+        ## Swap in the new phrase table. Nothing awaits in here, so nobody will see a partially updated set of phrases
+        self.phrase_files = catalog
+        self.phrase_groups = phrase_groups
+        self.phrases = phrases
+        self.phrase_names = list(phrases.keys())
+        self.max_phrase_name_length = max(map(len, self.phrase_names), default=0)
+
+        ## The help pages list the phrases and their groups, so they need to be rendered again
+        self.bot.help_page_cache.invalidate()
+
+        if (added or removed or changed):
+            self._notify_phrase_changes(added, removed, changed)
+
+        count = len(phrases)
+        logger.info("Loaded {} phrase{} ({} added, {} removed, {} changed).".format(
+            count, "s" if count != 1 else "", len(added), len(removed), len(changed)
+        ))
+        return count
+
+
+    ## Tells the search indexes, and anything else that's listening, exactly which phrases have changed
+    def _notify_phrase_changes(self, added, removed, changed):
+        command_index = self.bot.command_index
+
+        for name in removed:
+            self.search_index.remove(name)
+            command_index.remove(name)
+        for name in added + changed:
+            description = self.phrases[name].description
+            if (description):
+                self.search_index.add(name, description, name)
+            else:
+                self.search_index.remove(name)
+            command_index.add_name(name)
+
+        for listener in self.phrase_change_listeners:
+            try:
+                listener(added, removed, changed)
+            except Exception:
+                logger.exception("Exception in phrase change listener: {}".format(listener))
+
+
+    ## Unloads the preset phrases from the phrase table
     def remove_phrases(self):
-        for name in self.command_names:
-            self.bot.remove_command(name)
-        self.command_names = []
-        self.phrase_groups = {} # yay garbage collection
+        self._apply_catalog({})
 
         return True
 
 
-    ## Add a phrase command to the bot's command list
-    def add_phrase(self, phrase):
-        if(not isinstance(phrase, Phrase)):
-            raise TypeError("{} not instance of Phrase.".format(phrase))
+    ## Command resolver for the bot (see HawkingBot.add_command_resolver). Any invoked name that's in the phrase table
+    ## resolves to the phrase dispatcher command.
+    def resolve_phrase_command(self, name):
+        if (name in self.phrases):
+            return self.phrase_dispatcher
+
+        return None
+
+
+    ## Builds the single command that every phrase is dispatched through
+    def _create_phrase_dispatcher(self):
+        async def _phrase_dispatcher(self, ctx):
+            phrase = self.phrases.get(ctx.invoked_with)
+            if (phrase is None):
+                ## The phrase was removed between resolving the command and invoking it
+                raise commands.CommandNotFound('Command "{}" is not found'.format(ctx.invoked_with))
+
+            await self.say_phrase(ctx, phrase)
 
-        ## Manually build command to be added
         command = commands.Command(
-            self._create_phrase_callback(phrase.message, phrase.is_music),
-            name = phrase.name,
-            **phrase.kwargs,
+            _phrase_dispatcher,
+            name = self.PHRASE_DISPATCHER_NAME_KEY,
+            hidden = True,
             **self.command_kwargs
         )
         ## Ensure that this command is linked to the Phrases cog
         command.cog = self
 
-        self.bot.add_command(command)
+        return command
 
 
-    def _create_noop_callback(self):
-        '''
-        Build an async noop callback. This is used as a dummy callback for the help commands that make up the command
-        categories
-        '''
+    ## Returns a list of up to count (name, uses) tuples for the most popular phrases recently, most popular first. Only
+    ## available when analytics are running in the aggregate mode, see Analytics.get_hot_commands.
+    def get_hot_phrases(self, count=10):
+        return analytics.get_analytics().get_hot_commands(count, lambda name: name in self.phrases)
 
-        async def _noop_callback(ctx):
-            await asyncio.sleep(0)
 
-        return _noop_callback
+    ## Says the given phrase aloud in the invoker's channel (or the first mentioned member's channel)
+    async def say_phrase(self, ctx, phrase):
+        ## Attempt to get a target channel
+        try:
+            target = ctx.message.mentions[0]
+        except:
+            target = None
 
-
-    ## Build a dynamic callback to invoke the bot's say method
-    def _create_phrase_callback(self, message, is_music=False):
-        ## Create a callback for speech._say
-        async def _phrase_callback(self, ctx):
-            ## Attempt to get a target channel
-            try:
-                target = ctx.message.mentions[0]
-            except:
-                target = None
-
-            await self.speech_cog._say(ctx, message, target_member = target, ignore_char_limit = True)
-
-        ## Create a callback for music.music
-        # async def _music_callback(self, ctx):
-        #     music_cog = self.music_cog
-        #     await music_cog.music(ctx, message, ignore_char_limit=True)
-
-        ## Return the appropriate callback
-        # if(is_music):
-        #     return _music_callback
-        # else:
-        return _phrase_callback
+        await self.speech_cog._say(ctx, phrase.message, target_member = target, ignore_char_limit = True)
 
 
     ## Says a random phrase from the added phrases
@@ -283,20 +398,21 @@ class Phrases(commands.Cog):
     async def random(self, ctx):
         """Says a random clip from the list of clips."""
 
-        random_clip = random.choice(self.command_names)
-        command = self.bot.get_command(random_clip)
-        await command.callback(self, ctx)
+        random_clip = random.choice(self.phrase_names)
+        await self.say_phrase(ctx, self.phrases[random_clip])
 
 
-    ## Scores a given string (message) based on how many of it's words exist in another string (description)
-    def _calcSubstringScore(self, message, description):
+    ## Scores a given string (message) based on how many of it's words exist in another string (description). Words that
+    ## sound like one of the description's words (see description_phonetic_keys) count too.
+    def _calcSubstringScore(self, message, description, description_phonetic_keys=frozenset()):
         ## Todo: shrink instances of repeated letters down to a single letter in both message and description
         ##       (ex. yeeeee => ye or reeeeeboot => rebot)
 
         message_split = message.split(' ')
+        description_words = set(description.split(' '))
         word_frequency = 0
         for word in message_split:
-            if (word in description.split(' ')):
+            if (word in description_words or Phonetics.encode(word) in description_phonetic_keys):
                 word_frequency += 1
 
         return word_frequency / len(message_split)
@@ -316,29 +432,37 @@ class Phrases(commands.Cog):
         ## Strip all non alphanumeric and non whitespace characters out of the message
         message = ''.join(char for char in search_text.lower() if (char.isalnum() or char.isspace()))
 
-        most_similar_command = (None, 0)
-        for phrase_group in self.phrase_groups.values():
-            for phrase in phrase_group.phrases.values():
-                ## Todo: Maybe look into filtering obviously bad descriptions from the calculation somehow?
-                ##       A distance metric might be nice, but then if I could solve that problem, why not just use that
-                ##       distance in the first place and skip the substring check?
-
-                description = phrase.kwargs.get(self.DESCRIPTION_KEY)
-                if (not description):
-                    continue
+        ## Only rerank the handful of phrases that share words (or sounds, or at least n-grams) with the search text,
+        ## rather than scoring every loaded phrase
+        phrases = [
+            self.phrases[name] for name in self.search_index.candidates(message, self.find_command_candidate_count)
+            if name in self.phrases
+        ]
+        descriptions = [phrase.description for phrase in phrases]
 
-                ## Build a weighted distance using a traditional similarity metric and the previously calculated word
-                ## frequency as well as the similarity of the actual string that invokes the phrase
-                distance =  (self._calcSubstringScore(message, description) * 0.5) + \
-                            (StringSimilarity.similarity(description, message) * 0.3) + \
-                            (StringSimilarity.similarity(message, phrase.name) * 0.2)
+        ## Score every phrase in one batch per field, so the search text only gets preprocessed once
+        description_similarities = StringSimilarity.similarity_many(message, descriptions)
+        name_similarities = StringSimilarity.similarity_many(message, [phrase.name for phrase in phrases])
 
-                if (distance > most_similar_command[1]):
-                    most_similar_command = (phrase, distance)
+        most_similar_command = (None, 0)
+        for phrase, description, description_similarity, name_similarity in \
+                zip(phrases, descriptions, description_similarities, name_similarities):
+            ## Build a weighted distance using a traditional similarity metric and the previously calculated word
+            ## frequency as well as the similarity of the actual string that invokes the phrase
+            substring_score = self._calcSubstringScore(
+                message,
+                description,
+                self.search_index.get_phonetic_keys(phrase.name)
+            )
+            distance =  (substring_score * 0.5) + \
+                        (description_similarity * 0.3) + \
+                        (name_similarity * 0.2)
+
+            if (distance > most_similar_command[1]):
+                most_similar_command = (phrase, distance)
 
         if (most_similar_command[1] > self.find_command_minimum_similarity):
-            command = self.bot.get_command(most_similar_command[0].name)
-            await command.callback(self, ctx)
+            await self.say_phrase(ctx, most_similar_command[0])
         else:
             await ctx.send("I couldn't find anything close to that, sorry <@{}>.".format(ctx.message.author.id))
 
@@ -354,7 +478,7 @@ class Phrases(commands.Cog):
             await ctx.send(output_raw.format(
                 ctx.message.author.id,
                 CONFIG_OPTIONS.get("activation_str"),
-                random.choice(self.command_names)
+                random.choice(self.phrase_names)
             ))
 
 
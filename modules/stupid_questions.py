@@ -1,7 +1,10 @@
 import os
+import json
+import asyncio
 import logging
 import random
 import time
+from collections import deque
 
 import utilities
 
@@ -17,6 +20,10 @@ logger = utilities.initialize_logging(logging.getLogger(__name__))
 
 
 class StupidQuestions(commands.Cog):
+    ## Module
+    ## Not optional, as the question buffer needs to be filled before the first question is asked
+    MODULE_DEPENDENCIES = ["Speech"]
+
     REDDIT_USER_AGENT = "discord:hawking:{} (by /u/hawking-py)".format(CONFIG_OPTIONS.get("version", "0.0.1"))
     THOUGHT_PROVOKING_STRINGS = [
         "🤔?",
@@ -37,27 +44,143 @@ class StupidQuestions(commands.Cog):
 
         self.questions = []
         self.is_mid_question_refresh = False
-        self.last_question_refresh_time = time.time()
+        self.last_question_refresh_time = 0
+        self.last_question_attempt_time = 0
 
         ## Load config data
         self.submission_top_time = CONFIG_OPTIONS.get("stupid_question_top_time", "month")
         self.submission_count = CONFIG_OPTIONS.get("stupid_question_submission_count", 500)
         self.refresh_time_seconds = CONFIG_OPTIONS.get("stupid_question_refresh_time_seconds", 21600)
+        self.retry_time_seconds = CONFIG_OPTIONS.get_float("stupid_question_retry_time_seconds", 300)
+        self.max_question_count = CONFIG_OPTIONS.get_int("stupid_question_max_question_count", 1000)
+        self.buffer_size = CONFIG_OPTIONS.get_int("stupid_question_buffer_size", 3)
+        self.buffer_render_delay_seconds = CONFIG_OPTIONS.get_float("stupid_question_buffer_render_delay_seconds", 2)
+        self.snapshot_file_path = os.path.sep.join([
+            utilities.get_root_path(),
+            CONFIG_OPTIONS.get("stupid_question_snapshot_file", "stupid_questions.snapshot")
+        ])
         ## Load module specific configs from 'stupid_questions.json' located in modules folder
         modules_folder_name = CONFIG_OPTIONS.get("modules_folder", "modules")
         config = utilities.load_json(os.path.sep.join([utilities.get_root_path(), modules_folder_name, "stupid_questions.json"]))
         reddit_client_id = config.get("reddit_client_id")
         reddit_secret = config.get("reddit_secret")
+        ## Optional overrides for Reddit's endpoints, so the module can be pointed at a local stand-in of the API
+        reddit_urls = {key: config[key] for key in ("reddit_url", "oauth_url", "short_url") if config.get(key)}
+
+        ## Callable that returns a list of question titles, defaults to pulling them from Reddit (see fetch_questions())
+        self.question_fetcher = kwargs.get("question_fetcher", self.fetch_questions)
 
         subreddits = CONFIG_OPTIONS.get("stupid_question_subreddits", ["NoStupidQuestions"])
+        self.reddit = None
+        self.subreddit = None
         try:
-            self.reddit = Reddit(client_id=reddit_client_id, client_secret=reddit_secret, user_agent=self.REDDIT_USER_AGENT)
+            self.reddit = Reddit(
+                client_id=reddit_client_id,
+                client_secret=reddit_secret,
+                user_agent=self.REDDIT_USER_AGENT,
+                **reddit_urls
+            )
             ## Use a multireddit to pull random post from any of the chosen subreddits
             self.subreddit = self.reddit.subreddit("+".join(subreddits))
         except Exception:
             logger.exception("Unable to create reddit/subreddit instance")
 
-        self.bot.loop.create_task(self.load_questions())
+        ## Serve questions from the last snapshot right away, and only hit Reddit if it's out of date
+        self.load_snapshot()
+        if (self.should_load_questions()):
+            self.bot.loop.create_task(self.load_questions())
+
+        ## Deque of (question, file path) tuples that have already been rendered, so they can be played immediately.
+        ## Keep the previous buffer when being reloaded, as its audio is still perfectly good.
+        reload_state = kwargs.get("reload_state")
+        self.question_buffer = reload_state["question_buffer"] if reload_state else deque()
+        self.buffer_needs_refill = asyncio.Event()
+        self.buffer_needs_refill.set()
+        self.buffer_refill_task = None
+        if (self.buffer_size > 0):
+            self.buffer_refill_task = self.bot.loop.create_task(self.buffer_refill_loop())
+
+
+    def cog_unload(self):
+        if (self.buffer_refill_task is not None):
+            self.buffer_refill_task.cancel()
+
+
+    def get_reload_state(self):
+        '''Returns the state to hand over to this cog's replacement when it's reloaded (see ModuleManager)'''
+
+        return {"question_buffer": self.question_buffer}
+
+
+    def load_snapshot(self) -> bool:
+        '''Loads the question pool that was saved by the last refresh, if there is one'''
+
+        try:
+            snapshot = utilities.load_json(self.snapshot_file_path)
+            questions = [str(question) for question in snapshot["questions"]]
+            refresh_time = float(snapshot.get("refresh_time", 0))
+        except FileNotFoundError:
+            return False
+        except Exception:
+            logger.exception("Unable to load the question snapshot from {}".format(self.snapshot_file_path))
+            return False
+
+        self.questions = questions
+        self.last_question_refresh_time = refresh_time
+        logger.info("{} questions loaded from snapshot (refreshed at {})".format(len(questions), time.ctime(refresh_time)))
+        return True
+
+
+    def save_snapshot(self) -> bool:
+        '''Writes the question pool out to disk (atomically), so the next startup can serve it immediately'''
+
+        snapshot = {"refresh_time": self.last_question_refresh_time, "questions": self.questions}
+        temp_path = "{}.tmp".format(self.snapshot_file_path)
+        try:
+            with open(temp_path, 'w') as fd:
+                json.dump(snapshot, fd)
+            os.replace(temp_path, self.snapshot_file_path)
+        except OSError:
+            logger.exception("Unable to save the question snapshot to {}".format(self.snapshot_file_path))
+            return False
+
+        return True
+
+
+    def fetch_questions(self) -> list:
+        '''Pulls the top submission titles from Reddit. This blocks on the network, so it's run in an executor.'''
+
+        if (self.subreddit is None):
+            raise RuntimeError("The subreddit instance couldn't be created, check the Reddit credentials")
+
+        submission_generator = self.subreddit.top(self.submission_top_time, limit=self.submission_count)
+        return [submission.title for submission in submission_generator]
+
+
+    def merge_questions(self, questions, fetched_questions) -> list:
+        '''
+        Merges freshly fetched questions into the existing pool. New questions go first, followed by the older ones that
+        weren't fetched again, so if the pool grows past max_question_count it's the oldest questions that get dropped.
+        '''
+
+        merged = list(dict.fromkeys(fetched_questions))
+        fetched = set(merged)
+        merged.extend(question for question in questions if question not in fetched)
+
+        return merged[:self.max_question_count]
+
+
+    def should_load_questions(self) -> bool:
+        '''
+        Returns True if the question pool is out of date, and Reddit hasn't been asked for questions recently. Failed
+        attempts are only retried every retry_time_seconds, so an unreachable Reddit isn't hammered with requests.
+        '''
+
+        now = time.time()
+        return (
+            now > self.last_question_refresh_time + self.refresh_time_seconds and
+            now > self.last_question_attempt_time + self.retry_time_seconds
+        )
 
 
     async def load_questions(self) -> None:
@@ -66,31 +189,37 @@ class StupidQuestions(commands.Cog):
             logger.debug("Skipping load_questions as they're already being refreshed.")
             return
         self.is_mid_question_refresh = True
+        self.last_question_attempt_time = time.time()
 
         logger.info("Loading questions from reddit: top({}), {} submissions".format(
             self.submission_top_time,
             self.submission_count
         ))
 
-        questions = []
         try:
-            submission_generator = self.subreddit.top(self.submission_top_time, limit=self.submission_count)
+            fetched_questions = await self.bot.loop.run_in_executor(None, self.question_fetcher)
         except Exception:
-            logger.exception("Unable to load submission from Reddit.")
+            logger.exception("Unable to load submissions from Reddit.")
             return
-
-        for submission in submission_generator:
-            questions.append(submission.title)
+        finally:
+            self.is_mid_question_refresh = False
 
         self.last_question_refresh_time = time.time()
-        self.questions = questions
-        self.is_mid_question_refresh = False
+        self.questions = self.merge_questions(self.questions, fetched_questions)
+        await self.bot.loop.run_in_executor(None, self.save_snapshot)
 
-        logger.info("{} questions loaded at {}".format(len(self.questions), time.asctime()))
+        ## The buffer stops refilling while there aren't any questions, so start it back up
+        self.buffer_needs_refill.set()
+
+        logger.info("{} questions fetched, {} questions available at {}".format(
+            len(fetched_questions),
+            len(self.questions),
+            time.asctime()
+        ))
 
 
     def get_question(self) -> str:
-        if (time.time() > self.last_question_refresh_time + self.refresh_time_seconds):
+        if (self.should_load_questions()):
             self.bot.loop.create_task(self.load_questions())
 
         if (len(self.questions) > 0):
@@ -98,8 +227,70 @@ class StupidQuestions(commands.Cog):
         return None
 
 
+    async def render_question(self, question) -> str:
+        '''Renders the question into an audio file ahead of time, and returns its path'''
+
+        speech_cog = self.hawking.get_speech_cog()
+        message = speech_cog.message_parser.parse_emoji(question)
+
+        return await speech_cog.build_audio_file(None, message, True)
+
+
+    async def buffer_refill_loop(self) -> None:
+        '''
+        Keeps the question buffer topped up with rendered questions. Questions are rendered one at a time, with a pause
+        in between, so that filling the buffer doesn't compete with the audio that people are actually asking for.
+        '''
+
+        while (True):
+            await self.buffer_needs_refill.wait()
+            self.buffer_needs_refill.clear()
+
+            while (len(self.question_buffer) < self.buffer_size):
+                await asyncio.sleep(self.buffer_render_delay_seconds)
+
+                ## Stop refilling until some questions come in (see load_questions())
+                question = self.get_question()
+                if (question is None):
+                    break
+
+                try:
+                    file_path = await self.render_question(question)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.exception("Unable to render question for the buffer: '{}'".format(question))
+                    continue
+
+                if (file_path):
+                    self.question_buffer.append((question, file_path))
+
+
+    def pop_buffered_question(self) -> tuple:
+        '''Returns a (question, file path) tuple from the buffer, or (None, None) if it's empty'''
+
+        while (self.question_buffer):
+            question, file_path = self.question_buffer.popleft()
+            self.buffer_needs_refill.set()
+
+            ## The output directory could've been cleaned out from under the buffer
+            if (os.path.isfile(file_path)):
+                return (question, file_path)
+
+        return (None, None)
+
+
     @commands.command(name="stupidquestion", brief="Ask a stupid question, via Reddit.")
     async def stupid_question(self, ctx):
+        question, file_path = self.pop_buffered_question()
+
+        if (question):
+            ## Put the question back if it couldn't be played (ex. the requester isn't in a voice channel)
+            if (not await self.hawking.get_audio_player_cog().play_audio(ctx, file_path)):
+                self.question_buffer.appendleft((question, file_path))
+            await ctx.send("Hey <@{}>, {} ```{}```".format(ctx.message.author.id, random.choice(self.THOUGHT_PROVOKING_STRINGS), question))
+            return
+
         question = self.get_question()
 
         if (question):